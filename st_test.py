@@ -1,12 +1,9 @@
 import streamlit as st
 from td_dp_lib import DataLib
-import plotly.express as px
-import plotly.graph_objects as go
+from td_async import AsyncDataLib
 import pandas as pd
 import os
 from dotenv import load_dotenv
-import spotipy
-from spotipy.oauth2 import SpotifyClientCredentials
 import logging
 
 # Load environment variables
@@ -16,11 +13,31 @@ app_passcode = os.getenv('APP_PASSCODE')
 spotify_client_id = os.getenv('SPOTIFY_CLIENT_ID')
 spotify_client_secret = os.getenv('SPOTIFY_CLIENT_SECRET')
 
-# Initialize Spotify API
-spotify = spotipy.Spotify(auth_manager=SpotifyClientCredentials(client_id=spotify_client_id, client_secret=spotify_client_secret))
+# Process-wide singletons, created on first use and shared by every session and rerun
 
-# Initialize the data library
-db = DataLib(uri)
+# Spotify metadata is cached on disk and fetched concurrently; spotipy is only imported once metadata is needed
+@st.cache_resource
+def get_metadata_resolver():
+    import spotipy
+    from spotipy.oauth2 import SpotifyClientCredentials
+    from td_spotify import SpotifyMetadataResolver
+
+    spotify = spotipy.Spotify(auth_manager=SpotifyClientCredentials(client_id=spotify_client_id, client_secret=spotify_client_secret))
+    return SpotifyMetadataResolver(spotify)
+
+# One data library per process: its MongoDB connection pool, query cache and metrics survive reruns
+@st.cache_resource
+def get_data_lib(connection_string):
+    db = DataLib(connection_string, cache=True, metrics=True)
+    # Optionally serve the dashboard from an in-memory snapshot of the collections, loaded once per process
+    if os.getenv('DATALIB_MEMORY_REPLICA') == '1':
+        return db.memory_replica(cache=True, metrics=db.metrics)
+    return db
+
+# Independent queries of a render run concurrently through the async front end
+@st.cache_resource
+def get_async_data_lib(connection_string):
+    return AsyncDataLib(get_data_lib(connection_string))
 
 # Streamlit App
 st.title('A&R Dashboard')
@@ -31,6 +48,16 @@ if passcode != app_passcode:
     st.error('Incorrect passcode')
     st.stop()
 
+# Connect only once the passcode is accepted
+db = get_data_lib(uri)
+adb = get_async_data_lib(uri)
+
+# Only the cached queries touched by ingests since the last rerun are dropped, so new data
+# shows up without reloading everything
+new_documents = db.sync_cache()
+if new_documents:
+    st.toast(f'{new_documents} new or updated documents since the last refresh')
+
 # # Button to upload JSON files (for dev use)
 # if st.button('Upload JSON files'):
 #     try:
@@ -48,11 +75,20 @@ if passcode != app_passcode:
 #         st.error(f"Error deleting all songs: {e}")
 
 # Sidebar
-# Add company logo
-st.sidebar.image('company_logo.svg', width=50)  # Adjust width to make the logo smaller
+# Add company logo (an 8 KB PNG, rendered at 4x the displayed width)
+st.sidebar.image('company_logo.png', width=50)
 
 st.sidebar.title("Dakota")
 
+# Type-ahead search over titles, artists, albums and descriptions, served from an in-memory index
+st.sidebar.header("Search")
+search_query = st.sidebar.text_input('Search songs', placeholder='Title, artist, album...')
+search_pick = None
+if search_query:
+    for index, result in db.search_songs(search_query, limit=8).iterrows():
+        if st.sidebar.button(f"{result['title']} — {result['author']}", key=f"search_{index}"):
+            search_pick = (result['title'], result['author'])
+
 # Unique Artists List
 st.sidebar.header("Artists")
 
@@ -64,45 +100,27 @@ artist_selected = st.sidebar.selectbox('Select an artist', unique_artists)
 # Placeholder for artist-specific songs
 st.sidebar.header(f"Songs by {artist_selected}")
 
-# Get unique songs for the selected artist
-songs_by_artist = db.get_songs_by_author(artist_selected)
-song_titles = [song.title for song in songs_by_artist]
+# Checkbox states are read from the session up front, so both sidebar queries can run at once
+selected_distributors = [
+    distributor for distributor in db.distributor_matcher.distributors
+    if st.session_state.get(f"distributor_{distributor}")
+]
+
+# Songs per distributor (tagged at ingest) and the artist's songs (titles and descriptions only),
+# filtered by distributor in MongoDB
+sidebar_data = adb.run_concurrently(
+    distributor_counts=adb.get_distributor_counts(artist_selected),
+    songs=adb.get_songs_by_author(artist_selected, summary=True, distributors=selected_distributors)
+)
 
 # Distributor Filters
 st.sidebar.header("Distributor Filters")
 
-distributors = ["DistroKid", "TuneCore", "CD Baby", "Ditto Music", "Amuse", "LANDR", "UnitedMasters", "Stem", "iMusician", "RouteNote", "Catapult Distribution", "SongCast", "Soundrop"]
-
-# Count occurrences of each distributor in song descriptions
-distributor_counts = {distributor: 0 for distributor in distributors}
-for song in songs_by_artist:
-    description = song.description.lower() if song.description else ''
-    for distributor in distributors:
-        if distributor.lower() in description:
-            distributor_counts[distributor] += 1
-
-# Dictionary to hold checkbox states
-distributor_filters = {}
-for distributor in distributors:
-    label = f"{distributor} ({distributor_counts[distributor]})"
-    distributor_filters[distributor] = st.sidebar.checkbox(label)
-
-# Filter songs based on distributor keywords
-def filter_songs_by_distributor(songs, filters):
-    selected_distributors = [distributor.lower() for distributor, checked in filters.items() if checked]
-    if not selected_distributors:
-        return songs
-    
-    filtered_songs = []
-    for song in songs:
-        description = song.description.lower() if song.description else ''
-        if any(distributor in description for distributor in selected_distributors):
-            filtered_songs.append(song)
-    
-    return filtered_songs
+for distributor, count in sidebar_data['distributor_counts'].items():
+    label = f"{distributor} ({count})"
+    st.sidebar.checkbox(label, key=f"distributor_{distributor}")
 
-filtered_songs_by_artist = filter_songs_by_distributor(songs_by_artist, distributor_filters)
-filtered_song_titles = [song.title for song in filtered_songs_by_artist]
+filtered_song_titles = [song.title for song in sidebar_data['songs']]
 
 # Display song titles as buttons
 selected_song = None
@@ -110,16 +128,29 @@ for song_title in filtered_song_titles:
     if st.sidebar.button(song_title):
         selected_song = song_title
 
+# A search result overrides the artist picked in the sidebar
+if search_pick:
+    selected_song, artist_selected = search_pick
+
 # Main Page
 if selected_song:
+    import plotly.express as px
+    import plotly.graph_objects as go
+
     st.header(f"Graphs for {selected_song}")
     
-    # Get the selected song data
-    song_data = next((song for song in songs_by_artist if song.title == selected_song), None)
+    # Get the selected song data and its daily history from the time-series collection, concurrently
+    song_details = adb.run_concurrently(
+        song=adb.get_song(selected_song, artist_selected),
+        history=adb.get_song_history(selected_song, artist_selected)
+    )
+    song_data = song_details['song']
+    history = song_details['history']
     
     if song_data:
+
         # Find the latest occurrence
-        latest_occurrence = max(song_data.all_occurrences, key=lambda x: x['timestamp'])
+        latest_occurrence = song_data.latest_occurrence
 
         # Graph of the past seven days
         try:
@@ -132,9 +163,8 @@ if selected_song:
         
         # Graph of all available popularity data
         try:
-            popularity_data = [occurrence['popularity'] for occurrence in song_data.all_occurrences if 'popularity' in occurrence]
-            popularity_dates = [occurrence['timestamp'] for occurrence in song_data.all_occurrences if 'popularity' in occurrence]
-            fig2 = px.line(x=popularity_dates, y=popularity_data, labels={'x': 'Date', 'y': 'Popularity'}, title='Popularity Over Time')
+            popularity_history = history.dropna(subset=['popularity'])
+            fig2 = px.line(x=popularity_history['date'], y=popularity_history['popularity'], labels={'x': 'Date', 'y': 'Popularity'}, title='Popularity Over Time')
             st.plotly_chart(fig2)
         except Exception as e:
             st.error(f"Error displaying popularity data graph: {e}")
@@ -149,21 +179,11 @@ if selected_song:
         except Exception as e:
             st.error(f"Error displaying AI predicted data: {e}")
 
-        # Find the latest stream count data
-        latest_stream_data = max(song_data.all_occurrences, key=lambda x: x['timestamp'])
+        # Stream counts over the whole history, already sorted by date
         try:
-            total_stream_counts = []
-            daily_stream_counts = []
-            stream_count_dates = []
-
-            for date, counts in latest_stream_data['streamCountData'].items():
-                if counts['total'] is not None:
-                    total_stream_counts.append(counts['total'])
-                    daily_stream_counts.append(counts['daily'] if counts['daily'] is not None else 0)
-                    stream_count_dates.append(date)
-            
-            # Sorting dates to make sure we append predicted dates correctly
-            stream_count_dates = pd.to_datetime(stream_count_dates).sort_values().strftime('%Y-%m-%d').tolist()
+            stream_history = history.dropna(subset=['total'])
+            total_stream_counts = stream_history['total'].tolist()
+            stream_count_dates = stream_history['date'].dt.strftime('%Y-%m-%d').tolist()
             predicted_dates = [pd.to_datetime(stream_count_dates[-1]) + pd.Timedelta(days=i) for i in range(1, 8)]
             predicted_values = [predicted_streaming_numbers.get(f'day_{i}', 0) for i in range(1, 8)]
             
@@ -212,17 +232,15 @@ if selected_song:
         
         # Fetch song details from Spotify
         try:
-            search_results = spotify.search(q=f"track:{selected_song} artist:{artist_selected}", type='track')
-            if search_results['tracks']['items']:
-                track = search_results['tracks']['items'][0]
-                album_cover_url = track['album']['images'][0]['url']
-                artist_image_url = None
-                if 'images' in track['artists'][0] and track['artists'][0]['images']:
-                    artist_image_url = track['artists'][0]['images'][0]['url']
+            track = get_metadata_resolver().resolve(selected_song, artist_selected)
+            if track:
+                album_cover_url = track['album_cover_url']
+                artist_image_url = track['artist_image_url']
                 preview_url = track['preview_url']
                 if preview_url:
                     st.audio(preview_url, format='audio/mp3')
-                st.image(album_cover_url, caption='Album Cover', use_column_width=True)
+                if album_cover_url:
+                    st.image(album_cover_url, caption='Album Cover', use_column_width=True)
                 if artist_image_url:
                     st.image(artist_image_url, caption='Artist Picture', use_column_width=True)
         except Exception as e:
@@ -265,6 +283,14 @@ if selected_song:
             st.plotly_chart(radar_fig)
         except Exception as e:
             st.error(f"Error displaying radar chart for song features: {e}")
+
+        # Songs by other artists with the closest audio features, for scouting
+        st.subheader("Songs Like This")
+        similar_songs = db.get_similar_songs(selected_song, artist_selected, k=10, exclude_author=True)
+        if similar_songs.empty:
+            st.write("No audio features available for this song.")
+        else:
+            st.dataframe(similar_songs, hide_index=True)
         
         # Display additional song information
         st.subheader("Song Details")
@@ -302,21 +328,26 @@ else:
     # Show the latest top songs
     st.header("Latest Top Songs")
 
-    # Retrieve the latest top songs by the latest timestamp
-    song_data_df = db.get_song_data()
-    latest_timestamp = song_data_df['timestamp'].max()
-    latest_top_songs = song_data_df[song_data_df['timestamp'] == latest_timestamp]
+    # Retrieve the latest top songs, fetching only the fields displayed below
+    latest_top_songs = db.get_latest_snapshot(
+        fields=['title', 'author', 'popularity', 'streamCountData', 'expected_rank_next_day', 'description'],
+        distributors=selected_distributors
+    )
+
+    # Stream totals, deltas and trend colors for the whole chart in one vectorized pass
+    stream_stats = db.analyze_streams(latest_top_songs)
+    latest_top_songs = latest_top_songs.join(stream_stats[['latest_total', 'stream_days', 'stream_diff', 'trend']])
 
-    # Apply distributor filters to latest top songs
-    filtered_latest_top_songs = filter_songs_by_distributor(latest_top_songs.itertuples(index=False), distributor_filters)
+    filtered_latest_top_songs = list(latest_top_songs.itertuples(index=False))
+
+    # Fetch song details from Spotify for all rows at once
+    track_metadata = get_metadata_resolver().resolve_many((row.title, row.author) for row in filtered_latest_top_songs)
 
     for row in filtered_latest_top_songs:
         try:
-            # Fetch song details from Spotify
-            search_results = spotify.search(q=f"track:{row.title} artist:{row.author}", type='track')
-            if search_results['tracks']['items']:
-                track = search_results['tracks']['items'][0]
-                album_cover_url = track['album']['images'][0]['url']
+            track = track_metadata.get((row.title, row.author))
+            if track:
+                album_cover_url = track['album_cover_url']
                 preview_url = track['preview_url']
 
                 col1, col2 = st.columns([1, 3])
@@ -334,37 +365,14 @@ else:
                     st.write(f"**Popularity:** {row.popularity}")
 
                     # Display stream count
-                    stream_count_data = row.streamCountData
-                    if isinstance(stream_count_data, dict):
-                        latest_date = max(stream_count_data.keys(), default=None)
-                        if latest_date:
-                            latest_count = stream_count_data[latest_date].get('total', 'N/A')
-
-                            # Fetch stream counts for the last three days
-                            stream_counts_last_three_days = []
-                            stream_dates_last_three_days = sorted(stream_count_data.keys(), reverse=True)[:3]
-
-                            for date in stream_dates_last_three_days:
-                                count = stream_count_data.get(date, {}).get('total', 0)
-                                stream_counts_last_three_days.append(count)
-
-                            # Calculate the change in stream counts
-                            if len(stream_counts_last_three_days) >= 3:
-                                stream_diff = stream_counts_last_three_days[0] - stream_counts_last_three_days[1]
-                                stream_second_diff = (stream_counts_last_three_days[0] - stream_counts_last_three_days[1]) - \
-                                                     (stream_counts_last_three_days[1] - stream_counts_last_three_days[2])
-                                color = 'white'
-                                if stream_second_diff > 10:
-                                    color = 'green'
-                                elif stream_second_diff < 0:
-                                    color = 'red'
-                                st.markdown(f"**Stream Count:** {latest_count} (<span style='color:{color}'>+{stream_diff}</span>)", unsafe_allow_html=True)
-                            else:
-                                st.write(f"**Stream Count:** {latest_count} (N/A)")
-                        else:
-                            st.write("**Stream Count:** N/A (No date available)")
-                    else:
+                    if row.stream_days == 0:
                         st.write("**Stream Count:** N/A (No stream count data)")
+                    elif pd.isna(row.latest_total):
+                        st.write("**Stream Count:** N/A")
+                    elif row.stream_days >= 3:
+                        st.markdown(f"**Stream Count:** {row.latest_total:.0f} (<span style='color:{row.trend}'>+{row.stream_diff:.0f}</span>)", unsafe_allow_html=True)
+                    else:
+                        st.write(f"**Stream Count:** {row.latest_total:.0f} (N/A)")
 
                     # Display expected rank next day
                     if hasattr(row, 'expected_rank_next_day'):
@@ -374,3 +382,30 @@ else:
         except Exception as e:
             logging.error(f"Error displaying song {row.title}: {str(e)}")
             st.error(f"Error displaying song {row.title}: {str(e)}")
+
+# Debug panel with the DataLib method and MongoDB command latencies of this process;
+# reply sizes are only measured while it is open
+show_query_metrics = st.sidebar.checkbox('Show query metrics', key='show_query_metrics')
+db.measure_command_bytes(show_query_metrics)
+if show_query_metrics:
+    st.header('Query Metrics')
+    st.subheader('DataLib methods')
+    st.dataframe(pd.DataFrame(db.metrics.summary('datalib_method_seconds')))
+    st.subheader('MongoDB commands')
+    command_stats = pd.DataFrame(db.metrics.summary('mongodb_command_seconds'))
+    if not command_stats.empty:
+        documents = pd.DataFrame(db.metrics.summary('mongodb_command_documents'))
+        command_bytes = pd.DataFrame(db.metrics.summary('mongodb_command_bytes'))
+        command_stats = command_stats.merge(
+            documents[['command', 'collection', 'sum']].rename(columns={'sum': 'documents'}), on=['command', 'collection'], how='left'
+        )
+        if not command_bytes.empty:
+            command_stats = command_stats.merge(
+                command_bytes[['command', 'collection', 'sum']].rename(columns={'sum': 'bytes'}), on=['command', 'collection'], how='left'
+            )
+    st.dataframe(command_stats)
+    st.write('Cache:', db.cache_stats())
+    with st.expander('Prometheus export'):
+        st.code(db.metrics_stats('prometheus'), language='text')
+    if st.button('Reset metrics'):
+        db.metrics.reset()
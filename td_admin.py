@@ -0,0 +1,59 @@
+import argparse
+import os
+
+from dotenv import load_dotenv
+
+from td_dp_lib import DataLib
+
+
+def main(argv=None):
+    """
+    Run a maintenance command against the database in MONGODB_URI.
+
+    :param argv: list of str, the command line arguments (defaults to sys.argv)
+    """
+    parser = argparse.ArgumentParser(description='Maintenance commands for the music_trends database.')
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('ensure-indexes', help='create the indexes declared in INDEX_SPEC')
+    commands.add_parser('explain', help='report which DataLib queries are not index-covered')
+    rebuild_timeseries = commands.add_parser('rebuild-timeseries', help='rebuild the per-song time-series collection')
+    rebuild_timeseries.add_argument('--batch-size', type=int, default=1000)
+    backfill_distributors = commands.add_parser('backfill-distributors', help='tag existing documents with their distributors')
+    backfill_distributors.add_argument('--batch-size', type=int, default=1000)
+    rebuild_movements = commands.add_parser('rebuild-movements', help='rebuild the day-over-day rank movements collection')
+    rebuild_movements.add_argument('--batch-size', type=int, default=1000)
+    migrate_schema = commands.add_parser('migrate-schema', help='migrate the daily documents to the compact schema (resumable)')
+    migrate_schema.add_argument('--batch-size', type=int, default=1000)
+    backfill_forecasts = commands.add_parser('backfill-forecasts', help='recompute the next-day predictions of every day')
+    backfill_forecasts.add_argument('--batch-size', type=int, default=1000)
+    export_columnar = commands.add_parser('export-columnar', help='export the collection as daily Arrow/Parquet partitions')
+    export_columnar.add_argument('directory')
+    export_columnar.add_argument('--format', choices=['arrow', 'parquet'])
+    export_columnar.add_argument('--full', action='store_true', help='rewrite every day instead of only new ones')
+    args = parser.parse_args(argv)
+
+    load_dotenv()
+    db = DataLib(os.getenv('MONGODB_URI'))
+
+    if args.command == 'ensure-indexes':
+        db.ensure_indexes()
+    elif args.command == 'explain':
+        for method, plan in db.explain_report().items():
+            status = 'covered' if plan['covered'] else 'NOT COVERED'
+            print(f"{method}: {status} (stages: {', '.join(plan['stages'])}; indexes: {', '.join(plan['indexes']) or '-'})")
+    elif args.command == 'rebuild-timeseries':
+        print(db.rebuild_timeseries(args.batch_size))
+    elif args.command == 'backfill-distributors':
+        print(db.backfill_distributors(args.batch_size))
+    elif args.command == 'rebuild-movements':
+        print(db.rebuild_rank_movements(args.batch_size))
+    elif args.command == 'migrate-schema':
+        print(db.migrate_schema(args.batch_size))
+    elif args.command == 'backfill-forecasts':
+        print(db.backfill_forecasts(args.batch_size))
+    elif args.command == 'export-columnar':
+        db.export_columnar(args.directory, args.full, args.format)
+
+
+if __name__ == '__main__':
+    main()
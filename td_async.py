@@ -0,0 +1,65 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from td_dp_lib import DataLib
+
+
+class AsyncDataLib:
+    def __init__(self, data_lib=None, connection_string=None, max_workers=8, **kwargs):
+        """
+        Initialize an asyncio front end exposing every public DataLib method as a coroutine.
+
+        Calls run on a bounded thread pool sharing the wrapped DataLib's connection pool,
+        so independent queries overlap instead of waiting on each other.
+
+        :param data_lib: DataLib, the instance to wrap (created from connection_string if omitted)
+        :param connection_string: str, the connection string for MongoDB Atlas
+        :param max_workers: int, the number of queries that can run at the same time
+        :param kwargs: passed to DataLib when it is created here
+        """
+        self.data_lib = data_lib if data_lib is not None else DataLib(connection_string, **kwargs)
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='datalib')
+
+    def __getattr__(self, name):
+        attribute = getattr(self.data_lib, name)
+        if name.startswith('_') or not callable(attribute):
+            return attribute
+
+        async def method(*args, **kwargs):
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.executor, partial(attribute, *args, **kwargs))
+
+        method.__name__ = name
+        method.__doc__ = attribute.__doc__
+        return method
+
+    def __dir__(self):
+        return sorted(set(super().__dir__()) | {name for name in dir(self.data_lib) if not name.startswith('_')})
+
+    async def gather(self, **calls):
+        """
+        Await several DataLib calls concurrently.
+
+        Example: await adb.gather(artists=adb.get_unique_artists(), snapshot=adb.get_latest_snapshot())
+
+        :param calls: the coroutines to await, by result name
+        :return: dict, the results by name
+        """
+        results = await asyncio.gather(*calls.values())
+        return dict(zip(calls, results))
+
+    def run_concurrently(self, **calls):
+        """
+        Run several DataLib calls concurrently from synchronous code such as a Streamlit script.
+
+        :param calls: the coroutines to await, by result name
+        :return: dict, the results by name
+        """
+        return asyncio.run(self.gather(**calls))
+
+    def close(self):
+        """
+        Shut down the thread pool. The wrapped DataLib stays usable.
+        """
+        self.executor.shutdown(wait=True)
@@ -0,0 +1,513 @@
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+from copy import deepcopy
+from datetime import datetime, timedelta, timezone
+from functools import partial
+
+import numpy as np
+import pandas as pd
+import pymongo
+from pymongo import MongoClient
+
+from td_distributors import DEFAULT_DISTRIBUTORS
+from td_dp_lib import DataLib, _group_records
+from td_ingest import chunked
+from td_rawbson import COMPRESSORS, client_options
+from td_storage import MemoryStorage, MongoStorage
+
+DEFAULT_SIZES = [10_000, 100_000, 1_000_000]
+AGE_GROUPS = ['13-17', '18-24', '25-34', '35-44', '45-54', '55+']
+REGIONS = ['US', 'GB', 'DE', 'FR', 'BR', 'MX', 'JP', 'KR', 'IN', 'CA', 'AU', 'ES', 'IT', 'NL', 'SE']
+INTERESTS = ['Pop', 'Hip-Hop', 'Rock', 'Electronic', 'R&B', 'Latin', 'Indie', 'Country', 'K-Pop', 'Jazz']
+
+# Public DataLib methods deliberately left out of the timed run, with the reason
+SKIPPED = {
+    'upload_data': 'measured by the ingest phase (upsert_data)',
+    'upload_json_files': 'interactive wrapper around ingest_files',
+    'ingest_files': 'reads trending_music_*.json files; the ingest phase measures the same write path',
+    'delete_song_by_id': 'destructive',
+    'delete_all_songs': 'destructive; used to reset the database between sizes',
+    'delete_songs': 'destructive',
+    'export_columnar': 'writes files outside the database and needs pyarrow',
+    'watch_changes': 'blocks until new data arrives',
+    'migrate_schema': 'changes the schema of the loaded data; run with --schema-version 2 to benchmark version 2 rows',
+    'measure_command_bytes': 'a metrics switch; the benchmark runs without metrics',
+}
+
+# Benchmarks whose result reports on a feature the benchmark turns off, so it may be empty
+MAY_BE_EMPTY = {'explain_report', 'cache_stats', 'metrics_stats', 'sync_cache'}
+
+
+def generate_snapshots(n_artists=500, n_songs=2000, n_days=50, chart_size=200, start=None, history_days=14, seed=0):
+    """
+    Generate synthetic daily chart snapshots shaped like the trending_music_*.json items.
+
+    Every day the chart_size songs with the highest noisy popularity make the chart. Stream
+    counts accumulate across days, so the streamCountData, graph_values and popularity of
+    a song stay consistent from one snapshot to the next.
+
+    :param n_artists: int, the number of distinct artists
+    :param n_songs: int, the number of distinct songs (at least chart_size)
+    :param n_days: int, the number of daily snapshots
+    :param chart_size: int, the number of songs in each snapshot
+    :param start: datetime, the day of the first snapshot (defaults to 2024-01-01 UTC)
+    :param history_days: int, the number of past days kept in each streamCountData
+    :param seed: int, the random seed, so runs are reproducible
+    :return: generator of dict, n_days * chart_size items with an ISO 'timestamp'
+    """
+    if n_songs < chart_size:
+        raise ValueError('n_songs must be at least chart_size')
+    rng = np.random.default_rng(seed)
+    start = start or datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+    song_authors = rng.integers(0, n_artists, n_songs)
+    titles = [f'Song {index:06d}' for index in range(n_songs)]
+    authors = [f'Artist {index:05d}' for index in song_authors]
+    base_popularity = rng.beta(2, 5, n_songs) * 100
+    features = rng.random((n_songs, 7))
+    durations = rng.integers(120_000, 300_000, n_songs)
+    release_dates = [(start - timedelta(days=int(days))).strftime('%Y-%m-%d') for days in rng.integers(0, 720, n_songs)]
+    song_distributors = [
+        list(rng.choice(DEFAULT_DISTRIBUTORS, size=rng.integers(0, 3), replace=False)) for _ in range(n_songs)
+    ]
+    song_interests = [list(rng.choice(INTERESTS, size=3, replace=False)) for _ in range(n_songs)]
+
+    totals = np.zeros(n_songs)
+    daily_history = np.zeros((n_songs, 0))
+    for day in range(n_days):
+        date = start + timedelta(days=day)
+        popularity = np.clip(base_popularity + rng.normal(0, 8, n_songs), 0, 100)
+        daily = np.round(popularity ** 2 * rng.uniform(40, 60, n_songs))
+        totals += daily
+        daily_history = np.column_stack([daily_history, daily])[:, -history_days:]
+        chart = np.argsort(-popularity)[:chart_size]
+
+        for rank, song in enumerate(chart, start=1):
+            song = int(song)
+            days_kept = daily_history.shape[1]
+            stream_count_data = {}
+            total = totals[song]
+            for offset in range(days_kept):
+                stream_date = (date - timedelta(days=offset)).strftime('%Y-%m-%d')
+                stream_count_data[stream_date] = {'total': int(total), 'daily': int(daily_history[song, -1 - offset])}
+                total -= daily_history[song, -1 - offset]
+
+            age_shares = rng.dirichlet(np.ones(len(AGE_GROUPS))) * 100
+            regions = rng.choice(REGIONS, size=5, replace=False)
+            predicted = daily[song] * np.cumprod(rng.normal(1.0, 0.05, 7))
+            distributors = song_distributors[song]
+            description = f"{titles[song]} by {authors[song]}"
+            if distributors:
+                description += f", released through {' and '.join(distributors)}"
+
+            yield {
+                'id': f'track{song:06d}',
+                'title': titles[song],
+                'author': authors[song],
+                'rank': rank,
+                'graph_values': [int(value) for value in daily_history[song, ::-1][:7]],
+                'acousticness': float(features[song, 0]),
+                'danceability': float(features[song, 1]),
+                'energy': float(features[song, 2]),
+                'instrumentalness': float(features[song, 3]),
+                'liveness': float(features[song, 4]),
+                'speechiness': float(features[song, 5]),
+                'valence': float(features[song, 6]),
+                'popularity': int(popularity[song]),
+                'album': f'{titles[song]} - Single',
+                'release_date': release_dates[song],
+                'duration_ms': int(durations[song]),
+                'detail_url': f'https://example.com/track/{song:06d}',
+                'interest_names': song_interests[song],
+                'age_distribution': {group: round(float(share), 2) for group, share in zip(AGE_GROUPS, age_shares)},
+                'top_regions': [
+                    {'rank': index + 1, 'country': country, 'score': round(float(score), 2)}
+                    for index, (country, score) in enumerate(zip(regions, np.sort(rng.random(5))[::-1] * 100))
+                ],
+                'description': description,
+                'streamCountData': stream_count_data,
+                'AI predicted data': {f'day_{index}': int(value) for index, value in enumerate(predicted, start=1)},
+                'expected_rank_next_day': int(max(1, rank + rng.integers(-5, 6))),
+                'timestamp': date.isoformat().replace('+00:00', 'Z'),
+            }
+
+
+def dataset_shape(size, chart_size=200):
+    """
+    Pick generator parameters producing about size documents with a realistic song turnover.
+
+    :param size: int, the number of documents wanted
+    :param chart_size: int, the number of songs in each snapshot
+    :return: dict, keyword arguments for generate_snapshots
+    """
+    n_days = max(1, size // chart_size)
+    n_songs = max(chart_size, chart_size * 5 + n_days * 2)
+    return {'n_artists': max(1, n_songs // 4), 'n_songs': n_songs, 'n_days': n_days, 'chart_size': chart_size}
+
+
+def benchmarks(context):
+    """
+    Return the timed calls for a loaded database.
+
+    :param context: dict, sample values from the loaded data (song_id as stored, title, author, first_date, last_date)
+    :return: dict, benchmark name to a callable taking the DataLib
+    """
+    song_id, title, author = context['song_id'], context['title'], context['author']
+    first_date, last_date = context['first_date'], context['last_date']
+
+    def consume(frames):
+        return sum(len(frame) for frame in frames)
+
+    def rebuilt(db, attribute, build):
+        # The builds keep their index; drop it so every run measures a build
+        setattr(db, attribute, None)
+        return build()
+
+    return {
+        'ensure_indexes': lambda db: db.ensure_indexes(),
+        'explain_report': lambda db: db.explain_report(),
+        'cache_stats': lambda db: db.cache_stats(),
+        'memory_replica': lambda db: db.memory_replica(),
+        'metrics_stats': lambda db: db.metrics_stats(),
+        'get_watermark': lambda db: db.get_watermark(),
+        'get_schema_version': lambda db: db.get_schema_version(),
+        'changes_since': lambda db: db.changes_since(db.get_watermark() - 1),
+        'sync_cache': lambda db: db.sync_cache(),
+        'get_song_data': lambda db: db.get_song_data(),
+        'get_song_data[fields]': lambda db: db.get_song_data(fields=['title', 'author', 'popularity']),
+        'get_song_data[raw]': lambda db: db.get_song_data(fields=['title', 'author', 'popularity'], raw=True),
+        'iter_song_data': lambda db: consume(db.iter_song_data()),
+        'iter_date_range': lambda db: consume(db.iter_date_range(first_date, last_date)),
+        'iter_date_range[raw]': lambda db: consume(db.iter_date_range(
+            first_date, last_date, fields=['title', 'author', 'rank', 'popularity', 'graph_values', 'timestamp'], raw=True
+        )),
+        'iter_unique_songs': lambda db: consume(db.iter_unique_songs()),
+        'get_latest_snapshot': lambda db: db.get_latest_snapshot(),
+        'get_latest_snapshot[distributors]': lambda db: db.get_latest_snapshot(distributors=DEFAULT_DISTRIBUTORS[:2]),
+        'get_song_by_id': lambda db: db.get_song_by_id(song_id),
+        'get_song': lambda db: db.get_song(title, author),
+        'get_song[occurrences]': lambda db: db.get_song(title, author, include_occurrences=True),
+        'get_songs_by_name': lambda db: db.get_songs_by_name(title),
+        'get_songs_by_name[python]': lambda db: db.get_songs_by_name(title, aggregate=False),
+        'get_songs_by_author': lambda db: db.get_songs_by_author(author),
+        'build_search_index': lambda db: rebuilt(db, '_search_index', db.build_search_index),
+        'search_songs': lambda db: db.search_songs(f'{title} {author}'),
+        'search_songs[prefix]': lambda db: db.search_songs(title[:4]),
+        'search_songs[typo]': lambda db: db.search_songs(title[:-2] + title[-1:]),
+        'build_similarity_index': lambda db: rebuilt(db, '_similarity_index', db.build_similarity_index),
+        'get_similar_songs': lambda db: db.get_similar_songs(title, author),
+        'get_similar_songs[other_artists]': lambda db: db.get_similar_songs(title, author, exclude_author=True),
+        'get_songs_by_author[summary]': lambda db: db.get_songs_by_author(author, summary=True),
+        'get_song_occurrences': lambda db: db.get_song_occurrences(title, author),
+        'get_song_history': lambda db: db.get_song_history(title, author),
+        'get_top_regions': lambda db: db.get_top_regions(song_id),
+        'get_age_distribution': lambda db: db.get_age_distribution(song_id),
+        'analyze_stream_count': lambda db: db.analyze_stream_count(song_id),
+        'get_ai_predicted_data': lambda db: db.get_ai_predicted_data(song_id),
+        'get_expected_rank_next_day': lambda db: db.get_expected_rank_next_day(song_id),
+        'analyze_ai_predictions': lambda db: db.analyze_ai_predictions(song_id),
+        'analyze_streams': lambda db: db.analyze_streams(),
+        'forecast_day': lambda db: db.forecast_day(last_date),
+        'get_forecast': lambda db: db.get_forecast(song_id),
+        'get_distributor_counts': lambda db: db.get_distributor_counts(),
+        'get_distributor_counts[author]': lambda db: db.get_distributor_counts(author),
+        'filter_by_date_range': lambda db: db.filter_by_date_range(first_date, last_date),
+        'get_top_songs_comparison': lambda db: db.get_top_songs_comparison(first_date, last_date),
+        'get_rank_movements': lambda db: db.get_rank_movements(last_date),
+        'get_biggest_movers': lambda db: db.get_biggest_movers(),
+        'get_biggest_movers[down]': lambda db: db.get_biggest_movers(direction='down'),
+        'get_unique_songs': lambda db: db.get_unique_songs(),
+        'get_unique_artists': lambda db: db.get_unique_artists(),
+        'get_daily_top_songs': lambda db: db.get_daily_top_songs(last_date),
+        'add_note_to_song': lambda db: db.add_note_to_song(song_id, 'benchmark note'),
+        'add_notes': lambda db: db.add_notes(
+            {'title': item['title'], 'author': item['author'], 'note': 'benchmark note'} for item in context['replay']
+        ),
+        'get_notes': lambda db: db.get_notes(),
+        'upsert_data[replay]': lambda db: db.upsert_data(context['replay']),
+        'rebuild_timeseries': lambda db: db.rebuild_timeseries(),
+        'rebuild_rank_movements': lambda db: db.rebuild_rank_movements(),
+        'backfill_distributors': lambda db: db.backfill_distributors(),
+        'backfill_forecasts': lambda db: db.backfill_forecasts(),
+    }
+
+
+def uncovered_methods(names):
+    """
+    List the public DataLib methods that are neither benchmarked nor skipped.
+
+    :param names: iterable of str, the benchmark names
+    :return: list of str, the uncovered method names
+    """
+    covered = {name.split('[')[0] for name in names} | set(SKIPPED)
+    public = {name for name in dir(DataLib) if not name.startswith('_') and callable(getattr(DataLib, name))}
+    return sorted(public - covered)
+
+
+def is_empty(result):
+    """
+    Tell whether a benchmarked call returned nothing, e.g. because it looked up a missing song or day.
+    """
+    if result is None:
+        return True
+    if isinstance(result, (pd.DataFrame, pd.Series)):
+        return result.empty
+    if isinstance(result, (list, tuple, dict, set, str)):
+        return not result
+    if isinstance(result, (int, float)) and not isinstance(result, bool):
+        return result == 0
+    return False
+
+
+def time_call(call, repeat):
+    """
+    Time a call repeat times.
+
+    :param call: callable, the call to time
+    :param repeat: int, the number of runs
+    :return: dict, the run times in seconds with their min and median, or the error raised
+    """
+    runs = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        try:
+            call()
+        except Exception as e:
+            return {'error': f'{type(e).__name__}: {e}'}
+        runs.append(time.perf_counter() - started)
+    return {'min': min(runs), 'median': statistics.median(runs), 'runs': runs}
+
+
+def load_dataset(db, size, chunk_size=5000, seed=0, schema_version=1):
+    """
+    Reset the database and fill it with about size synthetic documents.
+
+    :param db: DataLib, the library under test
+    :param size: int, the number of documents to generate
+    :param chunk_size: int, the number of documents written per bulk request
+    :param seed: int, the random seed of the generator
+    :param schema_version: int, the schema version of the written documents (1 or 2)
+    :return: tuple, (ingest statistics, benchmark context)
+    """
+    db.storage.drop()
+    db.ensure_indexes()
+    if schema_version >= 2:
+        # Migrating the empty database makes the ingest write version 2 rows
+        db.migrate_schema()
+
+    shape = dataset_shape(size)
+    documents = 0
+    started = time.perf_counter()
+    last_chunk = []
+    for chunk in chunked(generate_snapshots(seed=seed, **shape), chunk_size):
+        db.upsert_data(chunk)
+        documents += len(chunk)
+        last_chunk = chunk
+    elapsed = time.perf_counter() - started
+
+    collection = db.storage.collection(db.collection_name)
+    first = collection.find_one(sort=[('timestamp', 1)], projection={'timestamp': 1})
+    latest = collection.find_one(sort=[('timestamp', -1)], projection={'timestamp': 1})
+    # The top song of the last day, so the song and date benchmarks hit real data
+    last = collection.find_one({'timestamp': latest['timestamp']}, {'title': 1, 'author': 1, 'timestamp': 1}, sort=[('rank', 1)])
+    context = {
+        'song_id': last['_id'],
+        'title': last['title'],
+        'author': last['author'],
+        'first_date': first['timestamp'].strftime('%Y-%m-%d'),
+        'last_date': last['timestamp'].strftime('%Y-%m-%d'),
+        'replay': [{key: value for key, value in item.items() if key != '_id'} for item in last_chunk],
+    }
+    ingest = {
+        'documents': documents,
+        'seconds': elapsed,
+        'docs_per_sec': documents / elapsed if elapsed else None,
+        'shape': shape,
+    }
+    return ingest, context
+
+
+def song_memory(db, authors=20):
+    """
+    Measure the memory a listed Song keeps against a raw document, with tracemalloc.
+
+    The Songs are built from the documents of a few artists the way get_songs_by_author groups
+    them, with the same records and without occurrences.
+
+    :param db: DataLib, the library under test
+    :param authors: int, the number of artists whose songs are measured
+    :return: dict, the documents and songs measured and the bytes retained per document and per Song
+    """
+    artists = list(db.get_unique_artists())[:authors]
+    collection = db.storage.collection(db.collection_name)
+    documents = list(collection.find({'author': {'$in': artists}}).sort([('author', 1), ('title', 1), ('timestamp', 1)]))
+    if not documents:
+        return {'documents': 0}
+    tracemalloc.start()
+    try:
+        # Private copies, so only allocations made here are counted
+        copies = deepcopy(documents)
+        document_bytes = tracemalloc.get_traced_memory()[0]
+        songs = db._songs_from_records(_group_records(copies))
+        del copies
+        song_bytes = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+    measured = {
+        'documents': len(documents),
+        'songs': len(songs),
+        'bytes_per_document': document_bytes / len(documents),
+        'bytes_per_song': song_bytes / len(songs),
+    }
+    del songs
+    return measured
+
+
+def run(storage, sizes=None, repeat=3, backend='mongodb', only=None, seed=0, schema_version=1):
+    """
+    Time every public DataLib method at each dataset size.
+
+    The query cache is disabled so every run reaches the database.
+
+    :param storage: MongoStorage or MemoryStorage, the storage under test, dropped before each size
+    :param sizes: list of int, the dataset sizes in documents (defaults to DEFAULT_SIZES)
+    :param repeat: int, the number of runs per method
+    :param backend: str, the name of the server recorded in the results
+    :param only: list of str, run only the benchmarks with these names
+    :param seed: int, the random seed of the generator
+    :param schema_version: int, the schema version of the loaded documents (1 or 2)
+    :return: dict, the machine-readable results
+    """
+    db = DataLib(None, cache=None, storage=storage)
+    results = {
+        'meta': {
+            'created_at': datetime.now(timezone.utc).isoformat(),
+            'backend': backend,
+            'python': sys.version.split()[0],
+            'platform': platform.platform(),
+            'pymongo': pymongo.version,
+            'pandas': pd.__version__,
+            'numpy': np.__version__,
+            'repeat': repeat,
+            'seed': seed,
+            'schema_version': schema_version,
+            'skipped': SKIPPED,
+        },
+        'sizes': {},
+    }
+
+    for size in sizes or DEFAULT_SIZES:
+        print(f"Loading {size} documents...")
+        ingest, context = load_dataset(db, size, seed=seed, schema_version=schema_version)
+        print(f"Loaded {ingest['documents']} documents in {ingest['seconds']:.1f}s ({ingest['docs_per_sec']:.0f} docs/s)")
+        memory = song_memory(db)
+        if memory['documents']:
+            print(f"Song: {memory['bytes_per_song']:.0f} bytes vs {memory['bytes_per_document']:.0f} bytes per document")
+
+        calls = benchmarks(context)
+        missing = uncovered_methods(calls)
+        if missing:
+            print(f"Warning: no benchmark for {', '.join(missing)}")
+        timings = {}
+        for name, call in calls.items():
+            if only and name not in only:
+                continue
+            if name not in MAY_BE_EMPTY:
+                # An untimed first call, so a context that misses the data fails loudly instead of timing a no-op
+                try:
+                    result = call(db)
+                except Exception:
+                    pass  # time_call records the error
+                else:
+                    assert not is_empty(result), f'{name} returned an empty result at size {size}'
+            timings[name] = time_call(partial(call, db), repeat)
+            timing = timings[name]
+            print(f"  {name}: " + (timing['error'] if 'error' in timing else f"{timing['median'] * 1000:.1f} ms"))
+        results['sizes'][str(size)] = {'ingest': ingest, 'memory': memory, 'methods': timings}
+
+    db.storage.drop()
+    return results
+
+
+def compare(baseline, current, threshold=0.2):
+    """
+    Find the benchmarks that got slower between two result files.
+
+    :param baseline: dict, results from run() for the reference version
+    :param current: dict, results from run() for the version under test
+    :param threshold: float, the relative slowdown of the median tolerated
+    :return: list of dict, the regressions with size, name, baseline, current and ratio
+    """
+    regressions = []
+    for size, measured in current['sizes'].items():
+        reference = baseline['sizes'].get(size, {}).get('methods', {})
+        for name, timing in measured['methods'].items():
+            before = reference.get(name)
+            if not before or 'median' not in before or 'median' not in timing:
+                continue
+            ratio = timing['median'] / before['median'] if before['median'] else float('inf')
+            if ratio > 1 + threshold:
+                regressions.append({
+                    'size': int(size),
+                    'name': name,
+                    'baseline': before['median'],
+                    'current': timing['median'],
+                    'ratio': ratio,
+                })
+    return sorted(regressions, key=lambda regression: -regression['ratio'])
+
+
+def main(argv=None):
+    """
+    Run the benchmark from the command line.
+
+    :param argv: list of str, the command line arguments (defaults to sys.argv)
+    :return: int, the exit status (1 when --compare finds regressions)
+    """
+    parser = argparse.ArgumentParser(description='Benchmark DataLib against synthetic chart data.')
+    parser.add_argument('--uri', default=os.getenv('BENCH_MONGODB_URI'),
+                        help='a local mongod, e.g. mongodb://localhost:27017 (defaults to the in-memory storage)')
+    parser.add_argument('--compressors', nargs='+', choices=COMPRESSORS, help='wire compressors offered to --uri')
+    parser.add_argument('--db-name', default='music_trends_bench', help='scratch database, dropped before each size')
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--only', nargs='+', help='run only these benchmarks')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--schema-version', type=int, choices=[1, 2], default=1, help='the schema version of the loaded documents')
+    parser.add_argument('--output', help='write the JSON results to this file')
+    parser.add_argument('--compare', help='a previous JSON result file to check for regressions')
+    parser.add_argument('--threshold', type=float, default=0.2, help='relative slowdown reported as a regression')
+    args = parser.parse_args(argv)
+
+    if args.uri:
+        storage, backend = MongoStorage(MongoClient(args.uri, **client_options(args.compressors)), args.db_name), 'mongodb'
+    else:
+        storage, backend = MemoryStorage(), 'memory'
+
+    results = run(storage, args.sizes, args.repeat, backend, args.only, args.seed, args.schema_version)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(json.load(f), results, args.threshold)
+        for regression in regressions:
+            print(f"REGRESSION {regression['name']} @ {regression['size']}: "
+                  f"{regression['baseline'] * 1000:.1f} ms -> {regression['current'] * 1000:.1f} ms "
+                  f"(x{regression['ratio']:.2f})")
+        if regressions:
+            return 1
+        print('No regressions')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
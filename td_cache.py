@@ -0,0 +1,228 @@
+import sys
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+import numpy as np
+import pandas as pd
+
+# Cells of an object column measured per cached frame; larger columns are extrapolated from an even sample
+SIZE_SAMPLE_CELLS = 200
+
+
+def estimate_size(obj, _seen=None):
+    """
+    Estimate the memory footprint of a cached value in bytes.
+
+    :param obj: object, the value to measure
+    :return: int, the approximate size in bytes
+    """
+    if _seen is None:
+        _seen = set()
+    if id(obj) in _seen:
+        return 0
+    _seen.add(id(obj))
+
+    if isinstance(obj, (pd.DataFrame, pd.Series)):
+        return _frame_size(obj, _seen)
+    if hasattr(obj, 'nbytes'):
+        return int(obj.nbytes)
+
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(estimate_size(k, _seen) + estimate_size(v, _seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(estimate_size(item, _seen) for item in obj)
+    elif hasattr(obj, '__slots__'):
+        size += sum(estimate_size(getattr(obj, name, None), _seen) for name in obj.__slots__)
+    elif hasattr(obj, '__dict__'):
+        size += estimate_size(vars(obj), _seen)
+    return size
+
+
+def _frame_size(obj, _seen):
+    """
+    Estimate the size of a DataFrame or Series, following the dicts and lists held in object columns.
+
+    memory_usage(deep=True) only counts the top-level object of each cell, so columns such as
+    streamCountData or graph_values would be undercounted several-fold.
+    """
+    frame = obj.to_frame() if isinstance(obj, pd.Series) else obj
+    size = int(frame.index.memory_usage(deep=True))
+    for _, column in frame.items():
+        if column.dtype != object:
+            size += int(column.memory_usage(index=False, deep=True))
+            continue
+        values = column.to_numpy()
+        size += values.nbytes
+        if len(values) > SIZE_SAMPLE_CELLS:
+            sample = values[np.linspace(0, len(values) - 1, SIZE_SAMPLE_CELLS).astype(np.int64)]
+            size += int(sum(estimate_size(value, _seen) for value in sample) * len(values) / SIZE_SAMPLE_CELLS)
+        else:
+            size += sum(estimate_size(value, _seen) for value in values)
+    return size
+
+
+class QueryCache:
+    def __init__(self, ttl=300, max_entries=256, max_bytes=64 * 1024 * 1024):
+        """
+        Initialize a thread-safe read-through cache with TTL and LRU eviction.
+
+        :param ttl: float, seconds an entry stays valid
+        :param max_entries: int, the maximum number of entries kept
+        :param max_bytes: int, the memory budget for all entries combined
+        """
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        # Bumped by every invalidation, so a value read before one is not stored after it
+        self._generation = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def get(self, key):
+        """
+        Look up a cached value.
+
+        :param key: hashable, the cache key
+        :return: tuple, (hit, value)
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return False, None
+            value, _, size, expires_at = entry
+            if expires_at < time.monotonic():
+                self._drop(key)
+                self.expirations += 1
+                self.misses += 1
+                return False, None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return True, value
+
+    def generation(self):
+        """
+        Return the invalidation generation, to pass to set for a value about to be read.
+        """
+        with self._lock:
+            return self._generation
+
+    def set(self, key, value, tags=(), generation=None):
+        """
+        Store a value, evicting the least recently used entries to stay within budget.
+
+        :param key: hashable, the cache key
+        :param value: object, the value to cache
+        :param tags: iterable, the tags used to invalidate the entry
+        :param generation: int, the generation() taken before the value was read; the value is
+            not stored if entries were invalidated since, as it may predate the write behind it
+        """
+        size = estimate_size(value)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if generation is not None and generation != self._generation:
+                return
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (value, frozenset(tags), size, time.monotonic() + self.ttl)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._drop(next(iter(self._entries)))
+                self.evictions += 1
+
+    def invalidate(self, tags):
+        """
+        Drop every entry carrying at least one of the given tags.
+
+        :param tags: iterable, the tags to invalidate
+        :return: int, the number of entries dropped
+        """
+        tags = set(tags)
+        with self._lock:
+            self._generation += 1
+            stale = [key for key, entry in self._entries.items() if entry[1] & tags]
+            for key in stale:
+                self._drop(key)
+            self.invalidations += len(stale)
+            return len(stale)
+
+    def clear(self):
+        """
+        Drop every entry.
+        """
+        with self._lock:
+            self._generation += 1
+            self.invalidations += len(self._entries)
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        """
+        Return the hit/miss statistics of the cache.
+
+        :return: dict, the cache statistics
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'invalidations': self.invalidations
+            }
+
+    def _drop(self, key):
+        _, _, size, _ = self._entries.pop(key)
+        self._bytes -= size
+
+
+def _freeze(value):
+    """
+    Turn call arguments into a hashable cache key.
+    """
+    if isinstance(value, dict):
+        return tuple(sorted((k, _freeze(v)) for k, v in value.items()))
+    if isinstance(value, (list, tuple, set)):
+        return tuple(_freeze(v) for v in value)
+    return value
+
+
+def cached(tags):
+    """
+    Cache a DataLib read method in the instance's QueryCache, if it has one.
+
+    Cached values are shared between callers and must not be mutated.
+
+    :param tags: iterable of tags, or a callable taking the method arguments and returning them
+    """
+    def decorator(method):
+        @wraps(method)
+        def wrapper(self, *args, **kwargs):
+            cache = self.cache
+            if cache is None:
+                return method(self, *args, **kwargs)
+
+            key = (method.__name__, _freeze(args), _freeze(kwargs))
+            hit, value = cache.get(key)
+            if hit:
+                return value
+            generation = cache.generation()
+            value = method(self, *args, **kwargs)
+            cache.set(key, value, tags(self, *args, **kwargs) if callable(tags) else tags, generation)
+            return value
+        return wrapper
+    return decorator
@@ -0,0 +1,393 @@
+import json
+import os
+import threading
+from datetime import datetime, timezone
+
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.parquet as pq
+except ImportError:  # optional dependency (see requirements.txt), only needed for the columnar export and offline mode
+    pa = pc = pq = None
+
+from td_similarity import AUDIO_FEATURES
+
+TEXT_FIELDS = ['id', 'title', 'author', 'album', 'release_date', 'description', 'detail_url', 'note']
+NUMBER_FIELDS = ['popularity', 'duration_ms', 'expected_rank_next_day', *AUDIO_FEATURES]
+GRAPH_POINTS = 7
+PREDICTION_DAYS = 7
+MANIFEST = 'manifest.json'
+FILE_EXTENSIONS = {'arrow': 'arrow', 'parquet': 'parquet'}
+
+_manifest_lock = threading.Lock()
+
+
+def _require_pyarrow():
+    if pa is None:
+        raise ImportError('The columnar export needs pyarrow: pip install pyarrow')
+
+
+def snapshot_schema():
+    """
+    Return the schema of the flattened snapshot rows, one row per document.
+    """
+    _require_pyarrow()
+    return pa.schema([
+        ('_id', pa.string()),
+        ('timestamp', pa.timestamp('ms')),
+        *[(field, pa.string()) for field in TEXT_FIELDS],
+        *[(field, pa.float64()) for field in NUMBER_FIELDS],
+        *[(f'graph_value_{index}', pa.float64()) for index in range(GRAPH_POINTS)],
+        ('stream_date', pa.string()),
+        ('stream_total', pa.float64()),
+        ('stream_daily', pa.float64()),
+        ('stream_days', pa.int32()),
+        *[(f'predicted_day_{day}', pa.float64()) for day in range(1, PREDICTION_DAYS + 1)],
+        ('age_distribution', pa.map_(pa.string(), pa.float64())),
+        ('top_regions', pa.list_(pa.struct([('rank', pa.int64()), ('country', pa.string()), ('score', pa.float64())]))),
+        ('interest_names', pa.list_(pa.string())),
+        ('distributors', pa.list_(pa.string())),
+    ])
+
+
+def stream_schema():
+    """
+    Return the schema of the stream count rows, one row per (document, streamCountData date).
+    """
+    _require_pyarrow()
+    return pa.schema([
+        ('title', pa.string()),
+        ('author', pa.string()),
+        ('date', pa.string()),
+        ('total', pa.float64()),
+        ('daily', pa.float64()),
+    ])
+
+
+def _text(value):
+    return None if value is None else str(value)
+
+
+def _number(value):
+    if isinstance(value, bool) or value is None:
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _utc(value):
+    """
+    Return a timestamp as a naive UTC datetime, the way MongoDB stores it.
+    """
+    if isinstance(value, str):
+        try:
+            value = datetime.fromisoformat(value.replace('Z', '+00:00'))
+        except ValueError:
+            return None
+    if not isinstance(value, datetime):
+        return None
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def flatten_documents(documents):
+    """
+    Flatten documents into snapshot and stream count tables.
+
+    graph_values, the audio features, AI predicted data and the latest streamCountData entry
+    become one column each; the full streamCountData goes to the stream count table.
+
+    :param documents: iterable of dict, the documents of the trends collection
+    :return: tuple of pyarrow.Table, (snapshots, stream counts)
+    """
+    schema, streams_schema = snapshot_schema(), stream_schema()
+    rows = {name: [] for name in schema.names}
+    streams = {name: [] for name in streams_schema.names}
+    for document in documents:
+        rows['_id'].append(_text(document.get('_id')))
+        rows['timestamp'].append(_utc(document.get('timestamp')))
+        for field in TEXT_FIELDS:
+            rows[field].append(_text(document.get(field)))
+        for field in NUMBER_FIELDS:
+            rows[field].append(_number(document.get(field)))
+
+        graph_values = document.get('graph_values') or []
+        for index in range(GRAPH_POINTS):
+            rows[f'graph_value_{index}'].append(_number(graph_values[index]) if index < len(graph_values) else None)
+
+        stream_data = {date: counts for date, counts in (document.get('streamCountData') or {}).items() if isinstance(counts, dict)}
+        latest = max(stream_data) if stream_data else None
+        rows['stream_date'].append(latest)
+        rows['stream_total'].append(_number(stream_data[latest].get('total')) if latest else None)
+        rows['stream_daily'].append(_number(stream_data[latest].get('daily')) if latest else None)
+        rows['stream_days'].append(len(stream_data))
+        for date, counts in stream_data.items():
+            streams['title'].append(_text(document.get('title')))
+            streams['author'].append(_text(document.get('author')))
+            streams['date'].append(date)
+            streams['total'].append(_number(counts.get('total')))
+            streams['daily'].append(_number(counts.get('daily')))
+
+        predicted = document.get('AI predicted data') or {}
+        for day in range(1, PREDICTION_DAYS + 1):
+            rows[f'predicted_day_{day}'].append(_number(predicted.get(f'day_{day}')))
+
+        age_distribution = document.get('age_distribution') or {}
+        rows['age_distribution'].append([(str(group), _number(share)) for group, share in age_distribution.items()])
+        rows['top_regions'].append([
+            {'rank': region.get('rank'), 'country': _text(region.get('country')), 'score': _number(region.get('score'))}
+            for region in document.get('top_regions') or [] if isinstance(region, dict)
+        ])
+        rows['interest_names'].append([str(name) for name in document.get('interest_names') or []])
+        rows['distributors'].append([str(name) for name in document.get('distributors') or []])
+
+    return pa.Table.from_pydict(rows, schema=schema), pa.Table.from_pydict(streams, schema=streams_schema)
+
+
+def read_manifest(directory):
+    """
+    Read the manifest of an export directory.
+
+    :return: dict, with the format and the exported partitions by day (empty for a new directory)
+    """
+    path = os.path.join(directory, MANIFEST)
+    if not os.path.exists(path):
+        return {'format': None, 'partitions': {}}
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def _write_atomically(path, write):
+    temporary = f'{path}.tmp'
+    write(temporary)
+    os.replace(temporary, path)
+
+
+def _write_table(table, path, format):
+    def write(temporary):
+        if format == 'parquet':
+            pq.write_table(table, temporary, compression='zstd')
+        else:
+            # Uncompressed Arrow IPC, so readers can memory-map it without decoding
+            with pa.OSFile(temporary, 'wb') as sink, pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+    _write_atomically(path, write)
+
+
+def write_partition(directory, day, documents, format='arrow'):
+    """
+    Write the documents of one day as a partition, replacing the previous version of that day.
+
+    :param directory: str, the export directory
+    :param day: str, the day in 'YYYY-MM-DD' format
+    :param documents: iterable of dict, every document of that day
+    :param format: str, 'arrow' (memory-mappable) or 'parquet' (compressed)
+    :return: dict, the manifest entry of the partition
+    """
+    _require_pyarrow()
+    if format not in FILE_EXTENSIONS:
+        raise ValueError(f"Unknown columnar format '{format}', expected one of {', '.join(FILE_EXTENSIONS)}")
+    exported_format = read_manifest(directory).get('format')
+    if exported_format not in (None, format):
+        raise ValueError(f"{directory} holds a {exported_format} export, not {format}")
+    snapshots, streams = flatten_documents(documents)
+    partition = os.path.join(directory, f'day={day}')
+    os.makedirs(partition, exist_ok=True)
+    extension = FILE_EXTENSIONS[format]
+    _write_table(snapshots, os.path.join(partition, f'snapshots.{extension}'), format)
+    _write_table(streams, os.path.join(partition, f'streams.{extension}'), format)
+    entry = {'rows': snapshots.num_rows, 'stream_rows': streams.num_rows, 'exported_at': datetime.now(timezone.utc).isoformat()}
+
+    with _manifest_lock:
+        manifest = read_manifest(directory)
+        if manifest.get('format') not in (None, format):
+            raise ValueError(f"{directory} holds a {manifest['format']} export, not {format}")
+        manifest['format'] = format
+        manifest['partitions'][day] = entry
+        manifest['partitions'] = dict(sorted(manifest['partitions'].items()))
+
+        def write(temporary):
+            with open(temporary, 'w') as f:
+                json.dump(manifest, f, indent=2)
+        _write_atomically(os.path.join(directory, MANIFEST), write)
+    return entry
+
+
+class ColumnarReader:
+    def __init__(self, directory):
+        """
+        Initialize an offline reader over a columnar export.
+
+        Arrow partitions are memory-mapped and read without copying; Parquet partitions are
+        decoded from memory-mapped files. Opened partitions are kept for later queries.
+
+        :param directory: str, the export directory written by DataLib.export_columnar
+        """
+        _require_pyarrow()
+        self.directory = directory
+        self._tables = {}
+        self._lock = threading.Lock()
+        self.refresh()
+
+    def refresh(self):
+        """
+        Re-read the manifest, picking up partitions exported since the reader was opened.
+        """
+        manifest = read_manifest(self.directory)
+        with self._lock:
+            self.format = manifest.get('format') or 'arrow'
+            self.days = sorted(manifest['partitions'])
+            self._exported_at = {day: entry.get('exported_at') for day, entry in manifest['partitions'].items()}
+            # Rewritten partitions are opened again
+            self._tables = {key: table for key, table in self._tables.items() if key[2] == self._exported_at.get(key[0])}
+
+    def _open(self, day, name):
+        key = (day, name, self._exported_at.get(day))
+        with self._lock:
+            table = self._tables.get(key)
+        if table is not None:
+            return table
+        path = os.path.join(self.directory, f'day={day}', f'{name}.{FILE_EXTENSIONS[self.format]}')
+        if self.format == 'parquet':
+            table = pq.read_table(path, memory_map=True)
+        else:
+            table = pa.ipc.open_file(pa.memory_map(path, 'r')).read_all()
+        with self._lock:
+            self._tables[key] = table
+        return table
+
+    def table(self, start_date=None, end_date=None, columns=None, name='snapshots'):
+        """
+        Return the rows of a range of days as one Arrow table, opening only those partitions.
+
+        :param start_date: str, the first day in 'YYYY-MM-DD' format (the first exported day if omitted)
+        :param end_date: str, the last day in 'YYYY-MM-DD' format (the last exported day if omitted)
+        :param columns: list of str, the columns to keep (all columns if omitted)
+        :param name: str, 'snapshots' or 'streams'
+        :return: pyarrow.Table, the rows, oldest day first
+        """
+        schema = snapshot_schema() if name == 'snapshots' else stream_schema()
+        days = [day for day in self.days if (start_date is None or day >= start_date) and (end_date is None or day <= end_date)]
+        tables = [self._open(day, name) for day in days]
+        table = pa.concat_tables(tables) if tables else schema.empty_table()
+        return table.select(columns) if columns else table
+
+    @staticmethod
+    def to_frame(table):
+        """
+        Convert an Arrow table to a DataFrame, sharing memory for null-free numeric columns.
+        """
+        return table.to_pandas(split_blocks=True)
+
+    def get_song_data(self, fields=None):
+        """
+        Retrieve every snapshot row (the columnar equivalent of DataLib.get_song_data).
+
+        :param fields: list of str, the columns to fetch (all columns if omitted)
+        :return: pd.DataFrame, the flattened rows
+        """
+        return self.to_frame(self.table(columns=self._columns(fields)))
+
+    def iter_song_data(self, fields=None):
+        """
+        Stream the snapshot rows one day at a time.
+
+        :param fields: list of str, the columns to fetch (all columns if omitted)
+        :return: iterator of pd.DataFrame, one per exported day
+        """
+        for day in list(self.days):
+            yield self.to_frame(self.table(day, day, self._columns(fields)))
+
+    def filter_by_date_range(self, start_date, end_date, fields=None):
+        """
+        Retrieve the snapshot rows within a date range, reading only the matching partitions.
+
+        :param start_date: str, the start date in 'YYYY-MM-DD' format
+        :param end_date: str, the end date in 'YYYY-MM-DD' format
+        :param fields: list of str, the columns to fetch (all columns if omitted)
+        :return: pd.DataFrame, the flattened rows
+        """
+        return self.to_frame(self.table(start_date, end_date, self._columns(fields)))
+
+    def get_daily_top_songs(self, date, fields=None):
+        """
+        Retrieve the snapshot of one day.
+
+        :param date: str, the date in 'YYYY-MM-DD' format
+        :param fields: list of str, the columns to fetch (all columns if omitted)
+        :return: pd.DataFrame, the flattened rows of that day
+        """
+        return self.filter_by_date_range(date, date, fields)
+
+    def get_latest_snapshot(self, fields=None, distributors=None):
+        """
+        Retrieve the rows of the most recent exported day.
+
+        :param fields: list of str, the columns to fetch (all columns if omitted)
+        :param distributors: list of str, only keep songs released through one of these distributors
+        :return: pd.DataFrame, the flattened rows
+        """
+        if not self.days:
+            return pd.DataFrame()
+        table = self.table(self.days[-1], self.days[-1])
+        if distributors:
+            column = table['distributors']
+            matched = pc.is_in(pc.list_flatten(column), value_set=pa.array(list(distributors), pa.string()))
+            rows = pc.unique(pc.filter(pc.list_parent_indices(column), matched))
+            table = table.take(pc.take(rows, pc.sort_indices(rows)))
+        return self.to_frame(table.select(self._columns(fields)) if fields else table)
+
+    def get_song_occurrences(self, title, author, fields=None):
+        """
+        Retrieve every snapshot row of a song, oldest first.
+
+        :param title: str, the title of the song
+        :param author: str, the author of the song
+        :param fields: list of str, the columns to fetch (all columns if omitted)
+        :return: pd.DataFrame, the flattened rows of the song
+        """
+        table = self.table()
+        table = table.filter(pc.and_(pc.equal(table['title'], title), pc.equal(table['author'], author)))
+        return self.to_frame(table.select(self._columns(fields)) if fields else table)
+
+    def get_song_history(self, title, author):
+        """
+        Retrieve the daily stream counts and popularity of a song (the columnar equivalent of DataLib.get_song_history).
+
+        Later snapshots overwrite the stream counts repeated in earlier ones.
+
+        :param title: str, the title of the song
+        :param author: str, the author of the song
+        :return: pd.DataFrame, one row per day with data, with date, total, daily and popularity columns
+        """
+        streams = self.table(name='streams')
+        streams = streams.filter(pc.and_(pc.equal(streams['title'], title), pc.equal(streams['author'], author)))
+        counts = self.to_frame(streams.select(['date', 'total', 'daily'])).drop_duplicates('date', keep='last')
+
+        snapshots = self.get_song_occurrences(title, author, ['timestamp', 'popularity'])
+        popularity = pd.DataFrame({
+            'date': snapshots['timestamp'].dt.strftime('%Y-%m-%d'),
+            'popularity': snapshots['popularity']
+        }).drop_duplicates('date', keep='last')
+
+        history = counts.merge(popularity, on='date', how='outer').sort_values('date', ignore_index=True)
+        history['date'] = pd.to_datetime(history['date'])
+        return history[['date', 'total', 'daily', 'popularity']]
+
+    def get_unique_artists(self):
+        """
+        Retrieve the unique artists across the export.
+
+        :return: list, unique artist names
+        """
+        artists = pc.unique(self.table(columns=['author'])['author']).drop_null()
+        return sorted(artists.to_pylist())
+
+    @staticmethod
+    def _columns(fields):
+        return ['_id', 'timestamp', *[field for field in fields if field not in ('_id', 'timestamp')]] if fields else None
@@ -0,0 +1,61 @@
+from collections import deque
+
+DEFAULT_DISTRIBUTORS = [
+    "DistroKid", "TuneCore", "CD Baby", "Ditto Music", "Amuse", "LANDR", "UnitedMasters",
+    "Stem", "iMusician", "RouteNote", "Catapult Distribution", "SongCast", "Soundrop"
+]
+
+
+class DistributorMatcher:
+    def __init__(self, distributors=None):
+        """
+        Build an Aho-Corasick automaton matching distributor names case-insensitively.
+
+        :param distributors: list of str, the distributor names (defaults to DEFAULT_DISTRIBUTORS)
+        """
+        self.distributors = list(distributors or DEFAULT_DISTRIBUTORS)
+        self._goto = [{}]
+        self._fail = [0]
+        self._output = [set()]
+
+        for index, name in enumerate(self.distributors):
+            state = 0
+            for char in name.lower():
+                if char not in self._goto[state]:
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._output.append(set())
+                    self._goto[state][char] = len(self._goto) - 1
+                state = self._goto[state][char]
+            self._output[state].add(index)
+
+        # Breadth-first pass computing failure links
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, child in self._goto[state].items():
+                queue.append(child)
+                fallback = self._fail[state]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[child] = self._goto[fallback].get(char, 0)
+                self._output[child] |= self._output[self._fail[child]]
+
+    def match(self, text):
+        """
+        Find every distributor named in a text in a single pass.
+
+        :param text: str, the text to scan (e.g. a song description)
+        :return: list of str, the distributors found, in the configured order
+        """
+        if not text:
+            return []
+        found = set()
+        state = 0
+        for char in text.lower():
+            while state and char not in self._goto[state]:
+                state = self._fail[state]
+            state = self._goto[state].get(char, 0)
+            if self._output[state]:
+                found |= self._output[state]
+        return [self.distributors[index] for index in sorted(found)]
@@ -1,110 +1,1962 @@
+import calendar
 import os
-import json
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from types import MappingProxyType
+from itertools import groupby, islice
+from pymongo import ASCENDING, DESCENDING, DeleteOne, IndexModel, ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, OperationFailure
 from pymongo.mongo_client import MongoClient
+from pymongo.results import BulkWriteResult
 from pymongo.server_api import ServerApi
+import numpy as np
 import pandas as pd
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
+from td_cache import QueryCache, cached
+from td_columnar import read_manifest, write_partition
+from td_distributors import DistributorMatcher
+from td_forecast import HISTORY_DAYS, daily_matrix, expected_ranks, fit_chart, fit_trends, forecast_streams
+from td_ingest import chunked, iter_trending_items
+from td_metrics import CommandMetricsListener, MetricsRegistry, instrument
+from td_rawbson import client_options, columnar_schema, concat_frames, decode_columnar, decode_documents
+from td_schema import (
+    HYDRATION_FIELDS, SCHEMA_ID, SCHEMA_VERSION, SLIM_FIELDS, STREAM_HISTORY_DAYS,
+    history_months, merge_catalog, split_document, stream_history, stream_window
+)
+from td_search import SearchIndex
+from td_similarity import SimilarityIndex
+from td_storage import MemoryStorage, MongoStorage
+
+# Indexes DataLib relies on, keyed by the DataLib attribute holding the collection name
+INDEX_SPEC = {
+    'collection_name': [
+        {'name': 'author_title_timestamp', 'keys': [('author', ASCENDING), ('title', ASCENDING), ('timestamp', ASCENDING)]},
+        # The upsert key: concurrent or retried ingests of the same song and day update one document
+        {'name': 'title_author_timestamp', 'keys': [('title', ASCENDING), ('author', ASCENDING), ('timestamp', ASCENDING)], 'options': {'unique': True}},
+        {'name': 'timestamp', 'keys': [('timestamp', DESCENDING)]},
+        {'name': 'distributors_timestamp', 'keys': [('distributors', ASCENDING), ('timestamp', DESCENDING)]},
+        {'name': 'ingest_seq', 'keys': [('ingest_seq', ASCENDING)]},
+    ],
+    'timeseries_collection_name': [
+        {'name': 'title_author_month', 'keys': [('title', ASCENDING), ('author', ASCENDING), ('month', ASCENDING)], 'options': {'unique': True}},
+    ],
+    'catalog_collection_name': [
+        {'name': 'title_author', 'keys': [('title', ASCENDING), ('author', ASCENDING)], 'options': {'unique': True}},
+    ],
+    'notes_collection_name': [
+        {'name': 'title_author', 'keys': [('title', ASCENDING), ('author', ASCENDING)], 'options': {'unique': True}},
+        {'name': 'author', 'keys': [('author', ASCENDING)]},
+    ],
+    'movements_collection_name': [
+        {'name': 'day_title_author', 'keys': [('day', ASCENDING), ('title', ASCENDING), ('author', ASCENDING)], 'options': {'unique': True}},
+        {'name': 'change_day', 'keys': [('change', DESCENDING), ('day', ASCENDING)]},
+    ],
+}
+
+# Server error codes of an index that exists with other options or keys than declared
+INDEX_CONFLICT_CODES = (85, 86)
+
+# Representative query of each DataLib method against the trends collection, used by explain_report
+QUERY_SHAPES = {
+    'get_song_data': {'filter': {}},
+    'get_latest_snapshot': {'filter': {'timestamp': '$timestamp'}},
+    'get_song_by_id': {'filter': {'title': '$title', 'author': '$author'}},
+    'get_song': {'filter': {'title': '$title', 'author': '$author'}, 'sort': [('title', ASCENDING), ('author', ASCENDING), ('timestamp', ASCENDING)]},
+    'get_song_occurrences': {'filter': {'title': '$title', 'author': '$author'}, 'sort': [('timestamp', ASCENDING)]},
+    'get_songs_by_name': {'filter': {'title': '$title'}, 'sort': [('title', ASCENDING), ('author', ASCENDING), ('timestamp', ASCENDING)]},
+    'get_songs_by_author': {'filter': {'author': '$author'}, 'sort': [('author', ASCENDING), ('title', ASCENDING), ('timestamp', ASCENDING)]},
+    'filter_by_date_range': {'filter': {'timestamp': {'$gte': '$timestamp', '$lte': '$timestamp'}}},
+    'iter_date_range': {'filter': {'timestamp': {'$gte': '$timestamp', '$lte': '$timestamp'}}, 'sort': [('timestamp', ASCENDING)]},
+    'get_top_songs_comparison': {'filter': {'timestamp': {'$gte': '$timestamp', '$lt': '$timestamp'}}},
+    'get_daily_top_songs': {'filter': {'timestamp': {'$gte': '$timestamp', '$lt': '$timestamp'}}},
+    'get_unique_songs': {'filter': {}},
+    'get_unique_artists': {'distinct': 'author'},
+    'get_distributor_counts': {'filter': {'author': '$author', 'distributors': {'$exists': True, '$ne': []}}},
+}
+
+UNIQUE_SONGS_PIPELINE = [
+    {'$group': {
+        '_id': {'title': '$title', 'author': '$author'},
+        'unique_ids': {'$addToSet': '$_id'},
+        'graph_values': {'$first': '$graph_values'},
+        'timestamp': {'$first': '$timestamp'}
+    }}
+]
+
+# The document of the meta collection holding the ingest sequence
+WATERMARK_ID = 'ingest_watermark'
+# Prefix of the meta documents recording a deletion, read by sync_cache in other processes
+DELETION_PREFIX = 'deletion_'
+# Ingests unfinished and silent after this long are assumed to have crashed and stop holding the
+# watermark back; long writes refresh their start time as they go (see _heartbeat_ingest)
+PENDING_TIMEOUT = timedelta(minutes=10)
+# Deletion records older than this are pruned; a process that has not synced since rebuilds its
+# cache and song indexes instead of applying them one by one
+DELETION_RETENTION = timedelta(days=7)
+
+# Fields of its latest occurrence a grouped Song keeps, those the song views read
+LATEST_FIELDS = [
+    '_id', 'timestamp', 'rank', 'popularity', 'graph_values',
+    'expected_rank_next_day', 'AI predicted data', 'forecast_rank_next_day', 'forecast_streams',
+]
+
+# Shared values of the fields a Song document lacks; read-only so no song can alter another's
+EMPTY_LIST = ()
+EMPTY_DICT = MappingProxyType({})
+EMPTY_COUNTS = np.empty((0, 2), dtype=np.float64)
+EMPTY_COUNTS.flags.writeable = False
 
 class Song:
-    def __init__(self, data, all_occurrences):
+    __slots__ = (
+        'id', 'title', 'author', 'graph_values',
+        'acousticness', 'danceability', 'energy', 'instrumentalness', 'liveness', 'speechiness', 'valence',
+        'popularity', 'album', 'release_date', 'duration_ms', 'timestamp', 'note',
+        'detail_url', 'interest_names', 'age_distribution', 'top_regions', 'description',
+        'stream_dates', '_stream_counts', 'ai_predicted_data', 'expected_rank_next_day', 'distributors',
+        '_all_occurrences', '_latest_occurrence', '_occurrence_loader'
+    )
+
+    def __init__(self, data, all_occurrences=None, latest_occurrence=None, occurrence_loader=None):
+        """
+        Initialize a Song object with data.
+
+        :param data: dict, the song data
+        :param all_occurrences: list of dict, all occurrences of the song
+        :param latest_occurrence: dict, the most recent occurrence of the song (derived from all_occurrences if omitted)
+        :param occurrence_loader: callable, fetches all occurrences on first access when all_occurrences is omitted
+        """
+        self.id = data.get('_id')
+        self.title = data.get('title')
+        self.author = data.get('author')
+        self.graph_values = data.get('graph_values') or []
+        self.acousticness = data.get('acousticness')
+        self.danceability = data.get('danceability')
+        self.energy = data.get('energy')
+        self.instrumentalness = data.get('instrumentalness')
+        self.liveness = data.get('liveness')
+        self.speechiness = data.get('speechiness')
+        self.valence = data.get('valence')
+        self.popularity = data.get('popularity')
+        self.album = data.get('album')
+        self.release_date = data.get('release_date')
+        self.duration_ms = data.get('duration_ms')
+        self.timestamp = data.get('timestamp')
+        self.note = data.get('note')
+        self._all_occurrences = all_occurrences
+        self._latest_occurrence = latest_occurrence
+        self._occurrence_loader = occurrence_loader
+
+        # New attributes
+        self.detail_url = data.get('detail_url')
+        # Missing fields share one read-only empty value instead of a fresh list or dict per song
+        self.interest_names = data.get('interest_names', EMPTY_LIST)
+        self.age_distribution = data.get('age_distribution', EMPTY_DICT)
+        self.top_regions = data.get('top_regions', EMPTY_LIST)
+        self.description = data.get('description')
+        self.ai_predicted_data = data.get('AI predicted data', EMPTY_DICT)
+        self.expected_rank_next_day = data.get('expected_rank_next_day')
+        self.distributors = data.get('distributors', EMPTY_LIST)
+
+        # Stream count history as the sorted dates and one (dates, 2) array of total and daily,
+        # instead of a dict of dicts
+        stream_data = data.get('streamCountData') or EMPTY_DICT
+        dates = sorted(date for date, counts in stream_data.items() if isinstance(counts, dict))
+        self.stream_dates = tuple(dates)
+        self._stream_counts = np.array(
+            [(_to_float(stream_data[date].get('total')), _to_float(stream_data[date].get('daily'))) for date in dates],
+            dtype=np.float64
+        ) if dates else EMPTY_COUNTS
+
+    @property
+    def all_occurrences(self):
+        """
+        All occurrences of the song, fetched on first access if they were not loaded up front.
+        """
+        if self._all_occurrences is None and self._occurrence_loader is not None:
+            self._all_occurrences = self._occurrence_loader()
+        return self._all_occurrences
+
+    @all_occurrences.setter
+    def all_occurrences(self, occurrences):
+        self._all_occurrences = occurrences
+
+    @property
+    def latest_occurrence(self):
+        """
+        The most recent occurrence of the song.
+        """
+        if self._latest_occurrence is None and self.all_occurrences:
+            self._latest_occurrence = max(self.all_occurrences, key=lambda x: x['timestamp'])
+        return self._latest_occurrence
+
+    @property
+    def stream_totals(self):
+        """
+        The cumulative stream count of each date of stream_dates (NaN where missing or malformed).
+        """
+        return self._stream_counts[:, 0]
+
+    @property
+    def stream_daily(self):
+        """
+        The daily stream count of each date of stream_dates (NaN where missing or malformed).
+        """
+        return self._stream_counts[:, 1]
+
+    @property
+    def streamCountData(self):
+        """
+        The stream count history in its original {date: {'total', 'daily'}} form.
+        """
+        return {
+            str(date): {'total': _to_number(total), 'daily': _to_number(daily)}
+            for date, total, daily in zip(self.stream_dates, self.stream_totals, self.stream_daily)
+        }
+
+    def graphs_7(self, index=0):
+        """
+        Return the graph data for the last 7 days for a specific occurrence.
+
+        :param index: int, the index of the occurrence
+        :return: list, the graph values
+        """
+        return self.all_occurrences[index]['graph_values'] if self.all_occurrences else []
+
+    def __repr__(self):
+        return f"Song(ID={self.id}, Title={self.title}, Author={self.author})"
+
+class SongSummary:
+    __slots__ = ('id', 'title', 'author', 'description', 'timestamp')
+
+    def __init__(self, data):
+        """
+        Initialize a lightweight Song stand-in for list views.
+
+        :param data: dict, the song data (only _id, title, author, description and timestamp are kept)
+        """
+        self.id = data.get('_id')
+        self.title = data.get('title')
+        self.author = data.get('author')
+        self.description = data.get('description')
+        self.timestamp = data.get('timestamp')
+
+    def __repr__(self):
+        return f"SongSummary(ID={self.id}, Title={self.title}, Author={self.author})"
+
+def _to_float(value):
+    """
+    Convert a stored stream count to a float, NaN if it is missing or not a number.
+    """
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
+
+def _to_number(value):
+    """
+    Convert a float from a stream count array back to the int or None it was stored as.
+    """
+    if np.isnan(value):
+        return None
+    return int(value) if float(value).is_integer() else float(value)
+
+def _date_key(value):
+    """
+    Normalize a datetime or date string to its UTC day 'YYYY-MM-DD' (None if it cannot be parsed).
+
+    MongoDB stores timestamps as naive UTC and _day_range queries UTC days, so a timestamp with an
+    offset is converted before its date is taken.
+    """
+    if isinstance(value, str):
+        try:
+            value = datetime.fromisoformat(value.replace('Z', '+00:00'))
+        except ValueError:
+            return None
+    if not isinstance(value, datetime):
+        return None
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc)
+    return value.strftime('%Y-%m-%d')
+
+def _frame_from_documents(documents, fields=None):
+    """
+    Build a DataFrame column by column from documents, without an intermediate list of dicts.
+
+    :param documents: iterable of dict, e.g. a cursor or a slice of one
+    :param fields: list of str, the columns to keep (every field seen if omitted)
+    :return: pd.DataFrame, one row per document with _id as a string
+    """
+    columns = {field: [] for field in fields} if fields else {}
+    rows = 0
+    for document in documents:
+        for key, value in document.items():
+            column = columns.get(key)
+            if column is None:
+                if fields:
+                    continue
+                column = columns[key] = [None] * rows
+            column.append(str(value) if key == '_id' else value)
+        rows += 1
+        # Pad the columns this document does not have
+        for column in columns.values():
+            if len(column) < rows:
+                column.append(None)
+    return pd.DataFrame(columns, index=pd.RangeIndex(rows))
+
+def _projection(fields):
+    """
+    Return the MongoDB projection and DataFrame columns for a field list (None for everything).
+    """
+    if not fields:
+        return None, None
+    columns = list(dict.fromkeys(['_id', *fields]))
+    projection = dict.fromkeys(columns, 1)
+    if any(field in SLIM_FIELDS for field in fields):
+        # Version 2 rows are filled back in from their song, found through these fields
+        projection.update(dict.fromkeys(HYDRATION_FIELDS, 1))
+    if 'note' in fields:
+        # Notes are joined from the notes collection by title and author
+        projection.update(title=1, author=1)
+    return projection, columns
+
+def _group_records(documents, include_occurrences=False):
+    """
+    Group occurrences by title and author in Python, into the records of _song_pipeline.
+
+    :param documents: iterable of dict, the occurrences sorted by title, author and timestamp
+    :param include_occurrences: bool, also keep every occurrence of each song
+    :return: list of dict, per song its first occurrence, the LATEST_FIELDS of its latest occurrence,
+        the element-wise max of graph_values (truncated to the shortest list) and, if asked for, all_occurrences
+    """
+    records = {}
+    for document in documents:
+        key = (document['title'], document['author'])
+        graph_values = document.get('graph_values') or []
+        record = records.get(key)
+        if record is None:
+            record = records[key] = {'first': document, 'graph_values': graph_values}
+            if include_occurrences:
+                record['all_occurrences'] = []
+        else:
+            record['graph_values'] = [max(a, b) for a, b in zip(record['graph_values'], graph_values)]
+        record['latest'] = document
+        if include_occurrences:
+            record['all_occurrences'].append(document)
+    for record in records.values():
+        record['latest'] = {field: record['latest'][field] for field in LATEST_FIELDS if field in record['latest']}
+    return list(records.values())
+
+def _song_pipeline(match, include_occurrences=False):
+    """
+    Return the pipeline grouping occurrences by title and author, the server-side twin of _group_records.
+
+    :param match: dict, the filter selecting the occurrences
+    :param include_occurrences: bool, also push every occurrence of each song
+    :return: list of dict, the pipeline stages
+    """
+    group = {
+        '_id': {'title': '$title', 'author': '$author'},
+        'first': {'$first': '$$ROOT'},
+        'latest': {'$last': {field: f'${field}' for field in LATEST_FIELDS}},
+        'graph_values': {'$push': {'$ifNull': ['$graph_values', []]}},
+    }
+    if include_occurrences:
+        group['all_occurrences'] = {'$push': '$$ROOT'}
+
+    return [
+        {'$match': match},
+        {'$sort': _song_sort(match)},
+        {'$group': group},
+        # Element-wise max of graph_values, truncated to the shortest list like zip()
+        {'$set': {'graph_values': {'$reduce': {
+            'input': {'$slice': ['$graph_values', 1, {'$max': [{'$size': '$graph_values'}, 1]}]},
+            'initialValue': {'$arrayElemAt': ['$graph_values', 0]},
+            'in': {'$map': {
+                'input': {'$zip': {'inputs': ['$$value', '$$this']}},
+                'as': 'pair',
+                'in': {'$max': '$$pair'}
+            }}
+        }}}},
+        {'$sort': {'first.timestamp': 1, 'first._id': 1}},
+    ]
+
+def _song_sort(match):
+    """
+    Return the sort of a per-song pipeline, in the order of the compound (title, author, timestamp) indexes.
+
+    The field matched by equality comes first, so the sort is served by the index instead of blocking.
+    """
+    leading = [key for key in ('author', 'title') if key in match]
+    return {**dict.fromkeys(leading, 1), 'title': 1, 'author': 1, 'timestamp': 1}
+
+def _empty_bucket(month):
+    """
+    Return the aligned, empty arrays of a monthly time-series bucket.
+    """
+    year, month_number = int(month[:4]), int(month[5:7])
+    days = calendar.monthrange(year, month_number)[1]
+    return {
+        'date': [f'{month}-{day:02d}' for day in range(1, days + 1)],
+        'total': [None] * days,
+        'daily': [None] * days,
+        'popularity': [None] * days
+    }
+
+def _chart_ranks(documents):
+    """
+    Return the chart position of every song in one day's documents.
+
+    The rank field is used when present, otherwise the position in insertion (_id) order.
+    A song listed twice keeps its best rank.
+
+    :param documents: iterable of dict, the documents of one day with _id, title, author and rank
+    :return: dict, rank per (title, author)
+    """
+    ranks = {}
+    for position, document in enumerate(sorted(documents, key=lambda document: str(document['_id'])), start=1):
+        rank = document.get('rank')
+        rank = int(rank) if isinstance(rank, (int, float)) and not isinstance(rank, bool) else position
+        song = (document.get('title'), document.get('author'))
+        ranks[song] = min(rank, ranks.get(song, rank))
+    return ranks
+
+def _compare_charts(previous, current):
+    """
+    Compare two charts song by song.
+
+    change is previous_rank - rank, so a song climbing the chart has a positive change.
+
+    :param previous: dict, rank per (title, author) on the earlier day
+    :param current: dict, rank per (title, author) on the later day
+    :return: list of dict, one movement per song on either chart with title, author, rank,
+        previous_rank, change and status ('new', 'dropped', 'up', 'down' or 'same')
+    """
+    movements = []
+    for song in current.keys() | previous.keys():
+        rank, previous_rank = current.get(song), previous.get(song)
+        if previous_rank is None:
+            change, status = None, 'new'
+        elif rank is None:
+            change, status = None, 'dropped'
+        else:
+            change = previous_rank - rank
+            status = 'up' if change > 0 else 'down' if change < 0 else 'same'
+        movements.append({
+            'title': song[0], 'author': song[1], 'rank': rank,
+            'previous_rank': previous_rank, 'change': change, 'status': status
+        })
+    return sorted(movements, key=lambda movement: (
+        movement['rank'] is None, movement['rank'] or movement['previous_rank'], str(movement['title']), str(movement['author'])
+    ))
+
+def _pending_ingests(state):
+    """
+    Split the in-progress ingests of the watermark document into live and expired tokens.
+    """
+    cutoff = datetime.now(timezone.utc) - PENDING_TIMEOUT
+    pending = (state or {}).get('pending') or {}
+    # MongoDB returns naive UTC datetimes
+    live = [token for token, started in pending.items() if _aware(started) > cutoff]
+    return live, [token for token in pending if token not in live]
+
+def _aware(value):
+    """
+    Return a datetime as timezone-aware, reading a naive one as UTC.
+    """
+    return value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value
+
+def _watermark(state):
+    """
+    Return the watermark recorded in the watermark document (0 before the first ingest).
+    """
+    if not state:
+        return 0
+    live, _ = _pending_ingests(state)
+    return state.get('stable', 0) if live else state['seq']
+
+def _day_range(day):
+    """
+    Return the timestamp filter of a 'YYYY-MM-DD' day.
+    """
+    start = datetime.strptime(day, '%Y-%m-%d')
+    return {'$gte': start, '$lt': start + timedelta(days=1)}
+
+def _retry_upserts(collection, operations, error):
+    """
+    Retry the upserts of an unordered bulk write that lost an insert race.
+
+    A concurrent or retried ingest of the same (title, author, timestamp) inserted the document
+    first and the unique index rejected the second insert; the retry updates that document.
+
+    :param collection: the collection written to
+    :param operations: list of UpdateOne, the upserts of the bulk write
+    :param error: BulkWriteError, the error of the bulk write
+    :return: BulkWriteResult, the combined result of the bulk write and its retry
+    """
+    details = error.details
+    if any(write_error['code'] != 11000 for write_error in details['writeErrors']):
+        raise error
+    positions = [write_error['index'] for write_error in details['writeErrors']]
+    retried = collection.bulk_write([operations[position] for position in positions], ordered=False).bulk_api_result
+    combined = dict(details, writeErrors=[])
+    for field in ('nMatched', 'nModified', 'nUpserted'):
+        combined[field] = details.get(field, 0) + retried.get(field, 0)
+    combined['upserted'] = details.get('upserted', []) + [
+        dict(upserted, index=positions[upserted['index']]) for upserted in retried.get('upserted', [])
+    ]
+    return BulkWriteResult(combined, True)
+
+_shared_clients = {}
+_shared_clients_lock = threading.Lock()
+
+
+def get_shared_client(connection_string, metrics=None, **options):
+    """
+    Return the process-wide MongoClient for a connection string, creating it on first use.
+
+    Every DataLib in the process with the same options shares the client and its connection pool.
+    The client connects lazily, on its first operation, so connection errors surface there. Its
+    commands are recorded in the registries of every DataLib using it with metrics.
+
+    :param connection_string: str, the connection string for MongoDB Atlas
+    :param metrics: MetricsRegistry, also record the client's commands in this registry
+    :param options: MongoClient options, e.g. from td_rawbson.client_options
+    :return: MongoClient, the shared client
+    """
+    key = (connection_string, tuple(sorted(options.items())))
+    with _shared_clients_lock:
+        shared = _shared_clients.get(key)
+        if shared is None:
+            listener = CommandMetricsListener()
+            client = MongoClient(connection_string, server_api=ServerApi('1'), connect=False, event_listeners=[listener], **options)
+            shared = _shared_clients[key] = (client, listener)
+    client, listener = shared
+    if metrics is not None:
+        listener.add(metrics)
+    return client
+
+
+def _shared_listener(client):
+    """
+    Return the command listener of a client made by get_shared_client (None for any other client).
+    """
+    with _shared_clients_lock:
+        for shared_client, listener in _shared_clients.values():
+            if shared_client is client:
+                return listener
+    return None
+
+
+@instrument
+class DataLib:
+    def __init__(self, connection_string, create_indexes=False, cache=None, distributors=None, db_name='music_trends', client=None, metrics=None, storage=None, columnar_dir=None,
+                 compressors=None, zlib_compression_level=None, max_pool_size=None, min_pool_size=None, max_idle_time_ms=None, raw_reads=False,
+                 forecast=False):
+        """
+        Initialize the DataLib with MongoDB connection.
+
+        :param connection_string: str, the connection string for MongoDB Atlas
+        :param create_indexes: bool, create the indexes in INDEX_SPEC on startup
+        :param cache: QueryCache or bool, cache read queries (True uses a default QueryCache)
+        :param distributors: list of str, the distributor names tagged at ingest (defaults to DEFAULT_DISTRIBUTORS)
+        :param db_name: str, the database holding the collections
+        :param client: MongoClient-compatible client to use instead of the shared client for connection_string
+        :param metrics: MetricsRegistry or bool, record method and command latencies (True uses a new MetricsRegistry);
+            commands are only recorded on the shared client
+        :param storage: MongoStorage or MemoryStorage, the storage backend to use instead of MongoDB
+            (connection_string, db_name and client are then ignored)
+        :param columnar_dir: str, the directory ingest_files keeps a columnar export in (see export_columnar)
+        :param compressors: list of str, the wire compressors to offer the server, preferred first ('zstd', 'snappy', 'zlib');
+            pymongo skips zstd and snappy, with a warning, when their package is missing
+        :param zlib_compression_level: int, -1 to 9, the zlib level when zlib is negotiated
+        :param max_pool_size: int, the maximum number of connections per server
+        :param min_pool_size: int, the number of connections kept open per server
+        :param max_idle_time_ms: int, the milliseconds a pooled connection may stay idle
+            (the compression and pool settings apply to the shared client only)
+        :param raw_reads: bool, read get_song_data, iter_date_range and filter_by_date_range through raw BSON
+            batches by default (see their raw parameter)
+        :param forecast: bool, score every day written by an ingest with the local forecaster, into the
+            forecast_rank_next_day and forecast_streams fields (see forecast_day); the ingested
+            expected_rank_next_day and AI predicted data are left as they are
+        """
+        self.metrics = MetricsRegistry() if metrics is True else metrics or None
+        if storage is None:
+            if client is None:
+                options = client_options(compressors, zlib_compression_level, max_pool_size, min_pool_size, max_idle_time_ms)
+                client = get_shared_client(connection_string, self.metrics, **options)
+            storage = MongoStorage(client, db_name)
+        self.storage = storage
+        self.client = getattr(storage, 'client', None)
+        self.db_name = storage.db_name
+        self.collection_name = 'daily_trends'
+        self.timeseries_collection_name = 'song_timeseries'
+        self.movements_collection_name = 'rank_movements'
+        self.meta_collection_name = 'datalib_meta'
+        self.notes_collection_name = 'song_notes'
+        self.catalog_collection_name = 'song_catalog'
+        self.db = getattr(storage, 'db', None)
+        self.cache = QueryCache() if cache is True else cache or None
+        self.distributor_matcher = DistributorMatcher(distributors)
+        self.columnar_dir = columnar_dir
+        self.raw_reads = raw_reads
+        self.forecast = forecast
+        # Days written since the last columnar export
+        self._dirty_days = set()
+        self._dirty_days_lock = threading.Lock()
+        # Serializes movement updates, so the last one sees every write
+        self._movements_lock = threading.Lock()
+        # Whether the indexes the upserts rely on were created (see _ensure_upsert_indexes)
+        self._indexes_ensured = False
+        self._indexes_lock = threading.Lock()
+        # The watermark the query cache was last synced to (see sync_cache)
+        self._synced_watermark = None
+        # The DataLib a memory replica refreshes from on sync_cache (see memory_replica)
+        self._replica_source = None
+        self._sync_lock = threading.Lock()
+        # Built on the first search, then kept up to date by ingests
+        self._search_index = None
+        self._search_lock = threading.Lock()
+        self._similarity_index = None
+        self._similarity_lock = threading.Lock()
+        # The schema version of the trends collection, once known to be the latest
+        self._schema_version = None
+
+        if create_indexes:
+            self.ensure_indexes()
+
+    def ensure_indexes(self):
+        """
+        Create the indexes declared in INDEX_SPEC.
+
+        Existing indexes are left untouched, except one declared with other options than it was
+        created with (e.g. made unique since), which is dropped and created again.
+
+        :return: dict, the index names per collection
+        """
+        created = {}
+        for attribute, indexes in INDEX_SPEC.items():
+            collection_name = getattr(self, attribute)
+            collection = self.storage.collection(collection_name)
+            models = [IndexModel(index['keys'], name=index['name'], **index.get('options', {})) for index in indexes]
+            try:
+                created[collection_name] = collection.create_indexes(models)
+            except OperationFailure as e:
+                if e.code not in INDEX_CONFLICT_CODES:
+                    raise
+                created[collection_name] = [self._replace_index(collection, model) for model in models]
+            print(f"Ensured indexes {created[collection_name]} on the collection {collection_name}")
+        self._indexes_ensured = True
+        return created
+
+    def _ensure_upsert_indexes(self):
+        """
+        Create the indexes in INDEX_SPEC before the first write of this DataLib, if not done yet.
+
+        Upserts keyed on (title, author, timestamp), (title, author, month) and the like only update
+        one document per key when a unique index backs the key: without it, concurrent or retried
+        ingests silently insert duplicates. An index that cannot be built (e.g. a unique index over
+        existing duplicates) raises, so the write is refused.
+        """
+        if self._indexes_ensured:
+            return
+        with self._indexes_lock:
+            if not self._indexes_ensured:
+                self.ensure_indexes()
+
+    @staticmethod
+    def _replace_index(collection, model):
+        """
+        Create an index, replacing an existing index with the same name or keys but other options.
+
+        If the new index cannot be built (e.g. a unique index over duplicate documents), the old one is restored.
+
+        :return: str, the index name
+        """
+        try:
+            return collection.create_indexes([model])[0]
+        except OperationFailure as e:
+            if e.code not in INDEX_CONFLICT_CODES:
+                raise
+        wanted = model.document
+        keys = list(wanted['key'].items())
+        name, old = next(
+            (name, info) for name, info in collection.index_information().items()
+            if name == wanted['name'] or info['key'] == keys
+        )
+        print(f"Replacing the index {name} of the collection {collection.name} to match INDEX_SPEC")
+        collection.drop_index(name)
+        try:
+            return collection.create_indexes([model])[0]
+        except OperationFailure as e:
+            options = {option: value for option, value in old.items() if option not in ('key', 'v', 'ns')}
+            collection.create_indexes([IndexModel(old['key'], name=name, **options)])
+            raise ValueError(f"Could not create the index {wanted['name']} on {collection.name}: {e}") from e
+
+    def memory_replica(self, **kwargs):
+        """
+        Load the collections into an in-memory storage and return a DataLib reading from it.
+
+        The replica's sync_cache pulls the writes made to this DataLib's storage since the last sync,
+        including those of other processes; writes to the replica itself are not propagated back.
+
+        :param kwargs: passed to the replica DataLib (e.g. cache, metrics)
+        :return: DataLib, the replica
+        """
+        # Taken before loading, so the first sync re-copies whatever is written during the load
+        watermark = self.get_watermark()
+        storage = MemoryStorage.from_storage(self.storage, self._collection_names())
+        replica = DataLib(None, distributors=self.distributor_matcher.distributors, storage=storage, **kwargs)
+        replica._replica_source = self
+        replica._synced_watermark = watermark
+        return replica
+
+    def _collection_names(self):
+        """
+        Return the names of every collection DataLib keeps.
+        """
+        return [self.collection_name, self.timeseries_collection_name, self.movements_collection_name,
+                self.meta_collection_name, self.notes_collection_name, self.catalog_collection_name]
+
+    def _refresh_replica(self, last):
+        """
+        Copy the writes the replica source recorded after a watermark into this memory replica.
+
+        The days written to are copied whole, with their rank movements and those of the following
+        day, and the timeseries, catalog and notes of every song written or deleted. The meta
+        documents are copied last, so the replica's watermark never runs ahead of its data.
+        Everything is reloaded after a delete_all_songs, or when deletion records since the last
+        sync have been pruned.
+
+        :param last: int, the watermark of the previous sync
+        """
+        source = self._replica_source
+        source_meta = source.storage.collection(source.meta_collection_name)
+        state = source_meta.find_one({'_id': WATERMARK_ID})
+        current = _watermark(state)
+        if current <= last:
+            return
+        deletions = list(source_meta.find({'deletion_seq': {'$gt': last, '$lte': current}}))
+        if state.get('deletions_pruned', 0) > last or any(deletion.get('all') for deletion in deletions):
+            for name in self._collection_names():
+                self.storage.load(name, source.storage.collection(name).find({}))
+            return
+
+        trends = self.storage.collection(self.collection_name)
+        written = source.storage.collection(source.collection_name).find(
+            {'ingest_seq': {'$gt': last, '$lte': current}}, {'title': 1, 'author': 1, 'timestamp': 1}
+        )
+        songs, days = set(), set()
+        for document in written:
+            songs.add((document['title'], document['author']))
+            days.add(_date_key(document['timestamp']))
+        for deletion in deletions:
+            for title, author in deletion.get('songs', []):
+                songs.add((title, author))
+                # The deleted snapshots are only known to the replica's own copy
+                days.update(_date_key(document['timestamp']) for document in trends.find({'title': title, 'author': author}, {'timestamp': 1}))
+        days.discard(None)
+        days.update(filter(None, (source._adjacent_day(day, later=True) for day in days)))
+
+        for day in days:
+            self._copy_from_source(self.collection_name, {'timestamp': _day_range(day)})
+            self._copy_from_source(self.movements_collection_name, {'day': day})
+        for title, author in songs:
+            for name in (self.timeseries_collection_name, self.catalog_collection_name, self.notes_collection_name):
+                self._copy_from_source(name, {'title': title, 'author': author})
+
+        # The watermark state read first, the other non-deletion documents (e.g. the schema version) and the new deletions
+        meta = self.storage.collection(self.meta_collection_name)
+        documents = [state, *source_meta.find({'deletion_seq': {'$exists': False}, '_id': {'$ne': WATERMARK_ID}}), *deletions]
+        meta.delete_many({'_id': {'$in': [document['_id'] for document in documents]}})
+        # The deletions up to the last sync were applied by it
+        meta.delete_many({'deletion_seq': {'$lte': last}})
+        meta.insert_many(documents)
+
+    def _copy_from_source(self, name, filter):
+        """
+        Replace the documents of a replica collection matching a filter with those of the replica source.
+        """
+        documents = list(self._replica_source.storage.collection(name).find(filter))
+        collection = self.storage.collection(name)
+        collection.delete_many(filter)
+        if documents:
+            collection.insert_many(documents)
+
+    def explain_report(self):
+        """
+        Explain the query of each DataLib method and report whether it is served by an index.
+
+        :return: dict, per method the plan stages, the indexes used and whether the query is index-covered
+            (empty for storages without a query planner)
+        """
+        if not self.storage.server_side:
+            return {}
+        collection = self.storage.collection(self.collection_name)
+        sample = collection.find_one({}, {'title': 1, 'author': 1, 'timestamp': 1}) or {}
+        report = {}
+        for method, shape in QUERY_SHAPES.items():
+            if 'distinct' in shape:
+                explained = self.db.command('explain', {'distinct': self.collection_name, 'key': shape['distinct']}, verbosity='queryPlanner')
+            else:
+                cursor = collection.find(self._bind_sample(shape['filter'], sample))
+                if shape.get('sort'):
+                    cursor = cursor.sort(shape['sort'])
+                explained = cursor.explain()
+
+            stages, indexes = [], []
+            self._collect_plan(explained.get('queryPlanner', {}).get('winningPlan', {}), stages, indexes)
+            report[method] = {
+                'stages': stages,
+                'indexes': indexes,
+                'covered': 'COLLSCAN' not in stages and 'SORT' not in stages
+            }
+        return report
+
+    @staticmethod
+    def _bind_sample(query, sample):
+        """
+        Replace '$field' placeholders in a query shape with values from a sample document.
+        """
+        if isinstance(query, dict):
+            return {key: DataLib._bind_sample(value, sample) for key, value in query.items()}
+        if isinstance(query, str) and query.startswith('$'):
+            return sample.get(query[1:])
+        return query
+
+    @staticmethod
+    def _collect_plan(plan, stages, indexes):
+        """
+        Walk a query plan tree collecting the stage and index names.
+        """
+        if isinstance(plan, list):
+            for child in plan:
+                DataLib._collect_plan(child, stages, indexes)
+            return
+        if not isinstance(plan, dict):
+            return
+        if 'stage' in plan:
+            stages.append(plan['stage'])
+        if 'indexName' in plan:
+            indexes.append(plan['indexName'])
+        for key in ('inputStage', 'inputStages', 'queryPlan'):
+            if key in plan:
+                DataLib._collect_plan(plan[key], stages, indexes)
+
+    def upload_data(self, data):
+        """
+        Upload data to the collection.
+
+        Documents already in the collection (same title, author and timestamp) are rejected by the
+        unique index; use upsert_data to write data that may have been uploaded before.
+
+        :param data: list of dict, the data to upload
+        """
+        collection = self.storage.collection(self.collection_name)
+        token, seq = self._begin_ingest()
+        try:
+            # Process the new data structure
+            for item in data:
+                self._prepare_document(item)
+                item['ingest_seq'] = seq
+
+            rows = self._rows(data)
+            collection.insert_many(rows)
+            for item, row in zip(data, rows):
+                item['_id'] = row['_id']
+            self._after_ingest(data, seq)
+        finally:
+            self._end_ingest(token)
+        print(f"Inserted {len(data)} documents into the collection {self.collection_name}")
+
+    def upsert_data(self, data):
+        """
+        Upsert data into the collection with one unordered bulk write, keyed on (title, author, timestamp).
+
+        Uploading the same data again updates the existing documents instead of duplicating them.
+
+        :param data: list of dict, the data to upsert
+        :return: pymongo.results.BulkWriteResult, the result of the bulk write
+        """
+        return self._upsert(data)
+
+    def _upsert(self, data, deferred_days=None):
+        """
+        Upsert one chunk of data (see upsert_data).
+
+        :param data: list of dict, the data to upsert
+        :param deferred_days: set, collects the written days instead of updating their movements and
+            forecasts, for an ingest that updates them once at the end (see _update_days)
+        :return: pymongo.results.BulkWriteResult, the result of the bulk write
+        """
+        collection = self.storage.collection(self.collection_name)
+        token, seq = self._begin_ingest()
+        try:
+            for item in data:
+                self._prepare_document(item)
+                item['ingest_seq'] = seq
+
+            operations = []
+            for row in self._rows(data):
+                key = {'title': row.get('title'), 'author': row.get('author'), 'timestamp': row.get('timestamp')}
+                update = {'$set': row}
+                if row.get('schema_version') == SCHEMA_VERSION:
+                    # Drop the fields a version 1 document of the same song and day still has
+                    update['$unset'] = dict.fromkeys(SLIM_FIELDS, '')
+                operations.append(UpdateOne(key, update, upsert=True))
+
+            try:
+                result = collection.bulk_write(operations, ordered=False)
+            except BulkWriteError as e:
+                result = _retry_upserts(collection, operations, e)
+            self._after_ingest(data, seq, deferred_days)
+        finally:
+            self._end_ingest(token)
+        return result
+
+    def _begin_ingest(self):
+        """
+        Allocate the sequence number of an ingest and mark it as in progress.
+
+        Both happen in one atomic update, so a reader never sees a sequence number
+        whose documents may still be written without also seeing it pending.
+
+        :return: tuple, (the token ending the ingest, the sequence number)
+        """
+        # Every write path allocates a sequence number first
+        self._ensure_upsert_indexes()
+        token = uuid.uuid4().hex
+        state = self.storage.collection(self.meta_collection_name).find_one_and_update(
+            {'_id': WATERMARK_ID},
+            {'$inc': {'seq': 1}, '$set': {f'pending.{token}': datetime.now(timezone.utc)}},
+            upsert=True, return_document=ReturnDocument.AFTER
+        )
+        return token, state['seq']
+
+    def _heartbeat_ingest(self, token):
+        """
+        Refresh the start time of an ingest in progress, so a long one is not taken for crashed.
+        """
+        self.storage.collection(self.meta_collection_name).find_one_and_update(
+            {'_id': WATERMARK_ID}, {'$set': {f'pending.{token}': datetime.now(timezone.utc)}}
+        )
+
+    def _end_ingest(self, token):
+        """
+        Mark an ingest as finished, advancing the stable watermark once no ingest is in progress.
+        """
+        meta = self.storage.collection(self.meta_collection_name)
+        state = meta.find_one_and_update(
+            {'_id': WATERMARK_ID}, {'$unset': {f'pending.{token}': ''}}, return_document=ReturnDocument.AFTER
+        )
+        if state is None:
+            return
+        live, expired = _pending_ingests(state)
+        if not live:
+            # Every sequence number up to seq has been written
+            update = {'$max': {'stable': state['seq']}}
+            if expired:
+                update['$unset'] = {f'pending.{token}': '' for token in expired}
+            meta.find_one_and_update({'_id': WATERMARK_ID}, update)
+
+    def _prepare_document(self, item):
+        """
+        Normalize a raw item before it is written to the collection.
+
+        :param item: dict, the item to normalize in place
+        :return: dict, the normalized item
+        """
+        # Convert timestamp to datetime object if it's a string
+        if isinstance(item.get('timestamp'), str):
+            item['timestamp'] = datetime.fromisoformat(item['timestamp'].replace('Z', '+00:00'))
+
+        # Ensure new fields are included
+        item['AI predicted data'] = item.get('AI predicted data', {})
+        item['expected_rank_next_day'] = item.get('expected_rank_next_day')
+
+        # Distributors named in the description, so filtering is an indexed query
+        item['distributors'] = self.distributor_matcher.match(item.get('description'))
+        return item
+
+    def _rows(self, data):
+        """
+        Return the rows to write for prepared items, in the schema version of the collection.
+
+        Version 2 rows leave out the catalog fields, which are written to the catalog
+        collection here, and the stream history, which _update_timeseries keeps.
+
+        :param data: list of dict, the prepared items (left unchanged)
+        :return: list of dict, the rows (the items themselves for version 1)
+        """
+        if self.get_schema_version() < SCHEMA_VERSION:
+            return data
+        self._write_catalog(data)
+        return [split_document(item)[1] for item in data]
+
+    def _write_catalog(self, data):
+        """
+        Upsert the catalog entries of the given documents into the catalog collection.
+
+        An entry only replaces one taken from a document of the same day or older, so
+        ingesting an old file does not roll a song's catalog entry back.
+
+        :param data: list of dict, documents with their catalog fields
+        """
+        entries = {}
+        # Later documents overwrite the entries of earlier ones
+        for document in sorted(data, key=lambda item: _date_key(item.get('timestamp')) or ''):
+            entry, _ = split_document(document)
+            if entry:
+                entries[(document.get('title'), document.get('author'))] = (entry, document.get('timestamp'))
+        if not entries:
+            return
+
+        operations = []
+        for (title, author), (entry, timestamp) in entries.items():
+            key = {'title': title, 'author': author}
+            if timestamp is not None:
+                key['timestamp'] = {'$lte': timestamp}
+            operations.append(UpdateOne(key, {'$set': {**entry, 'timestamp': timestamp}}, upsert=True))
+        try:
+            self.storage.collection(self.catalog_collection_name).bulk_write(operations, ordered=False)
+        except BulkWriteError as e:
+            # The song's entry comes from a newer document, so the upsert hit the unique index
+            if any(error['code'] != 11000 for error in e.details['writeErrors']):
+                raise
+
+    def get_schema_version(self):
+        """
+        Return the schema version of the rows ingests write to the trends collection.
+
+        :return: int, 1 until migrate_schema runs, then SCHEMA_VERSION
+        """
+        if self._schema_version is None:
+            state = self.storage.collection(self.meta_collection_name).find_one({'_id': SCHEMA_ID})
+            version = state.get('version', 1) if state else 1
+            if version < SCHEMA_VERSION:
+                # Another process may migrate the collection, so this is read again next time
+                return version
+            self._schema_version = version
+        return self._schema_version
+
+    def migrate_schema(self, batch_size=1000):
+        """
+        Migrate the trends collection to the compact schema version 2, batch by batch.
+
+        The static fields of each song move to the catalog collection and its stream history
+        to the time-series collection, then are dropped from the daily rows. Ingests write
+        version 2 rows from the start, and the migration is resumable: running it again only
+        migrates the rows left in an older version.
+
+        :param batch_size: int, the number of documents migrated per bulk write
+        :return: str, confirmation message
+        """
+        self.ensure_indexes()
+        self.storage.collection(self.meta_collection_name).find_one_and_update(
+            {'_id': SCHEMA_ID}, {'$max': {'version': SCHEMA_VERSION}}, upsert=True
+        )
+        self._schema_version = None
+
+        collection = self.storage.collection(self.collection_name)
+        cursor = collection.find({'schema_version': {'$ne': SCHEMA_VERSION}}).sort('timestamp', ASCENDING).batch_size(batch_size)
+        count = 0
+        start = time.perf_counter()
+        for chunk in chunked(cursor, batch_size):
+            # Everything the rows lose is written elsewhere before they are slimmed down
+            self._write_catalog(chunk)
+            self._update_timeseries(chunk)
+            collection.bulk_write([
+                UpdateOne({'_id': document['_id']}, {
+                    '$set': {'schema_version': SCHEMA_VERSION}, '$unset': dict.fromkeys(SLIM_FIELDS, '')
+                })
+                for document in chunk
+            ], ordered=False)
+            count += len(chunk)
+            print(f"Migrated {count} documents to schema version {SCHEMA_VERSION}")
+        if self.cache is not None:
+            self.cache.clear()
+        return f'Migrated {count} documents to schema version {SCHEMA_VERSION} in {time.perf_counter() - start:.2f}s.'
+
+    def _hydrate(self, documents, stream_data=True):
+        """
+        Fill version 2 rows back in with their song's catalog fields and stream history, in place.
+
+        Takes one query to the catalog and one to the time series, whatever the number of rows.
+
+        :param documents: list of dict, the rows (rows of version 1 are left as they are)
+        :param stream_data: bool, also rebuild streamCountData
+        :return: list of dict, the same rows
+        """
+        slim = [document for document in documents if document.get('schema_version') == SCHEMA_VERSION]
+        if not slim:
+            return documents
+        songs = {(document.get('title'), document.get('author')) for document in slim}
+        query = {'title': {'$in': sorted({title for title, _ in songs}, key=str)}}
+
+        catalog = self.storage.collection(self.catalog_collection_name)
+        entries = {
+            (entry['title'], entry['author']): entry
+            for entry in catalog.find(query) if (entry['title'], entry['author']) in songs
+        }
+        histories = {}
+        if stream_data:
+            days = {day for day in map(_date_key, (document.get('timestamp') for document in slim)) if day}
+            histories = self._stream_histories(songs, days)
+
+        for document in slim:
+            song = (document.get('title'), document.get('author'))
+            merge_catalog(document, entries.get(song))
+            if stream_data and 'streamCountData' not in document:
+                day = _date_key(document.get('timestamp'))
+                history = histories.get(song)
+                document['streamCountData'] = stream_window(history, day) if history and day else {}
+        return documents
+
+    def _stream_histories(self, songs, days, history_days=STREAM_HISTORY_DAYS):
+        """
+        Fetch the stream history of many songs around the given days from the time series, in one query.
+
+        :param songs: set of tuple, the (title, author) of the songs
+        :param days: iterable of str, the days in 'YYYY-MM-DD' format
+        :param history_days: int, the number of days of history needed up to each day
+        :return: dict, per (title, author) its (dates, totals, dailies) (songs without buckets are left out)
+        """
+        months = history_months(days, history_days)
+        if not months or not songs:
+            return {}
+        buckets = {}
+        timeseries = self.storage.collection(self.timeseries_collection_name)
+        query = {'title': {'$in': sorted({title for title, _ in songs}, key=str)}, 'month': {'$gte': months[0], '$lte': months[1]}}
+        for bucket in timeseries.find(query):
+            song = (bucket['title'], bucket['author'])
+            if song in songs:
+                buckets.setdefault(song, []).append(bucket)
+        return {song: stream_history(song_buckets) for song, song_buckets in buckets.items()}
+
+    def _hydrated(self, documents, fields=None, chunk_size=1000):
+        """
+        Yield documents with version 2 rows filled back in, chunk by chunk.
+
+        :param documents: iterable of dict, e.g. a cursor
+        :param fields: list of str, the fields read from the documents (all fields if omitted);
+            rows are only filled in if a field they leave out is read
+        :param chunk_size: int, the number of rows filled in per query
+        :return: iterator of dict, the documents
+        """
+        wanted = SLIM_FIELDS if not fields else [field for field in fields if field in SLIM_FIELDS]
+        if not wanted:
+            yield from documents
+            return
+        for chunk in chunked(documents, chunk_size):
+            yield from self._hydrate(chunk, 'streamCountData' in wanted)
+
+    def _noted(self, documents, fields=None, chunk_size=1000):
+        """
+        Yield documents with their note set from the notes collection, chunk by chunk, like _attach_notes.
+
+        Documents without an entry keep the note embedded in their snapshot, if any.
+
+        :param documents: iterable of dict, e.g. a cursor, with title and author
+        :param fields: list of str, the fields read from the documents (all fields if omitted);
+            notes are only joined if the note field is read
+        :param chunk_size: int, the number of documents annotated per query
+        :return: iterator of dict, the documents
+        """
+        if fields and 'note' not in fields:
+            yield from documents
+            return
+        collection = self.storage.collection(self.notes_collection_name)
+        for chunk in chunked(documents, chunk_size):
+            titles = list({document['title'] for document in chunk})
+            notes = {
+                (document['title'], document['author']): document.get('note')
+                for document in collection.find({'title': {'$in': titles}}, {'title': 1, 'author': 1, 'note': 1, '_id': 0})
+            }
+            for document in chunk:
+                key = (document['title'], document['author'])
+                if key in notes:
+                    document['note'] = notes[key]
+            yield from chunk
+
+    def _after_ingest(self, data, seq=None, deferred_days=None):
+        """
+        Update everything derived from the collection after documents were written.
+
+        :param data: list of dict, the written documents
+        :param seq: int, the sequence number of the ingest
+        :param deferred_days: set, collects the written days instead of updating their movements and forecasts
+        """
+        days = {day for day in map(_date_key, (item.get('timestamp') for item in data)) if day}
+        self._update_timeseries(data)
+        if deferred_days is None:
+            self._update_days(days, seq)
+        else:
+            deferred_days.update(days)
+        for index in self._song_indexes():
+            index.add(data)
+        self._invalidate(data, 'snapshots', 'artists', 'movements')
+        with self._dirty_days_lock:
+            self._dirty_days.update(days)
+
+    def _update_days(self, days, seq=None, token=None):
+        """
+        Update the rank movements and, if enabled, the forecasts of whole snapshot days.
+
+        Both read the full day, so a chunked ingest runs this once over all its days rather than per chunk.
+
+        :param days: iterable of str, the days written to, in 'YYYY-MM-DD' format
+        :param seq: int, the ingest sequence number stamped on the documents the forecaster updates
+        :param token: str, the token of the ingest in progress, refreshed after each day
+        """
+        days = sorted(days)
+        heartbeat = partial(self._heartbeat_ingest, token) if token else None
+        self._update_movements(days, heartbeat)
+        if self.forecast:
+            for day in days:
+                self._forecast(day, seq=seq)
+                if heartbeat:
+                    heartbeat()
+        self._invalidate([], 'movements')
+
+    def _update_timeseries(self, data):
+        """
+        Merge the stream counts and popularity of the given documents into the time-series collection.
+
+        Each song has one bucket per month whose date/total/daily/popularity arrays hold one
+        slot per day of the month, so merging is a positional $set and needs no read.
+
+        :param data: list of dict, the ingested documents
+        """
+        buckets = {}
+        # Later snapshots overwrite the stream counts repeated in earlier ones
+        for document in sorted(data, key=lambda item: _date_key(item.get('timestamp')) or ''):
+            song = (document.get('title'), document.get('author'))
+            points = []
+            stream_data = document.get('streamCountData') or {}
+            for date, counts in stream_data.items():
+                if isinstance(counts, dict):
+                    points.append((date, 'total', counts.get('total')))
+                    points.append((date, 'daily', counts.get('daily')))
+            points.append((document.get('timestamp'), 'popularity', document.get('popularity')))
+
+            for date, field, value in points:
+                day = _date_key(date)
+                if day is None or value is None:
+                    continue
+                updates = buckets.setdefault((*song, day[:7]), {})
+                updates[f'{field}.{int(day[8:10]) - 1}'] = value
+
+        if not buckets:
+            return
+
+        collection = self.storage.collection(self.timeseries_collection_name)
+        keys = [{'title': title, 'author': author, 'month': month} for title, author, month in buckets]
+        try:
+            collection.bulk_write(
+                [UpdateOne(key, {'$setOnInsert': _empty_bucket(key['month'])}, upsert=True) for key in keys],
+                ordered=False
+            )
+        except BulkWriteError as e:
+            # A concurrent ingest created the same bucket first
+            if any(error['code'] != 11000 for error in e.details['writeErrors']):
+                raise
+        collection.bulk_write(
+            [UpdateOne(key, {'$set': updates}) for key, updates in zip(keys, buckets.values())],
+            ordered=False
+        )
+
+    def rebuild_timeseries(self, batch_size=1000):
+        """
+        Rebuild the time-series collection from every document in the trends collection.
+
+        Only possible before migrate_schema: version 2 rows keep no stream history of their own.
+
+        :param batch_size: int, the number of documents processed at a time
+        :return: str, confirmation message
+        """
+        if self.get_schema_version() >= SCHEMA_VERSION:
+            raise ValueError('The time series holds the only stream history of schema version 2 rows and cannot be rebuilt')
+        collection = self.storage.collection(self.collection_name)
+        self.storage.collection(self.timeseries_collection_name).delete_many({})
+        cursor = collection.find(
+            {}, {'title': 1, 'author': 1, 'timestamp': 1, 'popularity': 1, 'streamCountData': 1}
+        ).sort('timestamp', ASCENDING).batch_size(batch_size)
+
+        count = 0
+        for chunk in chunked(cursor, batch_size):
+            self._update_timeseries(chunk)
+            count += len(chunk)
+        self._invalidate([], 'history')
+        return f'Rebuilt the time series of {count} documents.'
+
+    def _forecast(self, day, documents=None, seq=None):
+        """
+        Predict the next-day rank and daily streams of every song on one day's chart, in one pass.
+
+        Each song's daily streams over the last HISTORY_DAYS days (from the time series, with
+        graph_values filling the gaps) get a log-linear trend, all songs at once. A least-squares
+        fit of log(rank) on the trends over the whole chart turns the extrapolated streams into
+        expected ranks. The predictions are written back with one bulk update, to forecast_rank_next_day
+        and forecast_streams ({'day_1': streams, ...}), next to the ingested predictions.
+
+        :param day: str, the day in 'YYYY-MM-DD' format
+        :param documents: iterable of dict, the day's documents with _id, title, author, rank and graph_values
+            (fetched if omitted)
+        :param seq: int, the ingest sequence number stamped on the updated documents, so changes_since sees them
+        :return: dict, the day, the number of songs scored and the seconds taken
+        """
+        started = time.perf_counter()
+        collection = self.storage.collection(self.collection_name)
+        if documents is None:
+            documents = collection.find({'timestamp': _day_range(day)}, {'title': 1, 'author': 1, 'rank': 1, 'graph_values': 1})
+        documents = list(documents)
+        if not documents:
+            return {'day': day, 'songs': 0, 'seconds': time.perf_counter() - started}
+
+        chart = _chart_ranks(documents)
+        songs = list(chart)
+        histories = self._stream_histories(set(songs), [day], HISTORY_DAYS)
+        # A song listed twice is scored once, with the graph_values of its first document
+        graphs = {}
+        for document in documents:
+            graphs.setdefault((document.get('title'), document.get('author')), document.get('graph_values'))
+        daily = daily_matrix([histories.get(song) for song in songs], [graphs[song] for song in songs], day)
+        ranks = np.array([chart[song] for song in songs], dtype=np.float64)
+        level, slope = fit_trends(daily)
+        expected = expected_ranks(ranks, level, slope, fit_chart(ranks, level, slope))
+        streams = np.rint(forecast_streams(level, slope))
+
+        predictions = {}
+        for song, rank, song_streams in zip(songs, expected, streams):
+            predicted = {} if np.isnan(song_streams[0]) else {
+                f'day_{index}': int(value) for index, value in enumerate(song_streams, start=1)
+            }
+            predictions[song] = {'forecast_rank_next_day': int(rank), 'forecast_streams': predicted}
+        operations = []
+        for document in documents:
+            update = dict(predictions[(document.get('title'), document.get('author'))])
+            if seq is not None:
+                update['ingest_seq'] = seq
+            operations.append(UpdateOne({'_id': document['_id']}, {'$set': update}))
+        collection.bulk_write(operations, ordered=False)
+        self._invalidate(documents, 'snapshots')
+
+        seconds = time.perf_counter() - started
+        if self.metrics is not None:
+            self.metrics.observe('datalib_forecast_seconds', seconds)
+        return {'day': day, 'songs': len(songs), 'seconds': seconds}
+
+    def forecast_day(self, date):
+        """
+        Recompute the next-day rank and stream predictions of one day's chart.
+
+        :param date: str, the date in 'YYYY-MM-DD' format
+        :return: dict, the day, the number of songs scored and the seconds taken
+        """
+        token, seq = self._begin_ingest()
+        try:
+            stats = self._forecast(date, seq=seq)
+        finally:
+            self._end_ingest(token)
+        print(f"Forecast {stats['songs']} songs for {date} in {stats['seconds'] * 1000:.0f} ms")
+        return stats
+
+    def backfill_forecasts(self, batch_size=1000):
+        """
+        Recompute the next-day rank and stream predictions of every snapshot day.
+
+        :param batch_size: int, the number of documents fetched per round trip
+        :return: str, confirmation message
+        """
+        collection = self.storage.collection(self.collection_name)
+        cursor = collection.find(
+            {}, {'title': 1, 'author': 1, 'rank': 1, 'graph_values': 1, 'timestamp': 1}
+        ).sort('timestamp', ASCENDING).batch_size(batch_size)
+        started = time.perf_counter()
+        days = songs = 0
+        token, seq = self._begin_ingest()
+        try:
+            for day, documents in groupby(cursor, key=lambda document: _date_key(document.get('timestamp'))):
+                if day is None:
+                    continue
+                songs += self._forecast(day, documents, seq)['songs']
+                days += 1
+                self._heartbeat_ingest(token)
+        finally:
+            self._end_ingest(token)
+        return f'Forecast {songs} songs over {days} days in {time.perf_counter() - started:.2f}s.'
+
+    def _chart(self, day):
+        """
+        Return the chart of one day.
+
+        :param day: str, the day in 'YYYY-MM-DD' format
+        :return: dict, rank per (title, author) (empty if the day has no snapshot)
+        """
+        collection = self.storage.collection(self.collection_name)
+        return _chart_ranks(collection.find({'timestamp': _day_range(day)}, {'title': 1, 'author': 1, 'rank': 1}))
+
+    def _adjacent_day(self, day, later=False):
+        """
+        Return the closest snapshot day before (or after) a day.
+
+        :return: str, the day in 'YYYY-MM-DD' format (None if there is none)
+        """
+        collection = self.storage.collection(self.collection_name)
+        bounds = _day_range(day)
+        query = {'timestamp': {'$gte': bounds['$lt']} if later else {'$lt': bounds['$gte']}}
+        document = collection.find_one(query, {'timestamp': 1, '_id': 0}, sort=[('timestamp', ASCENDING if later else DESCENDING)])
+        return _date_key(document['timestamp']) if document else None
+
+    def _write_movements(self, day, previous_day, movements):
+        """
+        Replace the stored movements of a day.
+        """
+        collection = self.storage.collection(self.movements_collection_name)
+        computed_at = datetime.now(timezone.utc)
+        if movements:
+            collection.bulk_write([
+                UpdateOne(
+                    {'day': day, 'title': movement['title'], 'author': movement['author']},
+                    {'$set': {**movement, 'previous_day': previous_day, 'computed_at': computed_at}},
+                    upsert=True
+                )
+                for movement in movements
+            ], ordered=False)
+        # Songs no longer on either chart
+        collection.delete_many({'day': day, 'computed_at': {'$lt': computed_at}})
+
+    def _update_movements(self, days, heartbeat=None):
+        """
+        Recompute the rank movements of the given days and of the snapshot day following each.
+
+        :param days: iterable of str, the days written to, in 'YYYY-MM-DD' format
+        :param heartbeat: callable, called after each day (see _heartbeat_ingest)
+        """
+        with self._movements_lock:
+            affected = set(days)
+            affected.update(filter(None, (self._adjacent_day(day, later=True) for day in days)))
+            charts = {}
+            for day in sorted(affected):
+                if day not in charts:
+                    charts[day] = self._chart(day)
+                previous_day = self._adjacent_day(day) if charts[day] else None
+                if previous_day is None:
+                    # Every snapshot of the day was deleted, or the first snapshot has nothing to move from
+                    self._write_movements(day, None, [])
+                else:
+                    if previous_day not in charts:
+                        charts[previous_day] = self._chart(previous_day)
+                    self._write_movements(day, previous_day, _compare_charts(charts[previous_day], charts[day]))
+                if heartbeat:
+                    heartbeat()
+
+    def rebuild_rank_movements(self, batch_size=1000):
+        """
+        Rebuild the rank movements collection from every snapshot day, one day at a time.
+
+        :param batch_size: int, the number of documents fetched per round trip
+        :return: str, confirmation message
+        """
+        collection = self.storage.collection(self.collection_name)
+        self.storage.collection(self.movements_collection_name).delete_many({})
+        cursor = collection.find(
+            {}, {'title': 1, 'author': 1, 'rank': 1, 'timestamp': 1}
+        ).sort('timestamp', ASCENDING).batch_size(batch_size)
+
+        previous_day = previous = None
+        days = 0
+        for day, documents in groupby(cursor, key=lambda document: _date_key(document.get('timestamp'))):
+            if day is None:
+                continue
+            chart = _chart_ranks(documents)
+            if previous_day is not None:
+                self._write_movements(day, previous_day, _compare_charts(previous, chart))
+            previous_day, previous = day, chart
+            days += 1
+        self._invalidate([], 'movements')
+        return f'Rebuilt the rank movements of {days} days.'
+
+    @cached({'movements'})
+    def get_rank_movements(self, date):
+        """
+        Retrieve the movements of every song on a day's chart relative to the previous snapshot day.
+
+        :param date: str, the date in 'YYYY-MM-DD' format
+        :return: pd.DataFrame, one row per song with title, author, rank, previous_rank, change, status
+            and previous_day, charted songs first by rank, then the songs that dropped off
+        """
+        collection = self.storage.collection(self.movements_collection_name)
+        columns = ['title', 'author', 'rank', 'previous_rank', 'change', 'status', 'previous_day']
+        movements = _frame_from_documents(collection.find({'day': date}, dict.fromkeys(columns, 1)), ['_id', *columns])
+        if movements.empty:
+            return movements.drop(columns='_id')
+        movements['order'] = movements['rank'].fillna(movements['previous_rank'] + len(movements))
+        return movements.sort_values(['order', 'title', 'author'], ignore_index=True).drop(columns=['_id', 'order'])
+
+    @cached({'movements'})
+    def get_biggest_movers(self, days=7, end_date=None, limit=10, direction='up'):
+        """
+        Retrieve the largest single-day rank changes over a window of days in one indexed read.
+
+        :param days: int, the length of the window in days
+        :param end_date: str, the last day of the window in 'YYYY-MM-DD' format (defaults to the latest snapshot day)
+        :param limit: int, the number of movements to return
+        :param direction: str, 'up' for the biggest climbers or 'down' for the biggest fallers
+        :return: pd.DataFrame, the movements with day, title, author, rank, previous_rank and change, biggest first
+        """
+        if direction not in ('up', 'down'):
+            raise ValueError("direction must be 'up' or 'down'")
+        if end_date is None:
+            latest = self.storage.collection(self.collection_name).find_one(
+                {}, {'timestamp': 1, '_id': 0}, sort=[('timestamp', DESCENDING)]
+            )
+            if not latest:
+                return pd.DataFrame()
+            end_date = _date_key(latest['timestamp'])
+        start_date = (datetime.strptime(end_date, '%Y-%m-%d') - timedelta(days=days - 1)).strftime('%Y-%m-%d')
+
+        columns = ['day', 'title', 'author', 'rank', 'previous_rank', 'change']
+        query = {'day': {'$gte': start_date, '$lte': end_date}, 'change': {'$gt': 0} if direction == 'up' else {'$lt': 0}}
+        collection = self.storage.collection(self.movements_collection_name)
+        # Walks the change_day index from the biggest change and stops after limit matches
+        cursor = collection.find(query, dict.fromkeys(columns, 1)).sort(
+            'change', DESCENDING if direction == 'up' else ASCENDING
+        ).limit(limit)
+        return _frame_from_documents(cursor, ['_id', *columns]).drop(columns='_id')
+
+    @cached(lambda self, title, author: {('title', title), ('author', author), 'history'})
+    def get_song_history(self, title, author):
+        """
+        Retrieve the full daily history of a song from the time-series collection in one indexed fetch.
+
+        :param title: str, the title of the song
+        :param author: str, the author of the song
+        :return: pd.DataFrame, one row per day with date, total, daily and popularity columns
+        """
+        collection = self.storage.collection(self.timeseries_collection_name)
+        buckets = list(collection.find({'title': title, 'author': author}).sort('month', ASCENDING))
+        history = pd.DataFrame({
+            field: [value for bucket in buckets for value in bucket[field]]
+            for field in ('date', 'total', 'daily', 'popularity')
+        })
+        history = history.dropna(how='all', subset=['total', 'daily', 'popularity']).reset_index(drop=True)
+        history['date'] = pd.to_datetime(history['date'])
+        return history
+
+    def get_watermark(self):
+        """
+        Return the ingest watermark: every document with an ingest_seq up to it has been fully written.
+
+        :return: int, the watermark (0 before the first ingest)
+        """
+        return _watermark(self.storage.collection(self.meta_collection_name).find_one({'_id': WATERMARK_ID}))
+
+    def changes_since(self, watermark=None, fields=None):
         """
-        Initialize a Song object with data.
+        Retrieve the documents written since a watermark, through the ingest_seq index.
 
-        :param data: dict, the song data
-        :param all_occurrences: list of dict, all occurrences of the song
+        Pass the returned watermark to the next call to only fetch the delta.
+
+        :param watermark: int, the watermark of the previous call (None fetches every document)
+        :param fields: list of str, the fields to fetch (all fields if omitted)
+        :return: tuple, (pd.DataFrame of the new or updated documents, the new watermark)
         """
-        self.id = data.get('_id')
-        self.title = data.get('title')
-        self.author = data.get('author')
-        self.graph_values = data.get('graph_values', [])
-        self.acousticness = data.get('acousticness')
-        self.danceability = data.get('danceability')
-        self.energy = data.get('energy')
-        self.instrumentalness = data.get('instrumentalness')
-        self.liveness = data.get('liveness')
-        self.speechiness = data.get('speechiness')
-        self.valence = data.get('valence')
-        self.popularity = data.get('popularity')
-        self.album = data.get('album')
-        self.release_date = data.get('release_date')
-        self.duration_ms = data.get('duration_ms')
-        self.timestamp = data.get('timestamp')
-        self.note = data.get('note')
-        self.all_occurrences = all_occurrences
-        
-        # New attributes
-        self.detail_url = data.get('detail_url')
-        self.interest_names = data.get('interest_names', [])
-        self.age_distribution = data.get('age_distribution', {})
-        self.top_regions = data.get('top_regions', [])
-        self.description = data.get('description')
-        self.streamCountData = data.get('streamCountData', {})
-        self.ai_predicted_data = data.get('AI predicted data', {})
-        self.expected_rank_next_day = data.get('expected_rank_next_day')
+        collection = self.storage.collection(self.collection_name)
+        current = self.get_watermark()
+        projection, columns = _projection(fields)
+        if watermark is None:
+            return _frame_from_documents(self._hydrated(collection.find({}, projection), fields), columns), current
+        if current <= watermark:
+            return _frame_from_documents([], columns), watermark
+        cursor = collection.find({'ingest_seq': {'$gt': watermark, '$lte': current}}, projection).sort('ingest_seq', ASCENDING)
+        return _frame_from_documents(self._hydrated(cursor, fields), columns), current
 
-    def graphs_7(self, index=0):
+    def watch_changes(self, watermark=None, fields=None, poll_interval=5.0):
         """
-        Return the graph data for the last 7 days for a specific occurrence.
+        Yield the documents written since a watermark as they arrive.
 
-        :param index: int, the index of the occurrence
-        :return: list, the graph values
+        Waits on a change stream on the watermark document when the server supports it
+        (replica sets and Atlas) and polls every poll_interval seconds otherwise.
+
+        :param watermark: int, the watermark to start from (None yields every document first)
+        :param fields: list of str, the fields to fetch (all fields if omitted)
+        :param poll_interval: float, the seconds between checks without a change stream
+        :return: generator of tuple, (pd.DataFrame of the new documents, the new watermark)
         """
-        return self.all_occurrences[index]['graph_values'] if self.all_occurrences else []
+        stream = None
+        if self.storage.server_side:
+            try:
+                stream = self.storage.collection(self.meta_collection_name).watch(
+                    [{'$match': {'documentKey._id': WATERMARK_ID}}], max_await_time_ms=int(poll_interval * 1000)
+                )
+            except OperationFailure:
+                # Change streams need a replica set: a standalone mongod is polled instead
+                stream = None
+        try:
+            while True:
+                changes, current = self.changes_since(watermark, fields)
+                if current != watermark:
+                    watermark = current
+                    yield changes, watermark
+                if stream is not None:
+                    stream.try_next()
+                else:
+                    time.sleep(poll_interval)
+        finally:
+            if stream is not None:
+                stream.close()
 
-    def __repr__(self):
-        return f"Song(ID={self.id}, Title={self.title}, Author={self.author})"
+    def sync_cache(self):
+        """
+        Invalidate the cached queries affected by writes since the last sync, including writes by other processes.
 
-class DataLib:
-    def __init__(self, connection_string):
+        The first call only records the watermark (and clears the cache, which may predate it).
+        A memory replica first copies those writes from its source (see memory_replica).
+
+        :return: int, the number of documents written since the last sync
         """
-        Initialize the DataLib with MongoDB connection.
+        with self._sync_lock:
+            last = self._synced_watermark
+            if last is None:
+                self._synced_watermark = self.get_watermark()
+                if self.cache is not None:
+                    self.cache.clear()
+                return 0
+            if self._replica_source is not None:
+                self._refresh_replica(last)
+            indexes = self._song_indexes()
+            fields = ['title', 'author', *(field for index in indexes for field in index.fields)]
+            changes, self._synced_watermark = self.changes_since(last, list(dict.fromkeys(fields)))
+            if self._synced_watermark > last:
+                self._apply_deletions(last, self._synced_watermark)
+        if not changes.empty:
+            documents = changes.to_dict('records')
+            for index in indexes:
+                index.add(documents)
+            self._invalidate(documents, 'snapshots', 'artists', 'movements')
+        return len(changes)
 
-        :param connection_string: str, the connection string for MongoDB Atlas
+    def _apply_deletions(self, last, current):
         """
-        self.client = MongoClient(connection_string, server_api=ServerApi('1'))
-        self.db_name = 'music_trends'
-        self.collection_name = 'daily_trends'
-        self.db = self.client[self.db_name]
+        Apply the deletions recorded by other processes between two watermarks to the query cache and song indexes.
+        """
+        meta = self.storage.collection(self.meta_collection_name)
+        state = meta.find_one({'_id': WATERMARK_ID}) or {}
+        if state.get('deletions_pruned', 0) > last:
+            # Some of the deletions since the last sync are no longer recorded
+            self._forget_songs()
+            return
+        for deletion in meta.find({'deletion_seq': {'$gt': last, '$lte': current}}):
+            if deletion.get('all'):
+                self._forget_songs()
+                continue
+            removed = [tuple(song) for song in deletion.get('removed', [])]
+            for index in self._song_indexes():
+                index.remove(removed)
+            self._invalidate(
+                [{'title': title, 'author': author} for title, author in deletion.get('songs', [])],
+                'snapshots', 'artists', 'movements', 'history'
+            )
 
-        # Test the connection
-        try:
-            self.client.admin.command('ping')
-            print("Pinged your deployment. You successfully connected to MongoDB!")
-        except Exception as e:
-            print(f"An error occurred: {e}")
+    def _forget_songs(self):
+        """
+        Drop the song indexes, the known schema version and the query cache, to be rebuilt on demand.
+        """
+        self._search_index = None
+        self._similarity_index = None
+        self._schema_version = None
+        if self.cache is not None:
+            self.cache.clear()
 
-    def upload_data(self, data):
+    def _song_indexes(self):
         """
-        Upload data to the collection.
+        Return the in-memory song indexes built so far, which ingests keep up to date.
+        """
+        return [index for index in (self._search_index, self._similarity_index) if index is not None]
 
-        :param data: list of dict, the data to upload
+    def build_search_index(self, batch_size=10000):
         """
-        collection = self.db[self.collection_name]
-        # Process the new data structure
-        for item in data:
-            # Convert timestamp to datetime object if it's a string
-            if isinstance(item.get('timestamp'), str):
-                item['timestamp'] = datetime.fromisoformat(item['timestamp'].replace('Z', '+00:00'))
-            
-            # Ensure new fields are included
-            item['AI predicted data'] = item.get('AI predicted data', {})
-            item['expected_rank_next_day'] = item.get('expected_rank_next_day')
-
-        collection.insert_many(data)
-        print(f"Inserted {len(data)} documents into the collection {self.collection_name}")
+        Build the in-memory search index from the collection, if it is not built yet.
+
+        search_songs builds it on first use; call this at startup to take the cost up front.
+
+        :param batch_size: int, the number of documents fetched per round trip
+        :return: SearchIndex, the index
+        """
+        with self._search_lock:
+            if self._search_index is None:
+                index = SearchIndex()
+                collection = self.storage.collection(self.collection_name)
+                projection, _ = _projection(['title', 'author', *index.fields])
+                cursor = collection.find({}, projection).sort('timestamp', ASCENDING).batch_size(batch_size)
+                # Oldest first, so each song ends up indexed with its latest text
+                index.add(self._hydrated(cursor, list(index.fields)))
+                self._search_index = index
+                print(f"Indexed {len(index)} songs for search")
+            return self._search_index
+
+    def build_similarity_index(self, batch_size=10000):
+        """
+        Build the in-memory audio-feature similarity index from the collection, if it is not built yet.
+
+        get_similar_songs builds it on first use; call this at startup to take the cost up front.
+
+        :param batch_size: int, the number of documents fetched per round trip
+        :return: SimilarityIndex, the index
+        """
+        with self._similarity_lock:
+            if self._similarity_index is None:
+                index = SimilarityIndex()
+                collection = self.storage.collection(self.collection_name)
+                projection, _ = _projection(['title', 'author', *index.fields])
+                cursor = collection.find({}, projection).sort('timestamp', ASCENDING).batch_size(batch_size)
+                # Oldest first, so each song ends up with its latest features
+                index.add(self._hydrated(cursor, index.fields))
+                self._similarity_index = index
+                print(f"Indexed the audio features of {len(index)} songs")
+            return self._similarity_index
+
+    def get_similar_songs(self, title, author, k=10, exclude_author=False):
+        """
+        Find the songs whose audio features are closest to a song's.
+
+        :param title: str, the title of the song
+        :param author: str, the author of the song
+        :param k: int, the number of similar songs
+        :param exclude_author: bool, only return songs by other artists
+        :return: pd.DataFrame, the similar songs with title, author and distance (in standard deviations), nearest first
+            (empty if the song is unknown or missing an audio feature)
+        """
+        neighbours = self.build_similarity_index().neighbours(title, author, k, exclude_author)
+        return pd.DataFrame(
+            [(song_title, song_author, distance) for (song_title, song_author), distance in neighbours],
+            columns=['title', 'author', 'distance']
+        )
+
+    def search_songs(self, query, limit=10):
+        """
+        Search songs by title, artist, album and description, tolerating typos and partial words.
+
+        :param query: str, the search text
+        :param limit: int, the number of results
+        :return: pd.DataFrame, the matching songs with title, author, album and score, best first
+        """
+        results = self.build_search_index().search(query, limit)
+        return pd.DataFrame(results, columns=['title', 'author', 'album', 'score'])
+
+    def cache_stats(self):
+        """
+        Return the hit/miss statistics of the query cache.
+
+        :return: dict, the cache statistics (empty if caching is disabled)
+        """
+        return self.cache.stats() if self.cache is not None else {}
+
+    def measure_command_bytes(self, enabled=True):
+        """
+        Record the BSON size of every MongoDB reply in the metrics, as mongodb_command_bytes.
+
+        Off by default: the listener re-encodes each reply to size it, which costs CPU on large
+        reads, so this is meant for a debug panel or a benchmark run.
+
+        :param enabled: bool, start (True) or stop (False) recording reply sizes
+        :return: bool, whether reply sizes can be recorded (only with metrics on the shared client)
+        """
+        listener = _shared_listener(self.client) if self.client is not None else None
+        if listener is None or self.metrics is None:
+            return False
+        listener.add(self.metrics, enabled)
+        return True
+
+    def metrics_stats(self, format='dict'):
+        """
+        Return the recorded method and command latencies.
+
+        :param format: str, 'dict' or 'prometheus' (the text exposition format)
+        :return: dict or str, the metrics (empty if metrics are disabled)
+        """
+        if self.metrics is None:
+            return {} if format == 'dict' else ''
+        return self.metrics.to_prometheus() if format == 'prometheus' else self.metrics.to_dict()
+
+    def _invalidate(self, documents, *tags):
+        """
+        Drop the cached queries affected by a write to the given songs.
 
-    def get_song_data(self):
+        :param documents: iterable of dict, the written documents (only title and author are used)
+        :param tags: the additional tags to invalidate
+        """
+        if self.cache is None:
+            return
+        affected = set(tags)
+        for document in documents:
+            affected.add(('author', document.get('author')))
+            affected.add(('title', document.get('title')))
+        self.cache.invalidate(affected)
+
+    @cached({'snapshots', 'notes'})
+    def get_song_data(self, fields=None, raw=None):
         """
         Retrieve song data from the collection.
 
+        :param fields: list of str, the fields to fetch (all fields if omitted)
+        :param raw: bool, read through raw BSON batches (defaults to the raw_reads setting, see _raw_frames)
         :return: pd.DataFrame, the song data as a pandas DataFrame
         """
-        collection = self.db[self.collection_name]
-        data = list(collection.find())
-        # Convert the _id field to a string
-        for record in data:
-            record['_id'] = str(record['_id'])
-        return pd.DataFrame(data)
+        collection = self.storage.collection(self.collection_name)
+        projection, columns = _projection(fields)
+        if self._use_raw(raw):
+            return concat_frames(self._raw_frames({}, fields), columns)
+        return _frame_from_documents(self._noted(self._hydrated(collection.find({}, projection), fields), fields), columns)
+
+    def iter_song_data(self, chunk_size=10000, fields=None, query=None, batch_size=None):
+        """
+        Stream song data from the collection as DataFrames of at most chunk_size rows.
+
+        Only one chunk is held in memory at a time, whatever the size of the collection.
+
+        :param chunk_size: int, the number of rows per DataFrame
+        :param fields: list of str, the fields to fetch (all fields if omitted)
+        :param query: dict, the filter selecting the documents (all documents if omitted)
+        :param batch_size: int, the number of documents per network round trip (defaults to chunk_size)
+        :return: iterator of pd.DataFrame, the song data in chunks
+        """
+        collection = self.storage.collection(self.collection_name)
+        projection, columns = _projection(fields)
+        cursor = collection.find(query or {}, projection).batch_size(batch_size or chunk_size)
+        return self._iter_frames(self._noted(self._hydrated(cursor, fields), fields), chunk_size, columns)
+
+    def iter_date_range(self, start_date, end_date, chunk_size=10000, fields=None, batch_size=None, raw=None):
+        """
+        Stream the songs within a date range as DataFrames of at most chunk_size rows, oldest first.
+
+        :param start_date: str, the start date in 'YYYY-MM-DD' format
+        :param end_date: str, the end date in 'YYYY-MM-DD' format
+        :param chunk_size: int, the number of rows per DataFrame
+        :param fields: list of str, the fields to fetch (all fields if omitted)
+        :param batch_size: int, the number of documents per network round trip (defaults to chunk_size)
+        :param raw: bool, read through raw BSON batches, one DataFrame per batch (defaults to the raw_reads setting)
+        :return: iterator of pd.DataFrame, the song data in chunks
+        """
+        collection = self.storage.collection(self.collection_name)
+        projection, columns = _projection(fields)
+        query = {'timestamp': {'$gte': datetime.strptime(start_date, '%Y-%m-%d'), '$lte': datetime.strptime(end_date, '%Y-%m-%d')}}
+        if self._use_raw(raw):
+            return self._raw_frames(query, fields, [('timestamp', ASCENDING)], batch_size or chunk_size)
+        cursor = collection.find(query, projection).sort('timestamp', ASCENDING).batch_size(batch_size or chunk_size)
+        return self._iter_frames(self._noted(self._hydrated(cursor, fields), fields), chunk_size, columns)
+
+    def iter_unique_songs(self, chunk_size=10000, batch_size=None):
+        """
+        Stream the unique songs across the dataset as DataFrames of at most chunk_size rows.
+
+        :param chunk_size: int, the number of rows per DataFrame
+        :param batch_size: int, the number of documents per network round trip (defaults to chunk_size)
+        :return: iterator of pd.DataFrame, the unique song data in chunks
+        """
+        return self._iter_frames(self._unique_songs(batch_size or chunk_size), chunk_size)
+
+    def _unique_songs(self, batch_size=None):
+        """
+        Run UNIQUE_SONGS_PIPELINE, or its Python equivalent on storages without aggregation.
+
+        :param batch_size: int, the number of records per network round trip
+        :return: iterator of dict, one record per (title, author)
+        """
+        collection = self.storage.collection(self.collection_name)
+        if self.storage.server_side:
+            options = {'batchSize': batch_size} if batch_size else {}
+            return collection.aggregate(UNIQUE_SONGS_PIPELINE, allowDiskUse=True, **options)
+
+        records = {}
+        for document in collection.find({}, {'title': 1, 'author': 1, 'graph_values': 1, 'timestamp': 1}):
+            key = (document.get('title'), document.get('author'))
+            record = records.get(key)
+            if record is None:
+                records[key] = {
+                    '_id': {'title': key[0], 'author': key[1]},
+                    'unique_ids': [document['_id']],
+                    'graph_values': document.get('graph_values'),
+                    'timestamp': document.get('timestamp')
+                }
+            else:
+                record['unique_ids'].append(document['_id'])
+        return iter(records.values())
+
+    def _use_raw(self, raw):
+        """
+        Return whether a read goes through raw BSON batches, which only MongoDB serves.
+        """
+        return (self.raw_reads if raw is None else raw) and self.storage.server_side
+
+    def _raw_frames(self, query, fields=None, sort=None, batch_size=None):
+        """
+        Read the trends collection through raw BSON batches, yielding one DataFrame per batch.
+
+        The server sends each batch as one block of BSON. When pymongoarrow is installed and
+        every field has a known type, the fields are decoded straight into Arrow arrays, skipping
+        the Python dicts (numbers then come back as float64 and lists as arrays). Otherwise each
+        batch is decoded with a single bson.decode_all call; version 2 rows that need filling
+        in and reads of the note, joined from the notes collection, always take this path.
+
+        :param query: dict, the filter selecting the documents
+        :param fields: list of str, the fields to fetch (all fields if omitted)
+        :param sort: list of tuple, the (field, direction) sort
+        :param batch_size: int, the number of documents per batch
+        :return: iterator of pd.DataFrame, the documents batch by batch
+        """
+        collection = self.storage.collection(self.collection_name)
+        projection, columns = _projection(fields)
+        schema = columnar_schema(fields)
+        if schema is not None and any(field in SLIM_FIELDS for field in fields) and self.get_schema_version() >= SCHEMA_VERSION:
+            schema = None
+        if schema is not None and 'note' in fields:
+            schema = None
+        cursor = collection.find_raw_batches(query, projection, sort=sort)
+        if batch_size:
+            cursor = cursor.batch_size(batch_size)
+        for batch in cursor:
+            if schema is not None:
+                yield decode_columnar(batch, schema, columns, collection.codec_options)
+            else:
+                documents = decode_documents(batch, collection.codec_options)
+                yield _frame_from_documents(self._noted(self._hydrated(documents, fields), fields), columns)
+
+    @staticmethod
+    def _iter_frames(cursor, chunk_size, columns=None):
+        """
+        Turn a cursor into DataFrames of at most chunk_size rows.
+        """
+        while True:
+            frame = _frame_from_documents(islice(cursor, chunk_size), columns)
+            if not len(frame):
+                return
+            yield frame
+
+    @cached({'snapshots', 'notes'})
+    def get_latest_snapshot(self, fields=None, distributors=None):
+        """
+        Retrieve only the rows of the most recent daily snapshot.
+
+        :param fields: list of str, the fields to fetch (all fields if omitted)
+        :param distributors: list of str, only keep songs released through one of these distributors
+        :return: pd.DataFrame, the latest snapshot as a pandas DataFrame
+        """
+        collection = self.storage.collection(self.collection_name)
+        # Served by the timestamp index: reads a single index key
+        latest = collection.find_one({}, {'timestamp': 1, '_id': 0}, sort=[('timestamp', DESCENDING)])
+        if not latest:
+            return pd.DataFrame()
+
+        query = {'timestamp': latest['timestamp']}
+        if distributors:
+            query['distributors'] = {'$in': list(distributors)}
+        fields = ['timestamp', *fields] if fields else None
+        projection, columns = _projection(fields)
+        return _frame_from_documents(self._noted(self._hydrated(collection.find(query, projection), fields), fields), columns)
 
     def get_song_by_id(self, song_id):
         """
@@ -113,114 +1965,221 @@ class DataLib:
         :param song_id: str, the ID of the song to retrieve
         :return: Song, the song data
         """
-        collection = self.db[self.collection_name]
+        collection = self.storage.collection(self.collection_name)
         song_data = collection.find_one({'_id': song_id})
-        all_occurrences = list(collection.find({'title': song_data['title'], 'author': song_data['author']}))
-        return Song(song_data, all_occurrences) if song_data else None
+        if not song_data:
+            return None
+        self._hydrate([song_data])
+        # Occurrences are only fetched if the caller reads them
+        song = Song(song_data, occurrence_loader=partial(self.get_song_occurrences, song_data['title'], song_data['author']))
+        return self._attach_notes([song])[0]
+
+    @cached(lambda self, title, author, *args, **kwargs: {('title', title), ('author', author)})
+    def get_song(self, title, author, include_occurrences=False):
+        """
+        Retrieve a single song by title and author with its data aggregated over all occurrences.
+
+        :param title: str, the title of the song
+        :param author: str, the author of the song
+        :param include_occurrences: bool, fetch every occurrence up front instead of on first access
+        :return: Song, the song data (None if not found)
+        """
+        songs = self._aggregate_songs({'title': title, 'author': author}, include_occurrences)
+        return songs[0] if songs else None
 
-    def get_songs_by_name(self, title):
+    @cached(lambda self, title, *args, **kwargs: {('title', title)})
+    def get_songs_by_name(self, title, aggregate=True, include_occurrences=False, summary=False, distributors=None):
         """
         Retrieve songs by title and aggregate their data.
 
         :param title: str, the title of the song to retrieve
+        :param aggregate: bool, group the songs inside MongoDB instead of in Python
+        :param include_occurrences: bool, also fetch every occurrence of each song (always fetched when aggregate is False)
+        :param summary: bool, return lightweight SongSummary objects for list views (always aggregated in MongoDB)
+        :param distributors: list of str, only keep occurrences released through one of these distributors
         :return: list of Song, the list of aggregated songs with the given title
         """
-        collection = self.db[self.collection_name]
-        song_data = list(collection.find({'title': title}))
-
-        # Aggregate songs by title and author
-        aggregated_data = {}
-        for data in song_data:
-            key = (data['title'], data['author'])
-            if key not in aggregated_data:
-                aggregated_data[key] = {
-                    '_id': str(data['_id']),
-                    'title': data['title'],
-                    'author': data['author'],
-                    'graph_values': data['graph_values'],
-                    'acousticness': data.get('acousticness'),
-                    'danceability': data.get('danceability'),
-                    'energy': data.get('energy'),
-                    'instrumentalness': data.get('instrumentalness'),
-                    'liveness': data.get('liveness'),
-                    'speechiness': data.get('speechiness'),
-                    'valence': data.get('valence'),
-                    'popularity': data.get('popularity'),
-                    'album': data.get('album'),
-                    'release_date': data.get('release_date'),
-                    'duration_ms': data.get('duration_ms'),
-                    'timestamp': data['timestamp'],
-                    'note': data.get('note'),
-                    'detail_url': data.get('detail_url'),
-                    'interest_names': data.get('interest_names', []),
-                    'age_distribution': data.get('age_distribution', {}),
-                    'top_regions': data.get('top_regions', []),
-                    'description': data.get('description'),
-                    'streamCountData': data.get('streamCountData', {}),
-                    'ai_predicted_data': data.get('AI predicted data', {}),
-                    'expected_rank_next_day': data.get('expected_rank_next_day'),
-                    'all_occurrences': [data]
-                }
-            else:
-                # Aggregate graph values
-                aggregated_data[key]['graph_values'] = [
-                    max(a, b) for a, b in zip(aggregated_data[key]['graph_values'], data['graph_values'])
-                ]
-                aggregated_data[key]['all_occurrences'].append(data)
+        match = {'title': title}
+        if distributors:
+            match['distributors'] = {'$in': list(distributors)}
+        if summary:
+            return self._summarize_songs(match)
+        if aggregate:
+            return self._aggregate_songs(match, include_occurrences)
+        collection = self.storage.collection(self.collection_name)
+        return self._group_songs(collection.find(match).sort([('timestamp', ASCENDING), ('_id', ASCENDING)]))
 
-        return [Song(data, data['all_occurrences']) for data in aggregated_data.values()]
-
-    def get_songs_by_author(self, author):
+    @cached(lambda self, author, *args, **kwargs: {('author', author)})
+    def get_songs_by_author(self, author, aggregate=True, include_occurrences=False, summary=False, distributors=None):
         """
         Retrieve songs by author and aggregate their data.
 
         :param author: str, the author of the song to retrieve
+        :param aggregate: bool, group the songs inside MongoDB instead of in Python
+        :param include_occurrences: bool, also fetch every occurrence of each song (always fetched when aggregate is False)
+        :param summary: bool, return lightweight SongSummary objects for list views (always aggregated in MongoDB)
+        :param distributors: list of str, only keep occurrences released through one of these distributors
         :return: list of Song, the list of aggregated songs by the given author
         """
-        collection = self.db[self.collection_name]
-        song_data = list(collection.find({'author': author}))
+        match = {'author': author}
+        if distributors:
+            match['distributors'] = {'$in': list(distributors)}
+        if summary:
+            return self._summarize_songs(match)
+        if aggregate:
+            return self._aggregate_songs(match, include_occurrences)
+        collection = self.storage.collection(self.collection_name)
+        return self._group_songs(collection.find(match).sort([('timestamp', ASCENDING), ('_id', ASCENDING)]))
+
+    @cached(lambda self, title, author: {('title', title), ('author', author)})
+    def get_song_occurrences(self, title, author):
+        """
+        Retrieve every occurrence of a song, oldest first.
+
+        :param title: str, the title of the song
+        :param author: str, the author of the song
+        :return: list of dict, all occurrences of the song
+        """
+        collection = self.storage.collection(self.collection_name)
+        return self._hydrate(list(collection.find({'title': title, 'author': author}).sort('timestamp', 1)))
+
+    def _group_songs(self, song_data):
+        """
+        Aggregate raw occurrences by title and author in Python.
 
-        # Aggregate songs by title and author
+        :param song_data: iterable of dict, the raw occurrences sorted by timestamp and _id
+        :return: list of Song, one per (title, author) in first-seen order
+        """
         aggregated_data = {}
-        for data in song_data:
-            key = (data['title'], 'author')
+        for data in self._hydrated(song_data):
+            key = (data['title'], data['author'])
             if key not in aggregated_data:
                 aggregated_data[key] = {
-                    '_id': str(data['_id']),
-                    'title': data['title'],
-                    'author': data['author'],
-                    'graph_values': data['graph_values'],
-                    'acousticness': data.get('acousticness'),
-                    'danceability': data.get('danceability'),
-                    'energy': data.get('energy'),
-                    'instrumentalness': data.get('instrumentalness'),
-                    'liveness': data.get('liveness'),
-                    'speechiness': data.get('speechiness'),
-                    'valence': data.get('valence'),
-                    'popularity': data.get('popularity'),
-                    'album': data.get('album'),
-                    'release_date': data.get('release_date'),
-                    'duration_ms': data.get('duration_ms'),
-                    'timestamp': data['timestamp'],
-                    'note': data.get('note'),
-                    'detail_url': data.get('detail_url'),
-                    'interest_names': data.get('interest_names', []),
-                    'age_distribution': data.get('age_distribution', {}),
-                    'top_regions': data.get('top_regions', []),
-                    'description': data.get('description'),
-                    'streamCountData': data.get('streamCountData', {}),
-                    'ai_predicted_data': data.get('AI predicted data', {}),
-                    'expected_rank_next_day': data.get('expected_rank_next_day'),
+                    'data': dict(data, _id=str(data['_id'])),
                     'all_occurrences': [data]
                 }
             else:
                 # Aggregate graph values
-                aggregated_data[key]['graph_values'] = [
-                    max(a, b) for a, b in zip(aggregated_data[key]['graph_values'], data['graph_values'])
+                aggregated = aggregated_data[key]['data']
+                aggregated['graph_values'] = [
+                    max(a, b) for a, b in zip(aggregated.get('graph_values') or [], data.get('graph_values') or [])
                 ]
                 aggregated_data[key]['all_occurrences'].append(data)
 
-        return [Song(data, data['all_occurrences']) for data in aggregated_data.values()]
+        return self._attach_notes([Song(entry['data'], entry['all_occurrences']) for entry in aggregated_data.values()])
+
+    def _aggregate_songs(self, match, include_occurrences=False):
+        """
+        Aggregate occurrences by title and author inside MongoDB.
+
+        The pipeline keeps the first occurrence as the song data, takes the
+        element-wise max of graph_values over all occurrences and selects the
+        LATEST_FIELDS of the latest occurrence, so about one document per song crosses the wire.
+        Storages without pipelines build the same records in Python (see _group_records).
+
+        :param match: dict, the filter selecting the occurrences
+        :param include_occurrences: bool, also push every occurrence of each song
+        :return: list of Song, one per (title, author) in first-seen order
+        """
+        collection = self.storage.collection(self.collection_name)
+        if not self.storage.server_side:
+            # The same records as the pipeline, so occurrences stay lazy unless asked for
+            records = _group_records(collection.find(match).sort(list(_song_sort(match).items())), include_occurrences)
+            return self._songs_from_records(sorted(records, key=lambda record: (record['first']['timestamp'], record['first']['_id'])))
+
+        return self._songs_from_records(list(collection.aggregate(_song_pipeline(match, include_occurrences), allowDiskUse=True)))
+
+    def _songs_from_records(self, records):
+        """
+        Build Songs from per-song records with the first and latest occurrence and the merged graph_values.
+
+        :param records: list of dict, the output of _song_pipeline or of _group_records
+        :return: list of Song, one per record, with every occurrence only if the record carries them
+        """
+        # The latest occurrence only has LATEST_FIELDS, which version 2 rows keep; in Python
+        # the first occurrence is also the first of all_occurrences
+        self._hydrate(list({
+            id(document): document for record in records
+            for document in (record['first'], *record.get('all_occurrences', []))
+        }.values()))
+        songs = []
+        for record in records:
+            data = dict(record['first'], _id=str(record['first']['_id']), graph_values=record['graph_values'])
+            loader = partial(self.get_song_occurrences, data['title'], data['author'])
+            songs.append(Song(data, record.get('all_occurrences'), record['latest'], loader))
+        return self._attach_notes(songs)
+
+    def _attach_notes(self, songs):
+        """
+        Set the note of each song from the notes collection, in one query.
+
+        Songs without an entry keep the note embedded in their snapshot, if any.
+
+        :param songs: list of Song, the songs to annotate in place
+        :return: list of Song, the same songs
+        """
+        if not songs:
+            return songs
+        keys = {(song.title, song.author) for song in songs}
+        authors = {author for _, author in keys}
+        if len(keys) == 1:
+            query = dict(zip(('title', 'author'), next(iter(keys))))
+        elif len(authors) == 1:
+            query = {'author': next(iter(authors))}
+        else:
+            query = {'$or': [{'title': title, 'author': author} for title, author in keys]}
+        collection = self.storage.collection(self.notes_collection_name)
+        notes = {
+            (document['title'], document['author']): document.get('note')
+            for document in collection.find(query, {'title': 1, 'author': 1, 'note': 1, '_id': 0})
+        }
+        for song in songs:
+            key = (song.title, song.author)
+            if key in notes:
+                song.note = notes[key]
+        return songs
+
+    def _summarize_songs(self, match):
+        """
+        Group occurrences by title and author inside MongoDB, keeping only the fields list views need.
+
+        :param match: dict, the filter selecting the occurrences
+        :return: list of SongSummary, one per (title, author) in first-seen order
+        """
+        collection = self.storage.collection(self.collection_name)
+        if not self.storage.server_side:
+            first = {}
+            projection, _ = _projection(['title', 'author', 'description', 'timestamp'])
+            for document in collection.find(match, projection).sort(list(_song_sort(match).items())):
+                first.setdefault((document['title'], document['author']), document)
+            documents = sorted(first.values(), key=lambda document: (document['timestamp'], document['_id']))
+            self._hydrate(documents, stream_data=False)
+            return [SongSummary(dict(document, _id=str(document['_id']))) for document in documents]
+
+        pipeline = [
+            {'$match': match},
+            {'$sort': _song_sort(match)},
+            {'$group': {
+                '_id': {'title': '$title', 'author': '$author'},
+                'song_id': {'$first': '$_id'},
+                'description': {'$first': '$description'},
+                'timestamp': {'$first': '$timestamp'},
+                'schema_version': {'$first': '$schema_version'},
+            }},
+            {'$sort': {'timestamp': 1, 'song_id': 1}},
+        ]
+        documents = [
+            {
+                '_id': str(record['song_id']),
+                'title': record['_id']['title'],
+                'author': record['_id']['author'],
+                'description': record['description'],
+                'timestamp': record['timestamp'],
+                'schema_version': record.get('schema_version')
+            }
+            for record in collection.aggregate(pipeline, allowDiskUse=True)
+        ]
+        return [SongSummary(document) for document in self._hydrate(documents, stream_data=False)]
 
     # New method to get top regions for a song
     def get_top_regions(self, song_id):
@@ -257,8 +2216,9 @@ class DataLib:
             return None
 
         stream_data = song.streamCountData
-        total_streams = max(data['total'] for data in stream_data.values() if isinstance(data, dict))
-        daily_average = sum(data['daily'] for data in stream_data.values() if isinstance(data, dict) and data['daily'] is not None) / len(stream_data)
+        totals = [data['total'] for data in stream_data.values() if data['total'] is not None]
+        total_streams = max(totals) if totals else None
+        daily_average = sum(data['daily'] for data in stream_data.values() if data['daily'] is not None) / len(stream_data)
 
         return {
             'total_streams': total_streams,
@@ -274,8 +2234,22 @@ class DataLib:
         :param song_id: str, the ID of the song
         :return: dict, the AI predicted data for the song
         """
-        song = self.get_song_by_id(song_id)
-        return song.ai_predicted_data if song else {}
+        collection = self.storage.collection(self.collection_name)
+        document = collection.find_one({'_id': song_id}, {'AI predicted data': 1})
+        return document.get('AI predicted data', {}) if document else {}
+
+    def get_forecast(self, song_id):
+        """
+        Get the locally computed predictions of a specific song (see forecast_day).
+
+        :param song_id: str, the ID of the song
+        :return: dict, the forecast_rank_next_day and forecast_streams of the song (None if it was not scored)
+        """
+        collection = self.storage.collection(self.collection_name)
+        document = collection.find_one({'_id': song_id}, {'forecast_rank_next_day': 1, 'forecast_streams': 1})
+        if not document or 'forecast_rank_next_day' not in document:
+            return None
+        return {'forecast_rank_next_day': document['forecast_rank_next_day'], 'forecast_streams': document.get('forecast_streams', {})}
 
     # New method to get expected rank next day
     def get_expected_rank_next_day(self, song_id):
@@ -285,8 +2259,9 @@ class DataLib:
         :param song_id: str, the ID of the song
         :return: int, the expected rank for the next day
         """
-        song = self.get_song_by_id(song_id)
-        return song.expected_rank_next_day if song else None
+        collection = self.storage.collection(self.collection_name)
+        document = collection.find_one({'_id': song_id}, {'expected_rank_next_day': 1})
+        return document.get('expected_rank_next_day') if document else None
 
     def analyze_ai_predictions(self, song_id):
         """
@@ -295,11 +2270,10 @@ class DataLib:
         :param song_id: str, the ID of the song
         :return: dict, analysis of the AI predicted data
         """
-        song = self.get_song_by_id(song_id)
-        if not song or not song.ai_predicted_data:
+        ai_data = self.get_ai_predicted_data(song_id)
+        if not ai_data:
             return None
 
-        ai_data = song.ai_predicted_data
         max_predicted = max(ai_data.values())
         min_predicted = min(ai_data.values())
         avg_predicted = sum(ai_data.values()) / len(ai_data)
@@ -311,11 +2285,137 @@ class DataLib:
             'data': ai_data
         }
 
-    def upload_json_files(self, directory='.'):
+    def analyze_streams(self, songs=None):
+        """
+        Analyze the stream count and AI predicted data of many songs in one vectorized pass.
+
+        :param songs: pd.DataFrame, rows with title, author, streamCountData and optionally
+            'AI predicted data' columns (defaults to the latest snapshot)
+        :return: pd.DataFrame, per input row the latest_date, latest_total, total_streams, daily_average,
+            stream_days, stream_diff, stream_second_diff, trend ('green', 'red' or 'white'),
+            predicted_max, predicted_min and predicted_avg, indexed like the input
+        """
+        if songs is None:
+            songs = self.get_latest_snapshot(fields=['title', 'author', 'streamCountData', 'AI predicted data'])
+        positions = pd.RangeIndex(len(songs))
+        empty = pd.Series([None] * len(songs), dtype=object)
+        stream_column = songs['streamCountData'].reset_index(drop=True) if 'streamCountData' in songs else empty
+        ai_column = songs['AI predicted data'].reset_index(drop=True) if 'AI predicted data' in songs else empty
+
+        # One long frame of (row, date, total, daily) points for all songs
+        points = pd.DataFrame.from_records(
+            [
+                (row, date, counts.get('total'), counts.get('daily'))
+                for row, stream_data in enumerate(stream_column) if isinstance(stream_data, dict)
+                for date, counts in stream_data.items() if isinstance(counts, dict)
+            ],
+            columns=['row', 'date', 'total', 'daily']
+        )
+        points['total'] = pd.to_numeric(points['total']).astype(np.float64)
+        points['daily'] = pd.to_numeric(points['daily']).astype(np.float64)
+        stream_days = stream_column.map(lambda stream_data: len(stream_data) if isinstance(stream_data, dict) else 0)
+
+        grouped = points.groupby('row')
+        total_streams = grouped['total'].max().reindex(positions)
+        daily_average = grouped['daily'].sum().reindex(positions) / stream_days.replace(0, np.nan)
+
+        # Totals of the three most recent dates of every song, newest first
+        points = points.sort_values(['row', 'date'], ascending=[True, False])
+        points['recency'] = points.groupby('row').cumcount()
+        recent = points[points['recency'] < 3]
+        totals = recent.pivot(index='row', columns='recency', values='total').reindex(index=positions, columns=range(3))
+        latest_date = recent[recent['recency'] == 0].set_index('row')['date'].reindex(positions)
+
+        stream_diff = totals[0] - totals[1]
+        stream_second_diff = stream_diff - (totals[1] - totals[2])
+
+        predictions = pd.DataFrame.from_records(
+            [ai_data if isinstance(ai_data, dict) else {} for ai_data in ai_column], index=positions
+        ).apply(pd.to_numeric, errors='coerce')
+
+        result = pd.DataFrame({
+            'title': songs['title'].to_numpy() if 'title' in songs else None,
+            'author': songs['author'].to_numpy() if 'author' in songs else None,
+            'latest_date': latest_date,
+            'latest_total': totals[0],
+            'total_streams': total_streams,
+            'daily_average': daily_average,
+            'stream_days': stream_days,
+            'stream_diff': stream_diff.where(stream_days >= 3),
+            'stream_second_diff': stream_second_diff.where(stream_days >= 3),
+            'trend': np.select([stream_second_diff > 10, stream_second_diff < 0], ['green', 'red'], 'white'),
+            'predicted_max': predictions.max(axis=1) if len(predictions.columns) else np.nan,
+            'predicted_min': predictions.min(axis=1) if len(predictions.columns) else np.nan,
+            'predicted_avg': predictions.mean(axis=1) if len(predictions.columns) else np.nan
+        }, index=positions)
+        result.index = songs.index
+        return result
+
+    @cached(lambda self, author=None: {('author', author)} if author else {'snapshots'})
+    def get_distributor_counts(self, author=None):
+        """
+        Count the unique songs released through each distributor.
+
+        :param author: str, only count the songs of this author (all songs if omitted)
+        :return: dict, the number of songs per distributor, in the configured order
+        """
+        collection = self.storage.collection(self.collection_name)
+        match = {'distributors': {'$exists': True, '$ne': []}}
+        if author is not None:
+            match = {'author': author, **match}
+        pipeline = [
+            {'$match': match},
+            {'$project': {'title': 1, 'author': 1, 'distributors': 1}},
+            {'$unwind': '$distributors'},
+            {'$group': {'_id': {'distributor': '$distributors', 'title': '$title', 'author': '$author'}}},
+            {'$group': {'_id': '$_id.distributor', 'count': {'$sum': 1}}},
+        ]
+        counts = dict.fromkeys(self.distributor_matcher.distributors, 0)
+        if not self.storage.server_side:
+            songs = {
+                (distributor, document['title'], document['author'])
+                for document in collection.find(match, {'title': 1, 'author': 1, 'distributors': 1})
+                for distributor in document['distributors']
+            }
+            for distributor, _, _ in songs:
+                counts[distributor] = counts.get(distributor, 0) + 1
+            return counts
+        for record in collection.aggregate(pipeline, allowDiskUse=True):
+            counts[record['_id']] = record['count']
+        return counts
+
+    def backfill_distributors(self, batch_size=1000):
+        """
+        Tag every existing document with the distributors named in its description.
+
+        :param batch_size: int, the number of documents updated per bulk write
+        :return: str, confirmation message
+        """
+        collection = self.storage.collection(self.collection_name)
+        projection, _ = _projection(['description'])
+        cursor = collection.find({}, projection).batch_size(batch_size)
+        count = 0
+        for chunk in chunked(self._hydrated(cursor, ['description'], batch_size), batch_size):
+            collection.bulk_write([
+                UpdateOne({'_id': document['_id']}, {'$set': {'distributors': self.distributor_matcher.match(document.get('description'))}})
+                for document in chunk
+            ], ordered=False)
+            count += len(chunk)
+        if self.cache is not None:
+            self.cache.clear()
+        return f'Tagged distributors on {count} documents.'
+
+    def upload_json_files(self, directory='.', confirm=True, chunk_size=1000, max_workers=4):
         """
         Scan the directory for JSON files and upload them to the collection.
 
+        Files are streamed and upserted in chunks, so uploading the same files again is safe.
+
         :param directory: str, the directory to scan for JSON files (defaults to the current directory)
+        :param confirm: bool, ask for confirmation before uploading
+        :param chunk_size: int, the number of documents per bulk write
+        :param max_workers: int, the number of files ingested in parallel
+        :return: dict, ingest statistics (None if nothing was uploaded)
         """
         json_files = [f for f in os.listdir(directory) if f.endswith('.json') and f.startswith('trending_music_')]
         if not json_files:
@@ -326,34 +2426,190 @@ class DataLib:
         for file in json_files:
             print(file)
 
-        confirm = input("Do you want to upload these files to the database? (yes/no): ")
-        if confirm.lower() != 'yes':
+        if confirm and input("Do you want to upload these files to the database? (yes/no): ").lower() != 'yes':
             print("Upload cancelled.")
             return
 
-        for file in json_files:
-            file_path = os.path.join(directory, file)
-            with open(file_path, 'r', encoding='utf-8') as f:
-                file_data = json.load(f)
-                data_to_upload = file_data['data']
-                for item in data_to_upload:
-                    item['timestamp'] = file_data['timestamp']
-                self.upload_data(data_to_upload)
-
+        stats = self.ingest_files([os.path.join(directory, file) for file in json_files], chunk_size, max_workers)
         print("All files have been uploaded successfully.")
+        return stats
+
+    def ingest_files(self, paths, chunk_size=1000, max_workers=4):
+        """
+        Stream trending_music_*.json files into the collection with chunked bulk upserts.
+
+        Memory stays bounded by chunk_size documents per worker regardless of file size. The rank
+        movements and forecasts of the written days are updated once, after the last chunk.
+
+        :param paths: list of str, the JSON files to ingest
+        :param chunk_size: int, the number of documents per bulk write
+        :param max_workers: int, the number of files ingested in parallel
+        :return: dict, the number of files, documents, upserted and modified documents, seconds and docs/sec
+        """
+        days = set()
+        days_lock = threading.Lock()
+
+        def ingest_file(path):
+            counts = {'documents': 0, 'upserted': 0, 'modified': 0}
+            for chunk in chunked(iter_trending_items(path), chunk_size):
+                written = set()
+                result = self._upsert(chunk, written)
+                with days_lock:
+                    days.update(written)
+                counts['documents'] += len(chunk)
+                counts['upserted'] += result.upserted_count
+                counts['modified'] += result.modified_count
+            print(f"Ingested {counts['documents']} documents from {os.path.basename(path)}")
+            return counts
+
+        start = time.perf_counter()
+        stats = {'files': len(paths), 'documents': 0, 'upserted': 0, 'modified': 0}
+        try:
+            with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(paths)))) as executor:
+                for counts in executor.map(ingest_file, paths):
+                    for key, value in counts.items():
+                        stats[key] += value
+        finally:
+            # Once per ingest rather than per chunk, also over the days written before a failure
+            if days:
+                token, seq = self._begin_ingest()
+                try:
+                    self._update_days(days, seq, token)
+                finally:
+                    self._end_ingest(token)
+
+        stats['seconds'] = time.perf_counter() - start
+        stats['docs_per_sec'] = stats['documents'] / stats['seconds'] if stats['seconds'] else 0.0
+        print(f"Ingested {stats['documents']} documents from {stats['files']} files "
+              f"in {stats['seconds']:.2f}s ({stats['docs_per_sec']:.0f} docs/sec)")
+        if self.columnar_dir:
+            self.export_columnar()
+        return stats
+
+    def export_columnar(self, directory=None, full=False, format=None, batch_size=10000):
+        """
+        Export the collection as columnar files partitioned by day, for offline reads with ColumnarReader.
+
+        Incremental by default: the last exported day, every newer day and the days written by
+        this DataLib since its last export are (re)written; older partitions are left as they are.
+        Needs pyarrow.
+
+        :param directory: str, the export directory (defaults to columnar_dir)
+        :param full: bool, rewrite every day
+        :param format: str, 'arrow' (memory-mappable) or 'parquet' (defaults to the existing export's, else 'arrow')
+        :param batch_size: int, the number of documents fetched per round trip
+        :return: dict, the number of rows written per day
+        """
+        directory = directory or self.columnar_dir
+        if not directory:
+            raise ValueError('No columnar export directory given')
+        manifest = read_manifest(directory)
+        format = format or manifest.get('format') or 'arrow'
+        exported = manifest['partitions']
+        last = None if full or not exported else max(exported)
+
+        with self._dirty_days_lock:
+            dirty, self._dirty_days = self._dirty_days, set()
+        collection = self.storage.collection(self.collection_name)
+        written = {}
+        try:
+            # New days stream in timestamp order, holding one day of documents at a time
+            query = {'timestamp': {'$gte': datetime.strptime(last, '%Y-%m-%d')}} if last else {}
+            cursor = collection.find(query).sort('timestamp', ASCENDING).batch_size(batch_size)
+            day, documents = None, []
+            for document in cursor:
+                document_day = _date_key(document.get('timestamp'))
+                if document_day != day:
+                    if day and documents:
+                        written[day] = write_partition(directory, day, self._hydrate(documents), format)['rows']
+                    day, documents = document_day, []
+                documents.append(document)
+            if day and documents:
+                written[day] = write_partition(directory, day, self._hydrate(documents), format)['rows']
+
+            # Older days changed since the last export
+            for day in sorted(dirty):
+                if last and day < last:
+                    start = datetime.strptime(day, '%Y-%m-%d')
+                    documents = collection.find({'timestamp': {'$gte': start, '$lt': start + timedelta(days=1)}}).batch_size(batch_size)
+                    documents = self._hydrated(documents, chunk_size=batch_size)
+                    written[day] = write_partition(directory, day, documents, format)['rows']
+        except Exception:
+            with self._dirty_days_lock:
+                self._dirty_days |= dirty - set(written)
+            raise
+        print(f"Exported {sum(written.values())} documents in {len(written)} daily partitions to {directory}")
+        return written
 
     def add_note_to_song(self, song_id, note):
         """
-        Add a note to a specific song.
+        Add a note to a specific song, applying to all its occurrences.
 
         :param song_id: str, the ID of the song to add a note to
         :param note: str, the note to add
         :return: str, confirmation message
         """
-        collection = self.db[self.collection_name]
-        collection.update_one({'_id': song_id}, {'$set': {'note': note}})
+        collection = self.storage.collection(self.collection_name)
+        song = collection.find_one({'_id': song_id}, {'title': 1, 'author': 1})
+        if not song:
+            return f'Song with ID: {song_id} not found.'
+        self.add_notes([{'title': song['title'], 'author': song['author'], 'note': note}])
         return f'Note added to song with ID: {song_id}'
 
+    def add_notes(self, notes):
+        """
+        Set the notes of many songs with one unordered bulk write to the notes collection.
+
+        Notes are keyed by (title, author), so they apply to every occurrence of a song and
+        never rewrite the snapshot documents. A note of None clears the song's note.
+
+        :param notes: iterable of dict, each with title, author and note
+        :return: list of dict, per note its title, author and status ('created', 'updated' or 'failed', with the error)
+        """
+        notes = list(notes)
+        if not notes:
+            return []
+        self._ensure_upsert_indexes()
+        collection = self.storage.collection(self.notes_collection_name)
+        updated_at = datetime.now(timezone.utc)
+        operations = [
+            UpdateOne(
+                {'title': item['title'], 'author': item['author']},
+                {'$set': {'note': item.get('note'), 'updated_at': updated_at}},
+                upsert=True
+            )
+            for item in notes
+        ]
+        try:
+            details = collection.bulk_write(operations, ordered=False).bulk_api_result
+        except BulkWriteError as e:
+            details = e.details
+
+        upserted = {entry['index'] for entry in details.get('upserted', [])}
+        errors = {error['index']: error.get('errmsg') for error in details.get('writeErrors', [])}
+        results = []
+        for index, item in enumerate(notes):
+            result = {'title': item['title'], 'author': item['author']}
+            if index in errors:
+                result.update(status='failed', error=errors[index])
+            else:
+                result['status'] = 'created' if index in upserted else 'updated'
+            results.append(result)
+        self._invalidate([result for result in results if result['status'] != 'failed'], 'notes')
+        return results
+
+    def get_notes(self, author=None):
+        """
+        Retrieve the notes from the notes collection.
+
+        :param author: str, only return the notes on this author's songs
+        :return: pd.DataFrame, the notes with title, author, note and updated_at
+        """
+        collection = self.storage.collection(self.notes_collection_name)
+        query = {'author': author} if author is not None else {}
+        columns = ['title', 'author', 'note', 'updated_at']
+        return _frame_from_documents(collection.find(query, dict.fromkeys(columns, 1)), ['_id', *columns]).drop(columns='_id')
+
     def delete_song_by_id(self, song_id):
         """
         Delete a song by its ID.
@@ -361,68 +2617,181 @@ class DataLib:
         :param song_id: str, the ID of the song to delete
         :return: str, confirmation message
         """
-        collection = self.db[self.collection_name]
-        result = collection.delete_one({'_id': song_id})
-        if result.deleted_count:
+        result = self.delete_songs([song_id])[0]
+        if result['status'] == 'deleted':
             return f'Song with ID: {song_id} deleted successfully.'
-        else:
+        elif result['status'] == 'not_found':
             return f'Song with ID: {song_id} not found.'
+        else:
+            return f"Song with ID: {song_id} could not be deleted: {result['error']}"
+
+    def delete_songs(self, song_ids):
+        """
+        Delete many songs by ID with one lookup and one unordered bulk write.
+
+        The data derived from the deleted documents follows them (see _after_delete), and the deletion
+        gets an ingest sequence number of its own, so sync_cache in other processes applies it too.
+
+        :param song_ids: iterable of str, the IDs of the songs to delete
+        :return: list of dict, per ID its song_id and status ('deleted', 'not_found' or 'failed', with the error)
+        """
+        song_ids = list(song_ids)
+        if not song_ids:
+            return []
+        collection = self.storage.collection(self.collection_name)
+        # The deleted songs' title, author and day drive the clean-up
+        found = {
+            str(document['_id']): document
+            for document in collection.find({'_id': {'$in': song_ids}}, {'title': 1, 'author': 1, 'timestamp': 1})
+        }
+        errors = {}
+        existing = [song_id for song_id in song_ids if str(song_id) in found]
+        if existing:
+            try:
+                collection.bulk_write([DeleteOne({'_id': song_id}) for song_id in existing], ordered=False)
+            except BulkWriteError as e:
+                errors = {existing[error['index']]: error.get('errmsg') for error in e.details['writeErrors']}
 
-    def filter_by_date_range(self, start_date, end_date):
+        results = []
+        for song_id in song_ids:
+            if str(song_id) not in found:
+                results.append({'song_id': song_id, 'status': 'not_found'})
+            elif song_id in errors:
+                results.append({'song_id': song_id, 'status': 'failed', 'error': errors[song_id]})
+            else:
+                results.append({'song_id': song_id, 'status': 'deleted'})
+        deleted = [found[str(result['song_id'])] for result in results if result['status'] == 'deleted']
+        if deleted:
+            token, seq = self._begin_ingest()
+            try:
+                self._after_delete(deleted, seq, token)
+            finally:
+                self._end_ingest(token)
+        return results
+
+    def _after_delete(self, documents, seq, token=None):
+        """
+        Update everything derived from the collection after documents were deleted.
+
+        The rank movements and forecasts of their days are recomputed and their popularity leaves the
+        time series. Songs left without any document also lose their time series, catalog entry, notes
+        and search and similarity index entries.
+
+        :param documents: list of dict, the deleted documents with title, author and timestamp
+        :param seq: int, the sequence number the deletion is recorded under
+        :param token: str, the token of the deletion's ingest, refreshed while its days are updated
+        """
+        songs = {(document.get('title'), document.get('author')) for document in documents}
+        titles = sorted({title for title, _ in songs}, key=str)
+        collection = self.storage.collection(self.collection_name)
+        remaining = {
+            (document.get('title'), document.get('author'))
+            for document in collection.find({'title': {'$in': titles}}, {'title': 1, 'author': 1, '_id': 0})
+        }
+        removed = songs - remaining
+
+        timeseries = self.storage.collection(self.timeseries_collection_name)
+        slots = {}
+        for document in documents:
+            day = _date_key(document.get('timestamp'))
+            song = (document.get('title'), document.get('author'))
+            if day and song not in removed:
+                slots.setdefault((*song, day[:7]), {})[f'popularity.{int(day[8:10]) - 1}'] = None
+        if slots:
+            timeseries.bulk_write([
+                UpdateOne({'title': title, 'author': author, 'month': month}, {'$set': update})
+                for (title, author, month), update in slots.items()
+            ], ordered=False)
+        if removed:
+            songs_filter = {'$or': [{'title': title, 'author': author} for title, author in sorted(removed, key=str)]}
+            for name in (self.timeseries_collection_name, self.catalog_collection_name, self.notes_collection_name):
+                self.storage.collection(name).delete_many(songs_filter)
+            for index in self._song_indexes():
+                index.remove(removed)
+
+        days = {day for day in map(_date_key, (document.get('timestamp') for document in documents)) if day}
+        self._update_days(days, seq, token)
+        self.storage.collection(self.meta_collection_name).insert_many([{
+            '_id': f'{DELETION_PREFIX}{seq}', 'deletion_seq': seq, 'deleted_at': datetime.now(timezone.utc),
+            'songs': [list(song) for song in songs], 'removed': [list(song) for song in removed],
+        }])
+        self._prune_deletions()
+        self._invalidate(documents, 'snapshots', 'artists', 'movements', 'history')
+        with self._dirty_days_lock:
+            self._dirty_days.update(days)
+
+    def _prune_deletions(self):
+        """
+        Drop the deletion records older than DELETION_RETENTION, noting the last pruned sequence number.
+
+        sync_cache in a process whose last sync predates that number rebuilds its cache and
+        song indexes instead (see _apply_deletions).
+        """
+        meta = self.storage.collection(self.meta_collection_name)
+        cutoff = datetime.now(timezone.utc) - DELETION_RETENTION
+        expired = list(meta.find({
+            'deletion_seq': {'$exists': True},
+            # Records written before deleted_at was stamped count as expired
+            '$or': [{'deleted_at': {'$lt': cutoff}}, {'deleted_at': {'$exists': False}}],
+        }, {'deletion_seq': 1}))
+        if not expired:
+            return
+        meta.find_one_and_update(
+            {'_id': WATERMARK_ID}, {'$max': {'deletions_pruned': max(record['deletion_seq'] for record in expired)}}
+        )
+        meta.delete_many({'_id': {'$in': [record['_id'] for record in expired]}})
+
+    @cached({'snapshots', 'notes'})
+    def filter_by_date_range(self, start_date, end_date, raw=None):
         """
         Retrieve songs within a specific date range.
 
         :param start_date: str, the start date in 'YYYY-MM-DD' format
         :param end_date: str, the end date in 'YYYY-MM-DD' format
+        :param raw: bool, read through raw BSON batches (defaults to the raw_reads setting)
         :return: pd.DataFrame, the song data within the date range as a pandas DataFrame
         """
-        collection = self.db[self.collection_name]
+        collection = self.storage.collection(self.collection_name)
         start_date = datetime.strptime(start_date, '%Y-%m-%d')
         end_date = datetime.strptime(end_date, '%Y-%m-%d')
-        data = list(collection.find({'timestamp': {'$gte': start_date, '$lte': end_date}}))
-        for record in data:
-            record['_id'] = str(record['_id'])
-        return pd.DataFrame(data)
+        if self._use_raw(raw):
+            return concat_frames(self._raw_frames({'timestamp': {'$gte': start_date, '$lte': end_date}}))
+        return _frame_from_documents(self._noted(self._hydrated(collection.find({'timestamp': {'$gte': start_date, '$lte': end_date}}))))
 
+    @cached({'snapshots'})
     def get_top_songs_comparison(self, date1, date2):
         """
-        Compare the top songs between two dates.
+        Compare the charts of two dates song by song.
 
         :param date1: str, the first date in 'YYYY-MM-DD' format
         :param date2: str, the second date in 'YYYY-MM-DD' format
-        :return: pd.DataFrame, a DataFrame with the top songs from both dates side by side
+        :return: pd.DataFrame, one row per song on either chart with title, author, rank (on date2),
+            previous_rank (on date1), change and status, songs charting on date2 first by rank
         """
-        collection = self.db[self.collection_name]
-        data1 = list(collection.find({'timestamp': date1}))
-        data2 = list(collection.find({'timestamp': date2}))
-        df1 = pd.DataFrame(data1)
-        df2 = pd.DataFrame(data2)
-        df1['_id'] = df1['_id'].astype(str)
-        df2['_id'] = df2['_id'].astype(str)
-        return pd.concat([df1, df2], axis=1, keys=[date1, date2])
+        movements = _compare_charts(self._chart(date1), self._chart(date2))
+        return pd.DataFrame(movements, columns=['title', 'author', 'rank', 'previous_rank', 'change', 'status'])
 
+    @cached({'snapshots'})
     def get_unique_songs(self):
         """
         Retrieve unique songs across the dataset.
 
         :return: pd.DataFrame, the unique song data as a pandas DataFrame
         """
-        collection = self.db[self.collection_name]
-        data = list(collection.aggregate([{'$group': {'_id': {'title': '$title', 'author': '$author'}, 'unique_ids': {'$addToSet': '$_id'}, 'graph_values': {'$first': '$graph_values'}, 'timestamp': {'$first': '$timestamp'}}}]))
-        for record in data:
-            record['_id'] = str(record['_id'])
-        return pd.DataFrame(data)
+        return _frame_from_documents(self._unique_songs())
 
+    @cached({'artists'})
     def get_unique_artists(self):
         """
         Retrieve unique artists from the dataset.
 
         :return: list, unique artist names
         """
-        collection = self.db[self.collection_name]
+        collection = self.storage.collection(self.collection_name)
         artists = collection.distinct('author')
         return sorted(artists)
 
+    @cached({'snapshots', 'notes'})
     def get_daily_top_songs(self, date):
         """
         Retrieve the top songs for a specific day.
@@ -430,18 +2799,29 @@ class DataLib:
         :param date: str, the date in 'YYYY-MM-DD' format
         :return: pd.DataFrame, the song data for the specified date as a pandas DataFrame
         """
-        collection = self.db[self.collection_name]
-        data = list(collection.find({'timestamp': date}))
-        for record in data:
-            record['_id'] = str(record['_id'])
-        return pd.DataFrame(data)
+        collection = self.storage.collection(self.collection_name)
+        return _frame_from_documents(self._noted(self._hydrated(collection.find({'timestamp': _day_range(date)}))))
     
     def delete_all_songs(self):
         """
-        Delete all songs in the collection.
+        Delete all songs in the collection, with their time series, catalog, notes, rank movements
+        and schema version.
 
         :return: str, confirmation message
         """
-        collection = self.db[self.collection_name]
+        collection = self.storage.collection(self.collection_name)
         result = collection.delete_many({})
+        for name in (self.timeseries_collection_name, self.movements_collection_name,
+                     self.catalog_collection_name, self.notes_collection_name):
+            self.storage.collection(name).delete_many({})
+        # Everything but the watermark, which keeps counting so other processes see the deletion
+        meta = self.storage.collection(self.meta_collection_name)
+        meta.delete_many({'_id': {'$ne': WATERMARK_ID}})
+        self._schema_version = None
+        token, seq = self._begin_ingest()
+        try:
+            meta.insert_many([{'_id': f'{DELETION_PREFIX}{seq}', 'deletion_seq': seq, 'deleted_at': datetime.now(timezone.utc), 'all': True}])
+        finally:
+            self._end_ingest(token)
+        self._forget_songs()
         return f'Deleted {result.deleted_count} songs from the collection.'
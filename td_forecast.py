@@ -0,0 +1,119 @@
+import bisect
+from datetime import datetime, timedelta
+
+import numpy as np
+
+# Days of daily streams each song's trend is fitted to
+HISTORY_DAYS = 7
+# Days of daily streams predicted into forecast_streams
+HORIZON_DAYS = 7
+# Bounds on the fitted day-over-day stream growth, so a short noisy history cannot explode
+MIN_GROWTH = 0.5
+MAX_GROWTH = 1.5
+# Charts with fewer scored songs than this keep the stream ordering instead of a fitted one
+MIN_FIT_SONGS = 4
+
+
+def daily_matrix(histories, graph_values, day, days=HISTORY_DAYS):
+    """
+    Align the daily streams of many songs on the days up to a chart day.
+
+    :param histories: list, per song the (dates, totals, dailies) of td_schema.stream_history (None if unknown)
+    :param graph_values: list, per song its graph_values, newest first, filling the days its history lacks
+    :param day: str, the chart day in 'YYYY-MM-DD' format
+    :param days: int, the number of days up to and including day
+    :return: np.ndarray, shape (songs, days), the daily streams oldest first (NaN where unknown)
+    """
+    end = datetime.strptime(day, '%Y-%m-%d')
+    dates = [(end - timedelta(days=offset)).strftime('%Y-%m-%d') for offset in range(days - 1, -1, -1)]
+    columns = {date: column for column, date in enumerate(dates)}
+    matrix = np.full((len(histories), days), np.nan)
+    for row, (history, graph) in enumerate(zip(histories, graph_values)):
+        if history:
+            history_dates, _, dailies = history
+            low, high = bisect.bisect_left(history_dates, dates[0]), bisect.bisect_right(history_dates, day)
+            for position in range(low, high):
+                if dailies[position] is not None:
+                    matrix[row, columns[history_dates[position]]] = dailies[position]
+        for offset, value in enumerate((graph or [])[:days]):
+            column = days - 1 - offset
+            if np.isnan(matrix[row, column]) and isinstance(value, (int, float)) and not isinstance(value, bool):
+                matrix[row, column] = value
+    return matrix
+
+
+def fit_trends(daily):
+    """
+    Fit a log-linear stream trend to every song at once.
+
+    :param daily: np.ndarray, shape (songs, days), the daily streams oldest first (NaN where unknown)
+    :return: tuple of np.ndarray, (level, slope): the fitted log1p daily streams on the last day
+        (NaN for songs without data) and its change per day (0 for songs with a single point)
+    """
+    values = np.log1p(np.clip(daily, 0, None))
+    known = ~np.isnan(values)
+    count = known.sum(axis=1)
+    # The last day is t = 0
+    t = np.arange(daily.shape[1], dtype=np.float64) - (daily.shape[1] - 1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        t_mean = np.where(known, t, 0).sum(axis=1) / count
+        v_mean = np.where(known, values, 0).sum(axis=1) / count
+        dt = np.where(known, t - t_mean[:, None], 0)
+        dv = np.where(known, values - v_mean[:, None], 0)
+        variance = (dt * dt).sum(axis=1)
+        slope = np.where(variance > 0, (dt * dv).sum(axis=1) / np.where(variance > 0, variance, 1), 0.0)
+    slope = np.clip(slope, np.log(MIN_GROWTH), np.log(MAX_GROWTH))
+    level = v_mean - slope * t_mean
+    return level, slope
+
+
+def forecast_streams(level, slope, horizon=HORIZON_DAYS):
+    """
+    Extrapolate the fitted trends.
+
+    :return: np.ndarray, shape (songs, horizon), the predicted daily streams of the next days (NaN for songs without data)
+    """
+    steps = np.arange(1, horizon + 1, dtype=np.float64)
+    return np.expm1(level[:, None] + slope[:, None] * steps)
+
+
+def fit_chart(ranks, level, slope):
+    """
+    Fit log(rank) = b0 + b1 * level + b2 * slope over one day's chart by least squares.
+
+    :param ranks: np.ndarray, the chart ranks
+    :param level: np.ndarray, the fitted stream levels
+    :param slope: np.ndarray, the fitted stream slopes
+    :return: np.ndarray, the coefficients (None if too few songs have streams)
+    """
+    scored = ~np.isnan(level)
+    if scored.sum() < MIN_FIT_SONGS:
+        return None
+    features = np.column_stack([np.ones(scored.sum()), level[scored], slope[scored]])
+    coefficients, *_ = np.linalg.lstsq(features, np.log(ranks[scored]), rcond=None)
+    return coefficients
+
+
+def expected_ranks(ranks, level, slope, coefficients=None):
+    """
+    Predict the next-day chart position of every song.
+
+    Songs are ordered by the fitted log(rank) of their predicted next-day streams. Songs
+    without streams follow, and ties keep the current chart order.
+
+    :param ranks: np.ndarray, the chart ranks
+    :param level: np.ndarray, the fitted stream levels
+    :param slope: np.ndarray, the fitted stream slopes
+    :param coefficients: np.ndarray, from fit_chart (None orders by predicted streams)
+    :return: np.ndarray, the expected ranks, 1 to len(ranks)
+    """
+    next_level = level + slope
+    if coefficients is None:
+        score = -next_level
+    else:
+        score = coefficients[0] + coefficients[1] * next_level + coefficients[2] * slope
+    missing = np.isnan(score)
+    order = np.lexsort((ranks, np.where(missing, 0, score), missing))
+    expected = np.empty(len(ranks), dtype=np.int64)
+    expected[order] = np.arange(1, len(ranks) + 1)
+    return expected
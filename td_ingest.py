@@ -0,0 +1,154 @@
+import json
+from itertools import islice
+
+_WHITESPACE = ' \t\r\n'
+_decoder = json.JSONDecoder()
+
+
+class _StreamReader:
+    def __init__(self, file, read_size):
+        """
+        Initialize an incremental reader over a text file holding JSON.
+
+        :param file: file object opened in text mode
+        :param read_size: int, the number of characters read at a time
+        """
+        self.file = file
+        self.read_size = read_size
+        self.buffer = ''
+        self.pos = 0
+        self.eof = False
+
+    def _fill(self):
+        chunk = self.file.read(self.read_size)
+        if not chunk:
+            self.eof = True
+        # Drop what has been consumed so the buffer stays bounded
+        self.buffer = self.buffer[self.pos:] + chunk
+        self.pos = 0
+
+    def peek(self):
+        """
+        Return the next non-whitespace character without consuming it ('' at end of file).
+        """
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in _WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buffer) or self.eof:
+                return self.buffer[self.pos:self.pos + 1]
+            self._fill()
+
+    def next_char(self):
+        """
+        Consume and return the next non-whitespace character.
+        """
+        char = self.peek()
+        if not char:
+            raise ValueError('Unexpected end of JSON file')
+        self.pos += 1
+        return char
+
+    def expect(self, char):
+        found = self.next_char()
+        if found != char:
+            raise ValueError(f"Expected '{char}' but found '{found}' in JSON file")
+
+    def value(self):
+        """
+        Decode and consume the next complete JSON value, reading more of the file as needed.
+        """
+        self.peek()
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self.buffer, self.pos)
+                # A value touching the end of the buffer (e.g. a number) may continue in the next read
+                if end < len(self.buffer) or self.eof:
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            self._fill()
+
+
+def iter_json_events(path, array_key='data', read_size=1 << 16):
+    """
+    Stream the top level of a JSON object file without loading it whole.
+
+    Elements of the array under array_key are yielded one by one as (array_key, element),
+    every other top-level member as (key, value).
+
+    :param path: str, the path of the JSON file
+    :param array_key: str, the key of the array to stream element by element
+    :param read_size: int, the number of characters read at a time
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        reader = _StreamReader(f, read_size)
+        reader.expect('{')
+        if reader.peek() == '}':
+            return
+        while True:
+            key = reader.value()
+            reader.expect(':')
+            if key == array_key and reader.peek() == '[':
+                reader.expect('[')
+                if reader.peek() == ']':
+                    reader.next_char()
+                else:
+                    while True:
+                        yield key, reader.value()
+                        if reader.next_char() == ']':
+                            break
+            else:
+                yield key, reader.value()
+            if reader.next_char() == '}':
+                return
+
+
+def iter_trending_items(path, read_size=1 << 16):
+    """
+    Stream the items of a trending_music_*.json file, each stamped with the file's timestamp.
+
+    Memory stays flat whatever the order of the file: when the items come before the
+    timestamp, a first pass reads ahead to the timestamp (decoding and dropping the items,
+    so such files cost twice the parsing). Items of a file without a timestamp are yielded
+    without one.
+
+    :param path: str, the path of the JSON file
+    :param read_size: int, the number of characters read at a time
+    """
+    timestamp = None
+    looked_ahead = False
+    for key, value in iter_json_events(path, 'data', read_size):
+        if key == 'timestamp':
+            timestamp = value
+        elif key == 'data':
+            if timestamp is None and not looked_ahead:
+                # Once per file, so a file without a timestamp is not read again for every item
+                timestamp = _file_timestamp(path, read_size)
+                looked_ahead = True
+            if timestamp is not None:
+                value['timestamp'] = timestamp
+            yield value
+
+
+def _file_timestamp(path, read_size):
+    """
+    Return the top-level timestamp of a JSON file (None if it has none).
+    """
+    for key, value in iter_json_events(path, 'data', read_size):
+        if key == 'timestamp':
+            return value
+    return None
+
+
+def chunked(iterable, size):
+    """
+    Split an iterable into lists of at most size elements.
+    """
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
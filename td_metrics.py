@@ -0,0 +1,304 @@
+import bisect
+import inspect
+import threading
+import time
+import weakref
+from functools import wraps
+
+import bson
+from pymongo import monitoring
+
+# Bucket upper bounds, Prometheus style (each bucket counts observations <= its bound)
+SECONDS_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+DOCUMENT_BUCKETS = (0, 1, 10, 100, 1000, 10_000, 100_000)
+BYTE_BUCKETS = (1 << 10, 1 << 14, 1 << 17, 1 << 20, 1 << 23, 1 << 24, 1 << 26)
+
+HISTOGRAMS = {
+    'datalib_method_seconds': ('Wall time of DataLib method calls', SECONDS_BUCKETS),
+    'mongodb_command_seconds': ('Server round trip of MongoDB commands', SECONDS_BUCKETS),
+    'mongodb_command_documents': ('Documents returned by MongoDB commands', DOCUMENT_BUCKETS),
+    'mongodb_command_bytes': ('BSON size of MongoDB command replies', BYTE_BUCKETS),
+}
+COUNTERS = {
+    'datalib_method_errors_total': 'DataLib method calls that raised',
+    'mongodb_command_failures_total': 'MongoDB commands that failed',
+}
+
+
+class Histogram:
+    def __init__(self, buckets):
+        """
+        Initialize a histogram with fixed bucket bounds.
+
+        :param buckets: sorted tuple of float, the bucket upper bounds
+        """
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def quantile(self, q):
+        """
+        Estimate a quantile by linear interpolation inside its bucket.
+
+        :param q: float, the quantile between 0 and 1
+        :return: float, the estimate (None when empty)
+        """
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            if count and seen + count >= rank:
+                lower = self.buckets[index - 1] if index else 0.0
+                upper = min(self.buckets[index], self.max) if index < len(self.buckets) else self.max
+                return min(lower, upper) + (upper - min(lower, upper)) * (rank - seen) / count
+            seen += count
+        return self.max
+
+    def snapshot(self):
+        return {
+            'count': self.count,
+            'sum': self.sum,
+            'mean': self.sum / self.count if self.count else None,
+            'max': self.max,
+            'p50': self.quantile(0.5),
+            'p95': self.quantile(0.95),
+            'p99': self.quantile(0.99),
+            'buckets': dict(zip([*map(str, self.buckets), '+Inf'], self.counts)),
+        }
+
+
+class MetricsRegistry:
+    def __init__(self):
+        """
+        Initialize a thread-safe in-process store of labelled histograms and counters.
+        """
+        self._histograms = {}
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    def observe(self, name, value, **labels):
+        """
+        Record an observation in a histogram declared in HISTOGRAMS.
+
+        :param name: str, the histogram name
+        :param value: float, the observed value
+        :param labels: str, the label values (e.g. method='get_song')
+        """
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram(HISTOGRAMS[name][1])
+            histogram.observe(value)
+
+    def increment(self, name, amount=1, **labels):
+        """
+        Increment a counter declared in COUNTERS.
+        """
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+
+    def to_dict(self):
+        """
+        Export every metric.
+
+        :return: dict, {'histograms': [...], 'counters': [...]}, each entry with name, labels and values
+        """
+        with self._lock:
+            histograms = [
+                {'name': name, 'labels': dict(labels), **histogram.snapshot()}
+                for (name, labels), histogram in sorted(self._histograms.items())
+            ]
+            counters = [
+                {'name': name, 'labels': dict(labels), 'value': value}
+                for (name, labels), value in sorted(self._counters.items())
+            ]
+        return {'histograms': histograms, 'counters': counters}
+
+    def summary(self, name):
+        """
+        Summarize one histogram per label set, slowest first.
+
+        :param name: str, the histogram name
+        :return: list of dict, the labels with count, mean, p50, p95, p99, max and sum
+        """
+        rows = [
+            {**entry['labels'], **{key: entry[key] for key in ('count', 'mean', 'p50', 'p95', 'p99', 'max', 'sum')}}
+            for entry in self.to_dict()['histograms'] if entry['name'] == name
+        ]
+        return sorted(rows, key=lambda row: -row['sum'])
+
+    def to_prometheus(self):
+        """
+        Export every metric in the Prometheus text exposition format.
+
+        :return: str, the exposition text
+        """
+        exported = self.to_dict()
+        lines = []
+        for name, (help_text, _) in HISTOGRAMS.items():
+            entries = [entry for entry in exported['histograms'] if entry['name'] == name]
+            if not entries:
+                continue
+            lines += [f'# HELP {name} {help_text}', f'# TYPE {name} histogram']
+            for entry in entries:
+                cumulative = 0
+                for bound, count in entry['buckets'].items():
+                    cumulative += count
+                    lines.append(f"{name}_bucket{_labels(entry['labels'], le=bound)} {cumulative}")
+                lines.append(f"{name}_sum{_labels(entry['labels'])} {entry['sum']}")
+                lines.append(f"{name}_count{_labels(entry['labels'])} {entry['count']}")
+        for name, help_text in COUNTERS.items():
+            entries = [entry for entry in exported['counters'] if entry['name'] == name]
+            if not entries:
+                continue
+            lines += [f'# HELP {name} {help_text}', f'# TYPE {name} counter']
+            lines += [f"{name}{_labels(entry['labels'])} {entry['value']}" for entry in entries]
+        return '\n'.join(lines) + '\n'
+
+
+def _labels(labels, **extra):
+    labels = {**labels, **extra}
+    if not labels:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for value in labels.values())
+    return '{' + ','.join(f'{key}="{value}"' for key, value in zip(labels, escaped)) + '}'
+
+
+class CommandMetricsListener(monitoring.CommandListener):
+    def __init__(self, registry=None, measure_bytes=False):
+        """
+        Initialize a pymongo command listener recording every command in the MetricsRegistry objects added to it.
+
+        A client takes its listeners when it is created, so a shared client gets one listener up front
+        and the registries of its users are added and dropped as they come and go.
+
+        :param registry: MetricsRegistry, a first registry to add
+        :param measure_bytes: bool, re-encode replies to record their BSON size for that registry (costs CPU on large replies,
+            so it is meant for debugging and benchmarks)
+        """
+        # Registries are held weakly, so a dropped DataLib stops being recorded into
+        self._registries = weakref.WeakKeyDictionary()
+        self._registries_lock = threading.Lock()
+        self._collections = {}
+        if registry is not None:
+            self.add(registry, measure_bytes)
+
+    def add(self, registry, measure_bytes=False):
+        """
+        Record commands in a registry, or change whether an added registry records reply sizes.
+
+        :param registry: MetricsRegistry, where the observations go
+        :param measure_bytes: bool, also record the BSON size of the replies
+        """
+        with self._registries_lock:
+            self._registries[registry] = measure_bytes
+
+    def remove(self, registry):
+        """
+        Stop recording commands in a registry.
+        """
+        with self._registries_lock:
+            self._registries.pop(registry, None)
+
+    def _targets(self):
+        with self._registries_lock:
+            return list(self._registries.items())
+
+    def started(self, event):
+        if not self._registries:
+            return
+        collection = event.command.get(event.command_name)
+        if event.command_name == 'getMore':
+            collection = event.command.get('collection')
+        self._collections[(event.connection_id, event.request_id)] = collection if isinstance(collection, str) else ''
+
+    def succeeded(self, event):
+        labels = self._labels(event)
+        targets = self._targets()
+        if not targets:
+            return
+        reply = event.reply
+        cursor = reply.get('cursor')
+        if isinstance(cursor, dict):
+            documents = len(cursor.get('firstBatch', cursor.get('nextBatch', ())))
+        elif isinstance(reply.get('values'), list):
+            documents = len(reply['values'])
+        else:
+            documents = reply.get('n', 0)
+        size = len(bson.encode(reply)) if any(measure_bytes for _, measure_bytes in targets) else None
+        for registry, measure_bytes in targets:
+            registry.observe('mongodb_command_seconds', event.duration_micros / 1e6, **labels)
+            registry.observe('mongodb_command_documents', documents, **labels)
+            if measure_bytes:
+                registry.observe('mongodb_command_bytes', size, **labels)
+
+    def failed(self, event):
+        labels = self._labels(event)
+        for registry, _ in self._targets():
+            registry.observe('mongodb_command_seconds', event.duration_micros / 1e6, **labels)
+            registry.increment('mongodb_command_failures_total', **labels)
+
+    def _labels(self, event):
+        collection = self._collections.pop((event.connection_id, event.request_id), '')
+        return {'command': event.command_name, 'collection': collection}
+
+
+def instrument(cls):
+    """
+    Time every public method of a class into the instance's MetricsRegistry, if it has one.
+
+    Methods returning a generator are timed until it is exhausted or closed.
+    """
+    for name, method in list(vars(cls).items()):
+        if name.startswith('_') or not inspect.isfunction(method):
+            continue
+        setattr(cls, name, _timed(method))
+    return cls
+
+
+def _timed(method):
+    name = method.__name__
+
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        metrics = self.metrics
+        if metrics is None:
+            return method(self, *args, **kwargs)
+        started = time.perf_counter()
+        try:
+            result = method(self, *args, **kwargs)
+        except Exception:
+            metrics.increment('datalib_method_errors_total', method=name)
+            metrics.observe('datalib_method_seconds', time.perf_counter() - started, method=name)
+            raise
+        if inspect.isgenerator(result):
+            return _timed_iteration(result, metrics, name, started)
+        metrics.observe('datalib_method_seconds', time.perf_counter() - started, method=name)
+        return result
+    return wrapper
+
+
+def _timed_iteration(generator, metrics, name, started):
+    try:
+        return (yield from generator)
+    except Exception:
+        metrics.increment('datalib_method_errors_total', method=name)
+        raise
+    finally:
+        metrics.observe('datalib_method_seconds', time.perf_counter() - started, method=name)
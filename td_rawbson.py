@@ -0,0 +1,113 @@
+import bson
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    from pymongoarrow.context import PyMongoArrowContext
+    from pymongoarrow.schema import Schema
+    from pymongoarrow.types import ObjectIdType
+except ImportError:  # optional dependency (see requirements.txt): raw batches are then decoded with bson
+    pa = PyMongoArrowContext = Schema = ObjectIdType = None
+
+from td_columnar import NUMBER_FIELDS, TEXT_FIELDS
+
+# Wire compressors MongoClient accepts; pymongo skips zstd and snappy, with a warning, when their package is missing
+COMPRESSORS = ('zstd', 'snappy', 'zlib')
+# List fields the columnar decoder reads, by element type
+LIST_FIELDS = {'graph_values': 'number', 'distributors': 'text', 'interest_names': 'text'}
+
+
+def client_options(compressors=None, zlib_compression_level=None, max_pool_size=None, min_pool_size=None, max_idle_time_ms=None):
+    """
+    Return the MongoClient keyword arguments for wire compression and connection-pool settings.
+
+    :param compressors: list of str, the compressors to offer the server, preferred first (see COMPRESSORS)
+    :param zlib_compression_level: int, -1 to 9, the zlib level (-1 is zlib's default)
+    :param max_pool_size: int, the maximum number of connections per server
+    :param min_pool_size: int, the number of connections kept open per server
+    :param max_idle_time_ms: int, the milliseconds a connection may stay idle before it is closed
+    :return: dict, the options that were given
+    """
+    if isinstance(compressors, str):
+        compressors = compressors.split(',')
+    unknown = [compressor for compressor in compressors or [] if compressor not in COMPRESSORS]
+    if unknown:
+        raise ValueError(f"Unknown compressors {unknown}, expected some of {list(COMPRESSORS)}")
+    options = {
+        'compressors': ','.join(compressors) if compressors else None,
+        'zlibCompressionLevel': zlib_compression_level,
+        'maxPoolSize': max_pool_size,
+        'minPoolSize': min_pool_size,
+        'maxIdleTimeMS': max_idle_time_ms,
+    }
+    return {name: value for name, value in options.items() if value is not None}
+
+
+def columnar_schema(fields):
+    """
+    Return the pymongoarrow schema decoding the given fields straight into Arrow arrays.
+
+    :param fields: list of str, the fields to read
+    :return: Schema, the schema (None without pymongoarrow, or if a field has no known Arrow type)
+    """
+    if PyMongoArrowContext is None or not fields:
+        return None
+    types = {'_id': ObjectIdType()}
+    for field in fields:
+        if field == 'timestamp':
+            types[field] = pa.timestamp('ms')
+        elif field in TEXT_FIELDS:
+            types[field] = pa.string()
+        elif field in NUMBER_FIELDS or field in ('rank', 'ingest_seq', 'schema_version'):
+            types[field] = pa.float64()
+        elif field in LIST_FIELDS:
+            types[field] = pa.list_(pa.float64() if LIST_FIELDS[field] == 'number' else pa.string())
+        elif field not in types:
+            # Nested documents such as streamCountData have no fixed shape
+            return None
+    return Schema(types)
+
+
+def decode_columnar(batch, schema, columns, codec_options=None):
+    """
+    Decode a raw BSON batch into a DataFrame with the columnar decoder.
+
+    Numbers come back as float64 (NaN when missing) and lists as arrays.
+
+    :param batch: bytes, the concatenated BSON documents of a find_raw_batches cursor
+    :param schema: Schema, as returned by columnar_schema
+    :param columns: list of str, the columns to keep, in order
+    :param codec_options: bson.CodecOptions, the collection's codec options
+    :return: pd.DataFrame, one row per document with _id as a string
+    """
+    context = PyMongoArrowContext(schema, codec_options=codec_options, allow_invalid=True)
+    context.process_bson_stream(batch)
+    table = context.finish()
+    ids = table.column('_id').combine_chunks().storage
+    frame = table.select([column for column in columns if column != '_id']).to_pandas(split_blocks=True, self_destruct=True)
+    # Hex-encode the 12-byte ObjectIds in one pass
+    raw_ids = ids.buffers()[1].to_pybytes()[ids.offset * 12:(ids.offset + len(ids)) * 12]
+    frame.insert(0, '_id', np.frombuffer(raw_ids.hex().encode(), dtype='S24').astype(str))
+    return frame
+
+
+def decode_documents(batch, codec_options=None):
+    """
+    Decode a raw BSON batch into documents in one call.
+
+    :param batch: bytes, the concatenated BSON documents of a find_raw_batches cursor
+    :param codec_options: bson.CodecOptions, the collection's codec options
+    :return: list of dict, the documents
+    """
+    return bson.decode_all(batch, codec_options) if codec_options is not None else bson.decode_all(batch)
+
+
+def concat_frames(frames, columns=None):
+    """
+    Concatenate per-batch DataFrames (an empty DataFrame with the columns if there are none).
+    """
+    frames = list(frames)
+    if not frames:
+        return pd.DataFrame(columns=columns or [])
+    return pd.concat(frames, ignore_index=True)
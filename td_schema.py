@@ -0,0 +1,101 @@
+import bisect
+from datetime import datetime, timedelta
+from functools import lru_cache
+
+from td_similarity import AUDIO_FEATURES
+
+# Version of the daily rows written by ingests once the collection is migrated:
+# 1 keeps every field in every daily row, 2 keeps the static fields once per song in the
+# catalog collection and the stream history once per song in the time-series collection
+SCHEMA_VERSION = 2
+# The document of the meta collection holding the schema version of the trends collection
+SCHEMA_ID = 'schema'
+# Fields that do not change from one day to the next, kept in the catalog
+CATALOG_FIELDS = [
+    'id', 'album', 'release_date', 'duration_ms', *AUDIO_FEATURES,
+    'description', 'detail_url', 'interest_names',
+]
+# Fields a version 2 row leaves out
+SLIM_FIELDS = [*CATALOG_FIELDS, 'streamCountData']
+# Fields needed to fill a version 2 row back in
+HYDRATION_FIELDS = ['title', 'author', 'timestamp', 'schema_version']
+# The number of days of stream history given back to a version 2 row, like the
+# streamCountData of the daily snapshots
+STREAM_HISTORY_DAYS = 14
+
+
+def split_document(document):
+    """
+    Split a daily document into its catalog entry and its version 2 row.
+
+    :param document: dict, the full document (left unchanged)
+    :return: tuple, (dict of the catalog fields it has, dict of the slim row)
+    """
+    entry = {field: document[field] for field in CATALOG_FIELDS if field in document}
+    row = {field: value for field, value in document.items() if field not in SLIM_FIELDS}
+    row['schema_version'] = SCHEMA_VERSION
+    return entry, row
+
+
+def merge_catalog(document, entry):
+    """
+    Fill the catalog fields of a version 2 row in place; fields the row has a value for are kept.
+
+    :param document: dict, the row
+    :param entry: dict, the catalog entry of its song (None if the song has none)
+    """
+    for field in CATALOG_FIELDS:
+        if document.get(field) is None:
+            document[field] = entry.get(field) if entry else None
+
+
+def stream_history(buckets):
+    """
+    Concatenate the monthly time-series buckets of one song.
+
+    :param buckets: list of dict, the buckets with date, total and daily arrays
+    :return: tuple, (dates, totals, dailies) lists in date order
+    """
+    dates, totals, dailies = [], [], []
+    for bucket in sorted(buckets, key=lambda bucket: bucket['month']):
+        dates.extend(bucket['date'])
+        totals.extend(bucket['total'])
+        dailies.extend(bucket['daily'])
+    return dates, totals, dailies
+
+
+def stream_window(history, day, days=STREAM_HISTORY_DAYS):
+    """
+    Rebuild the streamCountData of a daily snapshot from the stream history of its song.
+
+    :param history: tuple, (dates, totals, dailies) as returned by stream_history
+    :param day: str, the day of the snapshot in 'YYYY-MM-DD' format
+    :param days: int, the number of days up to and including day
+    :return: dict, {date: {'total', 'daily'}} for the days with a stream count
+    """
+    dates, totals, dailies = history
+    low, high = bisect.bisect_left(dates, _window_start(day, days)), bisect.bisect_right(dates, day)
+    return {
+        dates[position]: {'total': totals[position], 'daily': dailies[position]}
+        for position in range(low, high)
+        if totals[position] is not None or dailies[position] is not None
+    }
+
+
+@lru_cache(maxsize=4096)
+def _window_start(day, days):
+    return (datetime.strptime(day, '%Y-%m-%d') - timedelta(days=days - 1)).strftime('%Y-%m-%d')
+
+
+def history_months(days, history_days=STREAM_HISTORY_DAYS):
+    """
+    Return the first and last month of the stream history of snapshots on the given days.
+
+    :param days: iterable of str, the days in 'YYYY-MM-DD' format
+    :return: tuple, ('YYYY-MM', 'YYYY-MM') (None if days is empty)
+    """
+    days = sorted(days)
+    if not days:
+        return None
+    first = datetime.strptime(days[0], '%Y-%m-%d') - timedelta(days=history_days - 1)
+    return first.strftime('%Y-%m'), days[-1][:7]
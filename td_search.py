@@ -0,0 +1,222 @@
+import bisect
+import re
+import threading
+import unicodedata
+from collections import Counter
+from itertools import chain
+
+import numpy as np
+
+# Searched fields and the weight of a match in each
+SEARCH_FIELDS = {'title': 1.0, 'author': 0.9, 'album': 0.6, 'description': 0.3}
+# Score of a vocabulary token relative to an exact match of the query token, low enough that
+# an exact match in any of the title, author or album outranks a partial one
+PREFIX_SCORE = 0.6
+FUZZY_SCORE = 0.5
+# Limits on the vocabulary tokens a query token expands to
+MAX_PREFIX_TOKENS = 50
+MAX_FUZZY_TOKENS = 20
+MIN_SIMILARITY = 0.3
+
+_TOKEN = re.compile(r'\w+')
+
+
+def normalize(text):
+    """
+    Lowercase a text and strip its accents, so 'Beyoncé' matches 'beyonce'.
+    """
+    decomposed = unicodedata.normalize('NFKD', str(text).casefold())
+    return ''.join(character for character in decomposed if not unicodedata.combining(character))
+
+
+def tokenize(text):
+    """
+    Split a text into normalized word tokens.
+
+    :return: list of str, the tokens in order
+    """
+    return _TOKEN.findall(normalize(text)) if text else []
+
+
+def trigrams(token):
+    """
+    Return the trigrams of a token, padded so short tokens and word starts count.
+
+    :return: set of str, the trigrams
+    """
+    padded = f'  {token} '
+    return {padded[index:index + 3] for index in range(len(padded) - 2)}
+
+
+class SearchIndex:
+    def __init__(self, fields=None):
+        """
+        Initialize an empty in-memory search index over songs.
+
+        Each song is indexed once under its (title, author). Query tokens match vocabulary tokens
+        exactly, by prefix (type-ahead) or by trigram similarity (typos), and the matched tokens'
+        postings are scored per field with NumPy.
+
+        :param fields: dict, the weight of each searched field (defaults to SEARCH_FIELDS)
+        """
+        self.fields = dict(SEARCH_FIELDS if fields is None else fields)
+        self.songs = []
+        self._ids = {}
+        self._texts = []
+        # Postings per field and token, appended to on ingest; their arrays are built on first use
+        self._postings = {field: {} for field in self.fields}
+        self._arrays = {}
+        self._vocabulary = []
+        self._trigrams = {}
+        self._trigram_counts = {}
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._ids)
+
+    def add(self, documents):
+        """
+        Index new songs and re-index songs whose searched fields changed.
+
+        Documents of an already indexed song with the same text are skipped, so daily
+        snapshots of the same songs cost one dict lookup each.
+
+        :param documents: iterable of dict, documents with title, author and the searched fields
+        :return: int, the number of songs added or updated
+        """
+        updated = 0
+        with self._lock:
+            for document in documents:
+                key = (document.get('title'), document.get('author'))
+                if key[0] is None:
+                    continue
+                texts = {field: document.get(field) or '' for field in self.fields}
+                song_id = self._ids.get(key)
+                if song_id is None:
+                    song_id = self._ids[key] = len(self.songs)
+                    self.songs.append(key)
+                    self._texts.append({field: '' for field in self.fields})
+                previous = self._texts[song_id]
+                if previous == texts:
+                    continue
+                for field, text in texts.items():
+                    if text != previous[field]:
+                        self._reindex(song_id, field, set(tokenize(previous[field])), set(tokenize(text)))
+                self._texts[song_id] = texts
+                updated += 1
+        return updated
+
+    def remove(self, songs):
+        """
+        Drop songs from the index.
+
+        Their slots are retired rather than reused, so the ids of the other songs stay valid.
+
+        :param songs: iterable of tuple, the (title, author) of the songs
+        :return: int, the number of songs removed
+        """
+        removed = 0
+        with self._lock:
+            for key in songs:
+                song_id = self._ids.pop(tuple(key), None)
+                if song_id is None:
+                    continue
+                for field, text in self._texts[song_id].items():
+                    if text:
+                        self._reindex(song_id, field, set(tokenize(text)), set())
+                self._texts[song_id] = {field: '' for field in self.fields}
+                removed += 1
+        return removed
+
+    def _reindex(self, song_id, field, old_tokens, new_tokens):
+        postings = self._postings[field]
+        for token in old_tokens - new_tokens:
+            postings[token].remove(song_id)
+            self._arrays.pop((field, token), None)
+        for token in new_tokens - old_tokens:
+            posting = postings.get(token)
+            if posting is None:
+                posting = postings[token] = []
+                self._add_token(token)
+            posting.append(song_id)
+            self._arrays.pop((field, token), None)
+
+    def _add_token(self, token):
+        position = bisect.bisect_left(self._vocabulary, token)
+        if position < len(self._vocabulary) and self._vocabulary[position] == token:
+            return
+        self._vocabulary.insert(position, token)
+        token_trigrams = trigrams(token)
+        self._trigram_counts[token] = len(token_trigrams)
+        for trigram in token_trigrams:
+            self._trigrams.setdefault(trigram, []).append(token)
+
+    def _array(self, field, token):
+        array = self._arrays.get((field, token))
+        if array is None:
+            array = self._arrays[(field, token)] = np.fromiter(self._postings[field].get(token, ()), dtype=np.int64)
+        return array
+
+    def _expand(self, token, prefix):
+        """
+        Return the vocabulary tokens a query token matches, with their score.
+        """
+        matches = {}
+        position = bisect.bisect_left(self._vocabulary, token)
+        if position < len(self._vocabulary) and self._vocabulary[position] == token:
+            matches[token] = 1.0
+        if prefix:
+            for candidate in self._vocabulary[position:position + MAX_PREFIX_TOKENS]:
+                if not candidate.startswith(token):
+                    break
+                matches.setdefault(candidate, PREFIX_SCORE)
+        if len(token) >= 3:
+            query = trigrams(token)
+            shared = Counter(chain.from_iterable(self._trigrams.get(trigram, ()) for trigram in query))
+            counts = self._trigram_counts
+            similar = []
+            for candidate, count in shared.items():
+                # Jaccard similarity of the trigram sets
+                similarity = count / (len(query) + counts[candidate] - count)
+                if similarity >= MIN_SIMILARITY:
+                    similar.append((similarity, candidate))
+            for similarity, candidate in sorted(similar, reverse=True)[:MAX_FUZZY_TOKENS]:
+                matches.setdefault(candidate, FUZZY_SCORE * similarity)
+        return matches
+
+    def search(self, query, limit=10):
+        """
+        Find the songs best matching a query.
+
+        Every query token scores each song by its best matching token and field; the scores of
+        the query tokens add up, so songs matching more of the query rank first. The last token
+        also matches by prefix, for type-ahead.
+
+        :param query: str, the search text
+        :param limit: int, the number of results
+        :return: list of dict, the results with title, author, album and score, best first
+        """
+        tokens = tokenize(query)
+        with self._lock:
+            if not tokens or not self.songs:
+                return []
+            scores = np.zeros(len(self.songs))
+            for index, token in enumerate(tokens):
+                token_scores = np.zeros(len(self.songs))
+                for candidate, match_score in self._expand(token, prefix=index == len(tokens) - 1).items():
+                    for field, weight in self.fields.items():
+                        ids = self._array(field, candidate)
+                        if len(ids):
+                            token_scores[ids] = np.maximum(token_scores[ids], weight * match_score)
+                scores += token_scores
+
+            matched = np.flatnonzero(scores)
+            if len(matched) > limit:
+                matched = matched[np.argpartition(-scores[matched], limit - 1)[:limit]]
+            # Ties go to the song indexed first
+            matched = matched[np.lexsort((matched, -scores[matched]))]
+            return [
+                {'title': self.songs[song_id][0], 'author': self.songs[song_id][1],
+                 'album': self._texts[song_id].get('album'), 'score': float(scores[song_id])}
+                for song_id in matched
+            ]
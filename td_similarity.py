@@ -0,0 +1,182 @@
+import threading
+
+import numpy as np
+
+AUDIO_FEATURES = ['acousticness', 'danceability', 'energy', 'instrumentalness', 'liveness', 'speechiness', 'valence']
+# Rows scored per matrix product in batched queries, to bound the temporary distance matrix
+QUERY_BATCH_ROWS = 256
+
+
+class SimilarityIndex:
+    def __init__(self, fields=None, capacity=1024):
+        """
+        Initialize an empty nearest-neighbour index over the audio features of songs.
+
+        Songs are rows of a float32 matrix, compared by Euclidean distance after standardizing
+        each feature, so a feature with a wide spread does not dominate the others.
+        Distances to every row are computed with one matrix-vector product, using
+        |x - q|^2 = |x|^2 - 2 x.q + |q|^2.
+
+        :param fields: list of str, the feature fields (defaults to AUDIO_FEATURES)
+        :param capacity: int, the initial number of rows, doubled as songs are added
+        """
+        self.fields = list(AUDIO_FEATURES if fields is None else fields)
+        self.songs = []
+        self._ids = {}
+        self._raw = np.full((capacity, len(self.fields)), np.nan, dtype=np.float32)
+        # Standardized matrix and squared row norms, rebuilt on the first query after a change
+        self._scaled = None
+        self._norms = None
+        self._valid = None
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._ids)
+
+    def add(self, documents):
+        """
+        Add new songs and update the features of known ones (the last document of a song wins).
+
+        :param documents: iterable of dict, documents with title, author and the feature fields
+        :return: int, the number of songs added or updated
+        """
+        updated = 0
+        with self._lock:
+            for document in documents:
+                key = (document.get('title'), document.get('author'))
+                if key[0] is None:
+                    continue
+                row = np.array([_feature(document.get(field)) for field in self.fields], dtype=np.float32)
+                song_id = self._ids.get(key)
+                if song_id is None:
+                    song_id = self._ids[key] = len(self.songs)
+                    self.songs.append(key)
+                    if song_id == len(self._raw):
+                        grown = np.full((len(self._raw) * 2, len(self.fields)), np.nan, dtype=np.float32)
+                        grown[:song_id] = self._raw[:song_id]
+                        self._raw = grown
+                elif np.array_equal(self._raw[song_id], row, equal_nan=True):
+                    continue
+                self._raw[song_id] = row
+                updated += 1
+            if updated:
+                self._scaled = None
+        return updated
+
+    def remove(self, songs):
+        """
+        Drop songs from the index.
+
+        Their rows are blanked rather than reused, so they are never returned and the ids of the other songs stay valid.
+
+        :param songs: iterable of tuple, the (title, author) of the songs
+        :return: int, the number of songs removed
+        """
+        removed = 0
+        with self._lock:
+            for key in songs:
+                song_id = self._ids.pop(tuple(key), None)
+                if song_id is None:
+                    continue
+                self._raw[song_id] = np.nan
+                removed += 1
+            if removed:
+                self._scaled = None
+        return removed
+
+    def _prepare(self):
+        """
+        Return the standardized matrix, its squared row norms and the rows with every feature.
+        """
+        if self._scaled is None:
+            raw = self._raw[:len(self.songs)]
+            valid = ~np.isnan(raw).any(axis=1)
+            mean = raw[valid].mean(axis=0) if valid.any() else np.zeros(len(self.fields), dtype=np.float32)
+            std = raw[valid].std(axis=0) if valid.any() else np.ones(len(self.fields), dtype=np.float32)
+            self._mean, self._std = mean, np.where(std > 0, std, 1).astype(np.float32)
+            scaled = np.where(valid[:, None], (raw - self._mean) / self._std, 0).astype(np.float32)
+            norms = np.einsum('ij,ij->i', scaled, scaled)
+            # Rows missing a feature are never returned
+            norms[~valid] = np.inf
+            self._scaled, self._norms, self._valid = scaled, norms, valid
+        return self._scaled, self._norms, self._valid
+
+    def vector(self, title, author):
+        """
+        Return the raw features of a song (None if unknown or missing a feature).
+        """
+        with self._lock:
+            song_id = self._ids.get((title, author))
+            if song_id is None or np.isnan(self._raw[song_id]).any():
+                return None
+            return self._raw[song_id].copy()
+
+    def query(self, vectors, k=10, exclude=None):
+        """
+        Find the k nearest songs to each of a batch of feature vectors.
+
+        :param vectors: array-like, shape (n, len(fields)), the raw feature vectors
+        :param k: int, the number of neighbours per vector
+        :param exclude: list of callable, per vector a predicate on (title, author) of songs to skip (optional)
+        :return: list of list of tuple, per vector the ((title, author), distance) of its neighbours, nearest first
+        """
+        vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+        with self._lock:
+            scaled, norms, valid = self._prepare()
+            songs = self.songs
+            if not valid.any():
+                return [[] for _ in vectors]
+            queries = (vectors - self._mean) / self._std
+            results = []
+            for start in range(0, len(queries), QUERY_BATCH_ROWS):
+                batch = queries[start:start + QUERY_BATCH_ROWS]
+                distances = norms[None, :] - 2 * batch @ scaled.T + np.einsum('ij,ij->i', batch, batch)[:, None]
+                # Fetch extra candidates so skipped songs do not shorten the result
+                wanted = min(len(songs), k + (k + 1 if exclude else 0))
+                nearest = np.argpartition(distances, wanted - 1, axis=1)[:, :wanted]
+                for offset, (row, candidates) in enumerate(zip(distances, nearest)):
+                    skip = exclude[start + offset] if exclude else None
+                    neighbours = self._neighbours(row, candidates, skip)
+                    size = wanted
+                    while len(neighbours) < k and size < len(songs):
+                        size = min(len(songs), size * 4)
+                        neighbours = self._neighbours(row, np.argpartition(row, size - 1)[:size], skip)
+                    results.append(neighbours[:k])
+            return results
+
+    def _neighbours(self, distances, candidates, skip):
+        candidates = candidates[np.argsort(distances[candidates], kind='stable')]
+        return [
+            (self.songs[song_id], float(np.sqrt(max(distances[song_id], 0))))
+            for song_id in candidates
+            if np.isfinite(distances[song_id]) and not (skip and skip(self.songs[song_id]))
+        ]
+
+    def neighbours(self, title, author, k=10, exclude_author=False):
+        """
+        Find the k songs sounding most like a song.
+
+        :param title: str, the title of the song
+        :param author: str, the author of the song
+        :param k: int, the number of neighbours
+        :param exclude_author: bool, skip the songs of the same author
+        :return: list of tuple, the ((title, author), distance) of the neighbours, nearest first
+            (empty if the song is unknown or missing a feature)
+        """
+        vector = self.vector(title, author)
+        if vector is None:
+            return []
+        if exclude_author:
+            skip = lambda song: song[1] == author
+        else:
+            skip = lambda song: song == (title, author)
+        return self.query([vector], k, [skip])[0]
+
+
+def _feature(value):
+    if isinstance(value, bool) or value is None:
+        return np.nan
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
@@ -0,0 +1,165 @@
+import json
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+class SpotifyMetadataResolver:
+    def __init__(self, client, cache_path='.spotify_metadata.sqlite', ttl=7 * 24 * 3600, max_workers=8, max_retries=5, backoff=1.0):
+        """
+        Initialize the resolver for album art, preview URL and artist image of songs.
+
+        :param client: spotipy.Spotify or any object with the same search/artists methods
+        :param cache_path: str, the SQLite file caching resolved metadata (':memory:' to keep it in process)
+        :param ttl: float, seconds a cached lookup stays valid
+        :param max_workers: int, the number of concurrent Spotify requests
+        :param max_retries: int, retries for rate-limited or failed requests
+        :param backoff: float, the base delay in seconds for exponential backoff
+        """
+        self.client = client
+        self.ttl = ttl
+        self.max_workers = max_workers
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self._lock = threading.Lock()
+        self._resume_at = 0.0
+        self._connection = sqlite3.connect(cache_path, check_same_thread=False)
+        with self._lock, self._connection:
+            self._connection.execute(
+                'CREATE TABLE IF NOT EXISTS metadata ('
+                'title TEXT, author TEXT, payload TEXT, fetched_at REAL NOT NULL, '
+                'PRIMARY KEY (title, author))'
+            )
+
+    def resolve(self, title, author):
+        """
+        Resolve the Spotify metadata of a single song.
+
+        :param title: str, the title of the song
+        :param author: str, the author of the song
+        :return: dict, the album_cover_url, preview_url and artist_image_url (None if no track was found)
+        """
+        return self.resolve_many([(title, author)]).get((title, author))
+
+    def resolve_many(self, songs):
+        """
+        Resolve the Spotify metadata of many songs, fetching cache misses concurrently.
+
+        :param songs: iterable of (title, author) tuples
+        :return: dict, the metadata (or None) keyed by (title, author)
+        """
+        keys = list(dict.fromkeys((title, author) for title, author in songs))
+        results = self._read_cache(keys)
+        misses = [key for key in keys if key not in results]
+        if not misses:
+            return results
+
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(misses))) as executor:
+            fetched = dict(zip(misses, executor.map(self._search, misses)))
+
+        # Artist images are looked up in batches of 50, the Spotify API limit
+        artist_ids = list(dict.fromkeys(
+            track['artist_id'] for track in fetched.values() if track and track is not _FAILED and track['artist_id']
+        ))
+        artist_images = {}
+        for start in range(0, len(artist_ids), 50):
+            batch = artist_ids[start:start + 50]
+            try:
+                response = self._call(self.client.artists, batch)
+            except Exception as e:
+                print(f"Error fetching artists from Spotify: {e}")
+                continue
+            for artist in response.get('artists') or []:
+                if artist and artist.get('images'):
+                    artist_images[artist['id']] = artist['images'][0]['url']
+
+        resolved = {}
+        for key, track in fetched.items():
+            if track is _FAILED:
+                results[key] = None
+                continue
+            if track is not None:
+                artist_id = track.pop('artist_id')
+                track['artist_image_url'] = artist_images.get(artist_id)
+            resolved[key] = track
+        self._write_cache(resolved)
+        results.update(resolved)
+        return results
+
+    def clear(self):
+        """
+        Drop every cached lookup.
+        """
+        with self._lock, self._connection:
+            self._connection.execute('DELETE FROM metadata')
+
+    def _search(self, key):
+        """
+        Search Spotify for a song. Failed lookups return _FAILED and are not cached.
+        """
+        title, author = key
+        try:
+            search_results = self._call(self.client.search, q=f"track:{title} artist:{author}", type='track')
+        except Exception as e:
+            print(f"Error fetching song details from Spotify for {title}: {e}")
+            return _FAILED
+
+        items = search_results['tracks']['items']
+        if not items:
+            return None
+        track = items[0]
+        images = track['album'].get('images') or []
+        artists = track.get('artists') or []
+        return {
+            'album_cover_url': images[0]['url'] if images else None,
+            'preview_url': track.get('preview_url'),
+            'artist_id': artists[0].get('id') if artists else None
+        }
+
+    def _call(self, func, *args, **kwargs):
+        """
+        Call the Spotify client, backing off on rate limits (429) and server errors.
+        """
+        for attempt in range(self.max_retries + 1):
+            # All workers pause while a Retry-After window is open
+            with self._lock:
+                wait = self._resume_at - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+            try:
+                return func(*args, **kwargs)
+            except Exception as e:
+                status = getattr(e, 'http_status', None)
+                if attempt == self.max_retries or not (status == 429 or (status or 0) >= 500):
+                    raise
+                headers = getattr(e, 'headers', None) or {}
+                delay = float(headers.get('Retry-After') or self.backoff * 2 ** attempt)
+                with self._lock:
+                    self._resume_at = max(self._resume_at, time.monotonic() + delay)
+
+    def _read_cache(self, keys):
+        results = {}
+        oldest = time.time() - self.ttl
+        with self._lock:
+            for start in range(0, len(keys), 400):
+                batch = keys[start:start + 400]
+                clause = ' OR '.join(['(title = ? AND author = ?)'] * len(batch))
+                params = [value for key in batch for value in key]
+                rows = self._connection.execute(
+                    f'SELECT title, author, payload FROM metadata WHERE fetched_at >= ? AND ({clause})',
+                    [oldest, *params]
+                ).fetchall()
+                for title, author, payload in rows:
+                    results[(title, author)] = json.loads(payload)
+        return results
+
+    def _write_cache(self, resolved):
+        now = time.time()
+        rows = [(title, author, json.dumps(metadata), now) for (title, author), metadata in resolved.items()]
+        with self._lock, self._connection:
+            self._connection.executemany('INSERT OR REPLACE INTO metadata VALUES (?, ?, ?, ?)', rows)
+
+
+# Sentinel for lookups that raised, so they are retried on the next call instead of cached as "not found"
+_FAILED = object()
@@ -0,0 +1,727 @@
+import bisect
+import threading
+from datetime import datetime
+
+from bson import ObjectId
+from pymongo import ASCENDING, DESCENDING, DeleteOne, InsertOne, ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+from pymongo.results import BulkWriteResult, DeleteResult, InsertManyResult
+
+# Indexes of the in-memory engine per collection: hash indexes answer equality lookups,
+# the sorted index answers equality, range and ordered scans on one field
+MEMORY_INDEXES = {
+    'daily_trends': {
+        'hash': [('author',), ('title',), ('title', 'author')],
+        'unique': [('title', 'author', 'timestamp')],
+        'sorted': 'timestamp',
+    },
+    'song_timeseries': {
+        'hash': [('title',), ('title', 'author')],
+        'unique': [('title', 'author', 'month')],
+    },
+    'song_catalog': {
+        'hash': [('title',)],
+        'unique': [('title', 'author')],
+    },
+    'song_notes': {
+        'unique': [('title', 'author')],
+    },
+    'rank_movements': {
+        'hash': [('day',)],
+        'sorted': 'change',
+        'unique': [('day', 'title', 'author')],
+    },
+}
+
+_MISSING = object()
+_RANGE_OPERATORS = {'$gt', '$gte', '$lt', '$lte'}
+
+
+class MongoStorage:
+    # Runs aggregation pipelines and explains queries on a MongoDB server
+    server_side = True
+
+    def __init__(self, client, db_name):
+        """
+        Initialize a storage backend over a MongoDB database.
+
+        :param client: MongoClient, the client holding the connection pool
+        :param db_name: str, the database holding the collections
+        """
+        self.client = client
+        self.db_name = db_name
+        self.db = client[db_name]
+
+    def collection(self, name):
+        """
+        Return a collection by name.
+
+        :param name: str, the collection name
+        :return: pymongo.collection.Collection, the collection
+        """
+        return self.db[name]
+
+    def drop(self):
+        """
+        Drop every collection of the database.
+        """
+        self.client.drop_database(self.db_name)
+
+
+class MemoryStorage:
+    # Aggregation pipelines are not supported; DataLib runs the Python equivalent
+    server_side = False
+
+    def __init__(self, indexes=None):
+        """
+        Initialize an in-memory storage backend holding every collection in process.
+
+        It answers the DataLib queries from hash and sorted indexes without a server, as a hot
+        read replica for the dashboard or a service-free backend for tests and benchmarks.
+
+        :param indexes: dict, the indexes per collection name (defaults to MEMORY_INDEXES)
+        """
+        self.indexes = MEMORY_INDEXES if indexes is None else indexes
+        self.db_name = 'memory'
+        self._collections = {}
+        self._lock = threading.Lock()
+
+    def collection(self, name):
+        """
+        Return a collection by name, creating it on first use.
+
+        :param name: str, the collection name
+        :return: MemoryCollection, the collection
+        """
+        with self._lock:
+            collection = self._collections.get(name)
+            if collection is None:
+                spec = self.indexes.get(name, {})
+                collection = self._collections[name] = MemoryCollection(
+                    name, spec.get('hash', ()), spec.get('unique', ()), spec.get('sorted')
+                )
+            return collection
+
+    def drop(self):
+        """
+        Drop every collection.
+        """
+        with self._lock:
+            self._collections.clear()
+
+    def load(self, name, documents, batch_size=10000):
+        """
+        Load a snapshot of documents into a collection, replacing its content.
+
+        :param name: str, the collection name
+        :param documents: iterable of dict, e.g. a cursor over the source collection
+        :param batch_size: int, the number of documents inserted at a time
+        :return: int, the number of documents loaded
+        """
+        collection = self.collection(name)
+        collection.delete_many({})
+        count = 0
+        batch = []
+        for document in documents:
+            batch.append(document)
+            if len(batch) == batch_size:
+                count += len(collection.insert_many(batch).inserted_ids)
+                batch = []
+        if batch:
+            count += len(collection.insert_many(batch).inserted_ids)
+        return count
+
+    @classmethod
+    def from_storage(cls, source, names, batch_size=10000, indexes=None):
+        """
+        Build an in-memory replica of collections of another storage backend.
+
+        :param source: MongoStorage or MemoryStorage, the storage to copy
+        :param names: list of str, the collections to copy
+        :param batch_size: int, the number of documents fetched per round trip
+        :param indexes: dict, the indexes per collection name (defaults to MEMORY_INDEXES)
+        :return: MemoryStorage, the loaded replica
+        """
+        storage = cls(indexes)
+        for name in names:
+            storage.load(name, source.collection(name).find({}).batch_size(batch_size), batch_size)
+        return storage
+
+
+class MemoryCollection:
+    def __init__(self, name, hash_indexes=(), unique_indexes=(), sorted_field=None):
+        """
+        Initialize an in-memory collection answering the subset of the pymongo Collection API DataLib uses.
+
+        Returned documents share nested values with the stored ones and must not be mutated.
+
+        :param name: str, the collection name
+        :param hash_indexes: list of tuple of str, the fields of each hash index
+        :param unique_indexes: list of tuple of str, the fields of each unique hash index
+        :param sorted_field: str, the field kept in a sorted index (None for no sorted index)
+        """
+        self.name = name
+        self.sorted_field = sorted_field
+        self._documents = {}
+        self._positions = {}
+        self._next_position = 0
+        self._hash = {tuple(fields): {} for fields in (*hash_indexes, *unique_indexes)}
+        self._unique = [tuple(fields) for fields in unique_indexes]
+        self._sorted = []
+        self._sort_keys = {}
+        self._indexed_fields = {field for fields in self._hash for field in fields} | ({sorted_field} - {None})
+        self._lock = threading.RLock()
+
+    # Reads
+
+    def find(self, filter=None, projection=None, sort=None, limit=0, **kwargs):
+        """
+        Return a cursor over the documents matching a filter.
+        """
+        return MemoryCursor(self, filter or {}, projection, sort, limit)
+
+    def find_one(self, filter=None, projection=None, sort=None, **kwargs):
+        """
+        Return the first document matching a filter (None if there is none).
+        """
+        for document in self.find(filter, projection, sort, limit=1):
+            return document
+        return None
+
+    def distinct(self, key, filter=None):
+        """
+        Return the distinct values of a field among the documents matching a filter.
+        """
+        with self._lock:
+            if not filter and (key,) in self._hash:
+                values = [values[0] for values in self._hash[(key,)] if values[0] is not None]
+                # Index keys of arrays and dates are converted, so only scalar keys can be returned as is
+                if not any(isinstance(value, tuple) for value in values):
+                    return values
+            values = []
+            for document in self._run(filter or {}, None, 0):
+                value = _get(document, key)
+                for item in (value if isinstance(value, list) else [value]):
+                    if item is not _MISSING and item is not None and item not in values:
+                        values.append(item)
+            return values
+
+    def count_documents(self, filter):
+        with self._lock:
+            return len(self._run(filter, None, 0))
+
+    def aggregate(self, pipeline, **kwargs):
+        raise NotImplementedError('Aggregation pipelines are not supported by the in-memory storage')
+
+    def create_indexes(self, models):
+        """
+        Accept index declarations; the in-memory indexes are fixed by MEMORY_INDEXES.
+
+        :return: list of str, the declared index names
+        """
+        return [model.document['name'] for model in models]
+
+    # Writes
+
+    def insert_many(self, documents, ordered=True):
+        """
+        Insert documents, assigning an ObjectId to those without an _id.
+        """
+        with self._lock:
+            inserted = []
+            for document in documents:
+                document.setdefault('_id', ObjectId())
+                self._insert(document)
+                inserted.append(document['_id'])
+            return InsertManyResult(inserted, True)
+
+    def bulk_write(self, requests, ordered=True):
+        """
+        Apply InsertOne, UpdateOne and DeleteOne requests.
+        """
+        result = {
+            'writeErrors': [], 'writeConcernErrors': [], 'nInserted': 0, 'nUpserted': 0,
+            'nMatched': 0, 'nModified': 0, 'nRemoved': 0, 'upserted': []
+        }
+        with self._lock:
+            for index, request in enumerate(requests):
+                try:
+                    if isinstance(request, InsertOne):
+                        document = request._doc
+                        document.setdefault('_id', ObjectId())
+                        self._insert(document)
+                        result['nInserted'] += 1
+                    elif isinstance(request, UpdateOne):
+                        matched, modified, upserted_id = self._update_one(request._filter, request._doc, request._upsert)
+                        result['nMatched'] += matched
+                        result['nModified'] += modified
+                        if upserted_id is not None:
+                            result['nUpserted'] += 1
+                            result['upserted'].append({'index': index, '_id': upserted_id})
+                    elif isinstance(request, DeleteOne):
+                        matches = self._run(request._filter, None, 1)
+                        if matches:
+                            self._remove(matches[0])
+                            result['nRemoved'] += 1
+                    else:
+                        raise NotImplementedError(f'{type(request).__name__} is not supported by the in-memory storage')
+                except DuplicateKeyError as e:
+                    result['writeErrors'].append({'index': index, 'code': 11000, 'errmsg': str(e), 'op': request._doc})
+                    if ordered:
+                        break
+        if result['writeErrors']:
+            raise BulkWriteError(result)
+        return BulkWriteResult(result, True)
+
+    def find_one_and_update(self, filter, update, projection=None, return_document=ReturnDocument.BEFORE, upsert=False, **kwargs):
+        with self._lock:
+            matches = self._run(filter, None, 1)
+            if not matches:
+                if not upsert:
+                    return None
+                _, _, key = self._update_one(filter, update, upsert=True)
+                return _project(self._documents[_hashable(key)], projection) if return_document == ReturnDocument.AFTER else None
+            document = matches[0]
+            before = dict(document)
+            self._apply(document, update)
+            return _project(document if return_document == ReturnDocument.AFTER else before, projection)
+
+    def find_one_and_delete(self, filter, projection=None, **kwargs):
+        with self._lock:
+            matches = self._run(filter, None, 1)
+            if not matches:
+                return None
+            self._remove(matches[0])
+            return _project(matches[0], projection)
+
+    def delete_many(self, filter):
+        with self._lock:
+            if not filter:
+                count = len(self._documents)
+                self._documents.clear()
+                self._positions.clear()
+                self._sorted.clear()
+                self._sort_keys.clear()
+                for entries in self._hash.values():
+                    entries.clear()
+                return DeleteResult({'n': count}, True)
+            matches = self._run(filter, None, 0)
+            for document in matches:
+                self._remove(document)
+            return DeleteResult({'n': len(matches)}, True)
+
+    # Query execution
+
+    def _run(self, filter, sort, limit, projection=None):
+        """
+        Return the matching stored documents, sorted and limited, using the best index.
+        """
+        # Fields matched by equality are constant across the result and need no sorting
+        sort = [(field, direction) for field, direction in sort or [] if field not in filter or _is_operator(filter[field])]
+        by_index = len(sort) == 1 and sort[0][0] == self.sorted_field
+        descending = by_index and sort[0][1] == DESCENDING
+        ids, residual = self._candidates(filter, by_index, descending)
+        if by_index and not isinstance(ids, _SortedScan):
+            ids = sorted(ids, key=self._sort_keys.__getitem__, reverse=descending)
+
+        documents = self._documents
+        if sort and not by_index:
+            matches = [documents[key] for key in ids if not residual or _matches(documents[key], residual)]
+            if all(direction == ASCENDING for _, direction in sort):
+                matches.sort(key=lambda document: tuple(_sort_key(_get(document, field)) for field, _ in sort))
+            else:
+                # Stable sorts from the last key to the first give the compound order
+                for field, direction in reversed(sort):
+                    matches.sort(key=lambda document: _sort_key(_get(document, field)), reverse=direction == DESCENDING)
+            if limit:
+                matches = matches[:limit]
+        else:
+            matches = []
+            for key in ids:
+                document = documents[key]
+                if not residual or _matches(document, residual):
+                    matches.append(document)
+                    if limit and len(matches) == limit:
+                        break
+        if projection is not None:
+            return [_project(document, projection) for document in matches]
+        return matches
+
+    def _candidates(self, filter, scan_sorted=False, descending=False):
+        """
+        Narrow the documents to scan with the _id, a hash index or the sorted index.
+
+        Indexed fields must hold scalar values: an index answers equality on the whole value.
+
+        :return: tuple, (iterable of ids in natural or index order, the part of the filter left to check)
+        """
+        def residual(*fields):
+            return {field: condition for field, condition in filter.items() if field not in fields}
+
+        if '_id' in filter and not _is_operator(filter['_id']):
+            key = _hashable(filter['_id'])
+            return ([key] if key in self._documents else []), residual('_id')
+
+        equal = [field for field, value in filter.items() if not field.startswith('$') and not _is_operator(value)]
+        best = max((fields for fields in self._hash if all(field in equal for field in fields)), key=len, default=None)
+        if best is not None:
+            ids = self._hash[best].get(tuple(_hashable(filter[field]) for field in best), {})
+            return list(ids), residual(*best)
+
+        for fields in self._hash:
+            condition = filter.get(fields[0])
+            if len(fields) == 1 and isinstance(condition, dict) and set(condition) == {'$in'}:
+                ids = set()
+                for value in condition['$in']:
+                    ids.update(self._hash[fields].get((_hashable(value),), ()))
+                return sorted(ids, key=self._positions.__getitem__), residual(fields[0])
+
+        if self.sorted_field is not None:
+            condition = filter.get(self.sorted_field, _MISSING)
+            if condition is not _MISSING and not (isinstance(condition, dict) and not set(condition) <= _RANGE_OPERATORS):
+                return _SortedScan(self, condition, descending), residual(self.sorted_field)
+            if scan_sorted:
+                return _SortedScan(self, None, descending), filter
+        return list(self._documents), filter
+
+    # Index maintenance
+
+    def _insert(self, document):
+        key = _hashable(document['_id'])
+        if key in self._documents:
+            raise DuplicateKeyError(f"E11000 duplicate key error collection: {self.name} index: _id_ dup key: {document['_id']}")
+        for fields in self._unique:
+            if self._hash[fields].get(_index_key(document, fields)):
+                raise DuplicateKeyError(f"E11000 duplicate key error collection: {self.name} index: {'_'.join(fields)}")
+        self._documents[key] = document
+        self._positions[key] = self._next_position
+        self._next_position += 1
+        self._index(document)
+
+    def _remove(self, document):
+        self._unindex(document)
+        key = _hashable(document['_id'])
+        del self._documents[key]
+        del self._positions[key]
+
+    def _index(self, document):
+        key = _hashable(document['_id'])
+        for fields, entries in self._hash.items():
+            # Dicts keep the ids in insertion order, so lookups need no sort
+            entries.setdefault(_index_key(document, fields), {})[key] = None
+        if self.sorted_field is not None:
+            sort_key = self._sort_keys[key] = _sort_key(_get(document, self.sorted_field))
+            bisect.insort(self._sorted, (sort_key, self._positions[key], key))
+
+    def _unindex(self, document):
+        key = _hashable(document['_id'])
+        for fields, entries in self._hash.items():
+            index_key = _index_key(document, fields)
+            ids = entries.get(index_key)
+            if ids is not None:
+                ids.pop(key, None)
+                if not ids:
+                    del entries[index_key]
+        if self.sorted_field is not None:
+            entry = (self._sort_keys.pop(key), self._positions[key], key)
+            position = bisect.bisect_left(self._sorted, entry)
+            if position < len(self._sorted) and self._sorted[position] == entry:
+                del self._sorted[position]
+
+    def _update_one(self, filter, update, upsert):
+        """
+        Apply an update to the first matching document, or insert it when upsert is set.
+
+        :return: tuple, (matched, modified, upserted _id)
+        """
+        matches = self._run(filter, None, 1)
+        if matches:
+            modified = self._apply(matches[0], update)
+            return 1, int(modified), None
+        if not upsert:
+            return 0, 0, None
+        document = {field: value for field, value in filter.items() if not field.startswith('$') and not _is_operator(value)}
+        _apply_operators(document, update, inserting=True)
+        document.setdefault('_id', ObjectId())
+        self._insert(document)
+        return 0, 0, document['_id']
+
+    def _apply(self, document, update):
+        """
+        Update a stored document in place, keeping the indexes in sync.
+
+        :return: bool, whether the document changed
+        """
+        before = {field: document[field] for field in self._indexed_fields if field in document}
+        before['_id'] = document['_id']
+        changed = _apply_operators(document, update, inserting=False)
+        if changed and any(document.get(field, _MISSING) != before.get(field, _MISSING) for field in self._indexed_fields):
+            self._unindex(before)
+            self._index(document)
+        return changed
+
+
+class _SortedScan:
+    def __init__(self, collection, condition, descending):
+        """
+        Iterate the ids of a sorted index, restricted to an equality or range condition.
+        """
+        self.collection = collection
+        self.condition = condition
+        self.descending = descending
+
+    def __iter__(self):
+        entries = self.collection._sorted
+        low, high = 0, len(entries)
+        condition = self.condition
+        if condition is not None:
+            bounds = condition if isinstance(condition, dict) else {'$gte': condition, '$lte': condition}
+            for operator, value in bounds.items():
+                key = _sort_key(value)
+                # Ranges only match values of the bound's type, like MongoDB's type bracketing
+                low = max(low, bisect.bisect_left(entries, ((key[0],),)))
+                high = min(high, bisect.bisect_left(entries, ((key[0] + 1,),)))
+                if operator == '$gte':
+                    low = max(low, bisect.bisect_left(entries, (key,)))
+                elif operator == '$gt':
+                    low = max(low, bisect.bisect_right(entries, (key, float('inf'))))
+                elif operator == '$lte':
+                    high = min(high, bisect.bisect_right(entries, (key, float('inf'))))
+                elif operator == '$lt':
+                    high = min(high, bisect.bisect_left(entries, (key,)))
+        positions = range(high - 1, low - 1, -1) if self.descending else range(low, high)
+        for position in positions:
+            yield entries[position][2]
+
+
+class MemoryCursor:
+    def __init__(self, collection, filter, projection, sort=None, limit=0):
+        """
+        Initialize a lazy cursor; the query runs on first iteration, like a pymongo cursor.
+        """
+        self.collection = collection
+        self.filter = filter
+        self.projection = projection
+        self._sort = _normalize_sort(sort)
+        self._limit = limit
+        self._results = None
+
+    def sort(self, key_or_list, direction=None):
+        self._sort = _normalize_sort(key_or_list if direction is None else [(key_or_list, direction)])
+        return self
+
+    def limit(self, limit):
+        self._limit = limit
+        return self
+
+    def batch_size(self, batch_size):
+        return self
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self._results is None:
+            with self.collection._lock:
+                self._results = iter(self.collection._run(self.filter, self._sort, self._limit, self.projection or {}))
+        return next(self._results)
+
+
+def _normalize_sort(sort):
+    if sort is None:
+        return None
+    if isinstance(sort, str):
+        return [(sort, ASCENDING)]
+    if isinstance(sort, dict):
+        return list(sort.items())
+    return [(field, direction) for field, direction in sort]
+
+
+def _is_operator(value):
+    return isinstance(value, dict) and bool(value) and all(key.startswith('$') for key in value)
+
+
+def _hashable(value):
+    if isinstance(value, datetime):
+        return _sort_key(value)
+    if isinstance(value, list):
+        return tuple(_hashable(item) for item in value)
+    if isinstance(value, dict):
+        return tuple((key, _hashable(item)) for key, item in value.items())
+    return value
+
+
+def _index_key(document, fields):
+    return tuple(_hashable(document.get(field)) for field in fields)
+
+
+def _get(document, path):
+    """
+    Read a possibly dotted field path (_MISSING if absent).
+    """
+    value = document
+    for part in path.split('.'):
+        if isinstance(value, dict):
+            value = value.get(part, _MISSING)
+        elif isinstance(value, list) and part.isdigit() and int(part) < len(value):
+            value = value[int(part)]
+        else:
+            return _MISSING
+        if value is _MISSING:
+            return _MISSING
+    return value
+
+
+# Cross-type order of BSON values, so mixed fields sort like they do in MongoDB
+_TYPE_ORDER = [
+    (type(None), 0), (bool, 7), (int, 1), (float, 1), (str, 2), (dict, 3), (list, 4), (ObjectId, 6), (datetime, 8)
+]
+
+
+def _sort_key(value):
+    if value is _MISSING or value is None:
+        return (0, 0)
+    for kind, rank in _TYPE_ORDER:
+        if isinstance(value, kind):
+            if rank in (3, 4):
+                return (rank, repr(value))
+            if rank == 8 and value.tzinfo is not None:
+                value = value.replace(tzinfo=None) - value.utcoffset()
+            return (rank, value)
+    return (9, repr(value))
+
+
+def _compare(value, operator, target):
+    candidates = value if isinstance(value, list) else [value]
+    target_key = _sort_key(target)
+    for candidate in candidates:
+        if candidate is _MISSING:
+            continue
+        key = _sort_key(candidate)
+        if key[0] != target_key[0]:
+            continue
+        if ((operator == '$gt' and key > target_key) or (operator == '$gte' and key >= target_key)
+                or (operator == '$lt' and key < target_key) or (operator == '$lte' and key <= target_key)):
+            return True
+    return False
+
+
+def _equals(value, target):
+    if value is _MISSING:
+        return target is None
+    if isinstance(value, datetime) and isinstance(target, datetime):
+        return _sort_key(value) == _sort_key(target)
+    if value == target:
+        return True
+    return isinstance(value, list) and target in value
+
+
+def _matches(document, filter):
+    for field, condition in filter.items():
+        if field == '$and':
+            if not all(_matches(document, part) for part in condition):
+                return False
+            continue
+        if field == '$or':
+            if not any(_matches(document, part) for part in condition):
+                return False
+            continue
+        value = _get(document, field)
+        if not _is_operator(condition):
+            if not _equals(value, condition):
+                return False
+            continue
+        for operator, target in condition.items():
+            if operator == '$eq':
+                matched = _equals(value, target)
+            elif operator == '$ne':
+                matched = not _equals(value, target)
+            elif operator == '$in':
+                matched = any(_equals(value, item) for item in target)
+            elif operator == '$nin':
+                matched = not any(_equals(value, item) for item in target)
+            elif operator == '$exists':
+                matched = (value is not _MISSING) == bool(target)
+            elif operator in _RANGE_OPERATORS:
+                matched = _compare(value, operator, target)
+            else:
+                raise NotImplementedError(f'{operator} is not supported by the in-memory storage')
+            if not matched:
+                return False
+    return True
+
+
+def _project(document, projection):
+    if not projection:
+        return dict(document)
+    projection = dict(projection)
+    include_id = projection.pop('_id', 1)
+    if projection and any(projection.values()):
+        projected = {field: document[field] for field in projection if projection[field] and field in document}
+        if include_id and '_id' in document:
+            projected = {'_id': document['_id'], **projected}
+        return projected
+    projected = {field: value for field, value in document.items() if field not in projection}
+    if not include_id:
+        projected.pop('_id', None)
+    return projected
+
+
+def _set_path(document, path, value):
+    parts = path.split('.')
+    target = document
+    for part in parts[:-1]:
+        if isinstance(target, list):
+            target = target[int(part)]
+        else:
+            target = target.setdefault(part, {})
+    if isinstance(target, list):
+        target[int(parts[-1])] = value
+    else:
+        target[parts[-1]] = value
+
+
+def _apply_operators(document, update, inserting):
+    """
+    Apply $set, $unset, $inc, $max and (when inserting) $setOnInsert to a document, or replace it.
+
+    :return: bool, whether the document changed
+    """
+    if not any(key.startswith('$') for key in update):
+        replacement = {'_id': document.get('_id'), **update} if '_id' in document else dict(update)
+        changed = replacement != document
+        document.clear()
+        document.update(replacement)
+        return changed
+
+    changed = False
+    for operator, fields in update.items():
+        if operator == '$setOnInsert' and not inserting:
+            continue
+        if operator in ('$set', '$setOnInsert'):
+            for path, value in fields.items():
+                if _get(document, path) != value:
+                    _set_path(document, path, value)
+                    changed = True
+        elif operator in ('$inc', '$max'):
+            for path, value in fields.items():
+                current = _get(document, path)
+                if current is _MISSING:
+                    updated = value
+                elif operator == '$inc':
+                    updated = current + value
+                else:
+                    updated = current if _sort_key(current) >= _sort_key(value) else value
+                if updated != current:
+                    _set_path(document, path, updated)
+                    changed = True
+        elif operator == '$unset':
+            for path in fields:
+                parts = path.split('.')
+                parent = _get(document, '.'.join(parts[:-1])) if len(parts) > 1 else document
+                if isinstance(parent, dict) and parts[-1] in parent:
+                    del parent[parts[-1]]
+                    changed = True
+        else:
+            raise NotImplementedError(f'{operator} is not supported by the in-memory storage')
+    return changed
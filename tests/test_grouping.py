@@ -0,0 +1,209 @@
+import unittest
+from datetime import datetime, timedelta, timezone
+
+from bson import ObjectId
+
+from td_dp_lib import LATEST_FIELDS, DataLib, _group_records, _song_pipeline, _song_sort
+from td_storage import _MISSING, MemoryStorage, _get, _matches, _sort_key
+
+DAY = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+
+def evaluate(expression, variables):
+    """
+    Evaluate an aggregation expression; operators it does not know raise KeyError, so the pipeline can't outgrow the test.
+    """
+    if isinstance(expression, str) and expression.startswith('$$'):
+        name, _, path = expression[2:].partition('.')
+        return _get(variables[name], path) if path else variables[name]
+    if isinstance(expression, str) and expression.startswith('$'):
+        return _get(variables['ROOT'], expression[1:])
+    if isinstance(expression, list):
+        return [evaluate(item, variables) for item in expression]
+    if isinstance(expression, dict):
+        if len(expression) == 1 and next(iter(expression)).startswith('$'):
+            (operator, argument), = expression.items()
+            return OPERATORS[operator](argument, variables)
+        values = {key: evaluate(value, variables) for key, value in expression.items()}
+        # Fields that resolve to nothing are left out, like in MongoDB
+        return {key: value for key, value in values.items() if value is not _MISSING}
+    return expression
+
+
+def _if_null(argument, variables):
+    value = evaluate(argument[0], variables)
+    return evaluate(argument[1], variables) if value is None or value is _MISSING else value
+
+
+def _max(argument, variables):
+    values = evaluate(argument, variables)
+    values = [value for value in values if value is not None and value is not _MISSING]
+    return max(values) if values else None
+
+
+def _array_elem_at(argument, variables):
+    array, index = evaluate(argument, variables)
+    return array[index] if -len(array) <= index < len(array) else _MISSING
+
+
+def _reduce(argument, variables):
+    value = evaluate(argument['initialValue'], variables)
+    for item in evaluate(argument['input'], variables):
+        value = evaluate(argument['in'], {**variables, 'value': value, 'this': item})
+    return value
+
+
+OPERATORS = {
+    '$ifNull': _if_null,
+    '$max': _max,
+    '$size': lambda argument, variables: len(evaluate(argument, variables)),
+    '$slice': lambda argument, variables: (lambda array, position, n: array[position:position + n])(*evaluate(argument, variables)),
+    '$arrayElemAt': _array_elem_at,
+    '$zip': lambda argument, variables: [list(items) for items in zip(*evaluate(argument['inputs'], variables))],
+    '$map': lambda argument, variables: [
+        evaluate(argument['in'], {**variables, argument['as']: item}) for item in evaluate(argument['input'], variables)
+    ],
+    '$reduce': _reduce,
+}
+
+
+def _sort(documents, spec):
+    documents = list(documents)
+    # Stable sorts from the last key to the first give the compound order
+    for field, direction in reversed(list(spec.items())):
+        documents.sort(key=lambda document: _sort_key(_get(document, field)), reverse=direction == -1)
+    return documents
+
+
+def _group(documents, spec):
+    groups = {}
+    for document in documents:
+        key = evaluate(spec['_id'], {'ROOT': document})
+        group = groups.setdefault(repr(key), {'_id': key})
+        for field, accumulator in spec.items():
+            if field == '_id':
+                continue
+            (operator, expression), = accumulator.items()
+            value = evaluate(expression, {'ROOT': document})
+            if operator == '$first':
+                group.setdefault(field, value)
+            elif operator == '$last':
+                group[field] = value
+            elif operator == '$push':
+                group.setdefault(field, []).append(value)
+            else:
+                raise KeyError(operator)
+    return list(groups.values())
+
+
+STAGES = {
+    '$match': lambda documents, spec: [document for document in documents if _matches(document, spec)],
+    '$sort': _sort,
+    '$group': _group,
+    '$set': lambda documents, spec: [
+        {**document, **{field: evaluate(expression, {'ROOT': document}) for field, expression in spec.items()}}
+        for document in documents
+    ],
+}
+
+
+def run(pipeline, documents):
+    """
+    Run a pipeline over documents with MongoDB's semantics for the stages and operators it uses.
+    """
+    for stage in pipeline:
+        (name, spec), = stage.items()
+        documents = STAGES[name](documents, spec)
+    return documents
+
+
+def occurrence(title, author, day, graph_values=None, **fields):
+    document = {'_id': ObjectId(), 'title': title, 'author': author, 'timestamp': DAY + timedelta(days=day), **fields}
+    if graph_values is not None:
+        document['graph_values'] = graph_values
+    return document
+
+
+class SongPipelineTest(unittest.TestCase):
+    def setUp(self):
+        # Written out of order, with graph_values of different lengths or missing, and the
+        # same title under two authors
+        self.documents = [
+            occurrence('A', 'X', 2, [2, 9, 1], rank=1, popularity=80, description='late', distributors=['d1']),
+            occurrence('A', 'X', 0, [5, 1, 3], rank=4, popularity=60, description='early'),
+            occurrence('A', 'X', 1, [1, 4], rank=2, distributors=['d1']),
+            occurrence('B', 'X', 1, rank=3),
+            occurrence('C', 'X', 0, [7, 7], rank=5, distributors=['d1']),
+            occurrence('C', 'X', 3, rank=6),
+            occurrence('A', 'Y', 1, [8, 8, 8], rank=7),
+        ]
+        self.db = DataLib(None, cache=None, storage=MemoryStorage())
+        self.db.storage.collection(self.db.collection_name).insert_many(self.documents)
+
+    def records(self, match, include_occurrences=False):
+        stored = self.db.storage.collection(self.db.collection_name).find({})
+        return run(_song_pipeline(match, include_occurrences), stored)
+
+    def test_records(self):
+        records = {(record['_id']['title'], record['_id']['author']): record for record in self.records({'author': 'X'})}
+        # Scoped to the author
+        self.assertEqual(set(records), {('A', 'X'), ('B', 'X'), ('C', 'X')})
+
+        song = records['A', 'X']
+        self.assertEqual(song['first']['description'], 'early')
+        # Element-wise max over every occurrence, truncated to the shortest list
+        self.assertEqual(song['graph_values'], [5, 9])
+        # Only LATEST_FIELDS of the latest occurrence, leaving out the fields it lacks
+        self.assertEqual(song['latest'], {
+            '_id': self.documents[0]['_id'], 'timestamp': DAY + timedelta(days=2), 'rank': 1, 'popularity': 80, 'graph_values': [2, 9, 1]
+        })
+        self.assertTrue(set(song['latest']) <= set(LATEST_FIELDS))
+
+        self.assertEqual(records['B', 'X']['graph_values'], [])
+        self.assertEqual(records['C', 'X']['graph_values'], [])
+        # Ordered by first occurrence
+        self.assertEqual([record['_id']['title'] for record in self.records({'author': 'X'})], ['A', 'C', 'B'])
+
+    def test_python_grouping_matches(self):
+        matches = [
+            {'author': 'X'}, {'title': 'A'}, {'title': 'A', 'author': 'X'}, {'author': 'Y'},
+            {'author': 'X', 'distributors': {'$in': ['d1']}}, {'author': 'Z'},
+        ]
+        collection = self.db.storage.collection(self.db.collection_name)
+        for match in matches:
+            for include_occurrences in (False, True):
+                with self.subTest(match=match, include_occurrences=include_occurrences):
+                    records = [
+                        {key: value for key, value in record.items() if key != '_id'}
+                        for record in self.records(match, include_occurrences)
+                    ]
+                    grouped = _group_records(collection.find(match).sort(list(_song_sort(match).items())), include_occurrences)
+                    grouped.sort(key=lambda record: (record['first']['timestamp'], record['first']['_id']))
+                    self.assertEqual(records, grouped)
+
+                    songs = self.db._songs_from_records(self.records(match, include_occurrences))
+                    memory = self.db._aggregate_songs(match, include_occurrences)
+                    self.assertEqual([self.describe(song) for song in songs], [self.describe(song) for song in memory])
+
+    def test_songs_match_grouping_in_python(self):
+        # get_songs_by_author(aggregate=False) groups every occurrence in Python
+        for author in ('X', 'Y'):
+            with self.subTest(author):
+                songs = self.db._songs_from_records(self.records({'author': author}, include_occurrences=True))
+                grouped = self.db.get_songs_by_author(author, aggregate=False)
+                self.assertEqual([self.describe(song) for song in songs], [self.describe(song) for song in grouped])
+
+    @staticmethod
+    def describe(song):
+        """
+        Return what a Song shows of its occurrences, as comparable values.
+        """
+        return (
+            song.id, song.title, song.author, tuple(song.graph_values), song.timestamp, song.popularity,
+            song.latest_occurrence['_id'], song.latest_occurrence.get('rank'),
+            tuple(occurrence['_id'] for occurrence in song.all_occurrences),
+        )
+
+
+if __name__ == '__main__':
+    unittest.main()
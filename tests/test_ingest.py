@@ -0,0 +1,72 @@
+import json
+import os
+import tempfile
+import unittest
+
+from td_dp_lib import DataLib
+from td_ingest import iter_trending_items
+from td_storage import MemoryStorage
+
+
+def chart(stamp, titles):
+    """
+    Return the items of one chart snapshot, ranked in the order of titles.
+    """
+    return [
+        {'title': title, 'author': 'Artist', 'rank': rank, 'popularity': 50 + rank, 'timestamp': stamp, 'graph_values': [1, 2]}
+        for rank, title in enumerate(titles, 1)
+    ]
+
+
+class OffsetTimestampTest(unittest.TestCase):
+    def test_days_are_utc(self):
+        # 01:00 at +02:00 is 23:00 UTC the day before, the day MongoDB stores it under
+        db = DataLib(None, cache=None, storage=MemoryStorage())
+        db.upsert_data(chart('2024-01-01T01:00:00+02:00', ['A', 'B']) + chart('2024-01-02T01:00:00+02:00', ['B', 'A']))
+
+        self.assertEqual(len(db.get_daily_top_songs('2023-12-31')), 2)
+        self.assertEqual(len(db.get_daily_top_songs('2024-01-01')), 2)
+        self.assertTrue(db.get_daily_top_songs('2024-01-02').empty)
+        self.assertEqual(len(db.get_rank_movements('2024-01-01')), 2)
+
+        history = db.get_song_history('A', 'Artist')
+        self.assertEqual(history['date'].dt.strftime('%Y-%m-%d').tolist(), ['2023-12-31', '2024-01-01'])
+        self.assertEqual(history['popularity'].tolist(), [51, 52])
+
+
+class TrendingFileTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+    def write(self, name, content):
+        path = os.path.join(self.directory, name)
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(content)
+        return path
+
+    def test_timestamp_after_the_data(self):
+        items = [{'title': f'Song {index}', 'author': 'Artist', 'rank': index + 1} for index in range(50)]
+        path = self.write('trending_music_late.json', json.dumps({'data': items, 'timestamp': '2024-01-01T00:00:00Z'}))
+        # A read size far below the file size, so the items are streamed rather than read at once
+        read = list(iter_trending_items(path, read_size=64))
+        self.assertEqual([item['title'] for item in read], [item['title'] for item in items])
+        self.assertTrue(all(item['timestamp'] == '2024-01-01T00:00:00Z' for item in read))
+
+    def test_file_without_timestamp(self):
+        path = self.write('trending_music_none.json', json.dumps({'data': [{'title': 'A'}, {'title': 'B'}]}))
+        self.assertEqual(list(iter_trending_items(path, read_size=8)), [{'title': 'A'}, {'title': 'B'}])
+
+    def test_reingesting_a_file_is_idempotent(self):
+        path = self.write('trending_music_day.json', json.dumps({'timestamp': '2024-01-01T00:00:00Z', 'data': chart(None, ['A', 'B', 'C'])}))
+        db = DataLib(None, cache=None, storage=MemoryStorage())
+        first = db.ingest_files([path])
+        second = db.ingest_files([path])
+        self.assertEqual(first['upserted'], 3)
+        self.assertEqual(second['upserted'], 0)
+        self.assertEqual(len(db.get_song_data()), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,49 @@
+import unittest
+
+from td_dp_lib import DataLib
+from td_storage import MemoryStorage
+
+
+def chart(stamp, titles, note=None):
+    """
+    Return the items of one chart snapshot, ranked in the order of titles, with an embedded note.
+    """
+    return [
+        {'title': title, 'author': 'Artist', 'rank': rank, 'timestamp': stamp, 'graph_values': [1, 2], 'note': note}
+        for rank, title in enumerate(titles, 1)
+    ]
+
+
+class DataFrameNotesTest(unittest.TestCase):
+    def setUp(self):
+        self.db = DataLib(None, cache=True, storage=MemoryStorage())
+        self.db.upsert_data(chart('2024-01-01T00:00:00Z', ['A', 'B'], 'embedded') + chart('2024-01-02T00:00:00Z', ['A', 'B'], 'embedded'))
+        # Read once so the frames are cached before the notes are written
+        self.reads()
+        self.db.add_notes([{'title': 'A', 'author': 'Artist', 'note': 'side'}])
+
+    def reads(self):
+        return {
+            'get_song_data': self.db.get_song_data(),
+            'get_song_data[fields]': self.db.get_song_data(fields=['rank', 'note']),
+            'get_latest_snapshot': self.db.get_latest_snapshot(),
+            'filter_by_date_range': self.db.filter_by_date_range('2024-01-01', '2024-01-02'),
+            'get_daily_top_songs': self.db.get_daily_top_songs('2024-01-02'),
+            'iter_song_data': next(self.db.iter_song_data(fields=['note'])),
+        }
+
+    def test_reads_join_the_notes_collection(self):
+        for name, frame in self.reads().items():
+            with self.subTest(name):
+                self.assertTrue(len(frame))
+                notes = frame['note'].unique().tolist()
+                # Songs without an entry keep their embedded note
+                self.assertEqual(sorted(notes), ['embedded', 'side'])
+
+    def test_fields_are_kept(self):
+        self.assertEqual(list(self.db.get_song_data(fields=['rank', 'note']).columns), ['_id', 'rank', 'note'])
+        self.assertNotIn('note', self.db.get_song_data(fields=['rank']).columns)
+
+
+if __name__ == '__main__':
+    unittest.main()
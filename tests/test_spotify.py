@@ -0,0 +1,126 @@
+import threading
+import unittest
+from unittest import mock
+
+from td_spotify import SpotifyMetadataResolver
+
+
+class SpotifyError(Exception):
+    def __init__(self, http_status, headers=None):
+        """
+        Initialize an error shaped like spotipy.SpotifyException.
+        """
+        super().__init__(f'HTTP {http_status}')
+        self.http_status = http_status
+        self.headers = headers
+
+
+class FakeSpotify:
+    def __init__(self, tracks=None, failures=None):
+        """
+        Initialize a local stand-in for spotipy.Spotify.
+
+        :param tracks: dict, the track found per (title, author); other songs are not found
+        :param failures: list of Exception, raised by the next search calls, in order
+        """
+        self.tracks = tracks or {}
+        self.failures = list(failures or [])
+        self.searches = []
+        self.artist_batches = []
+        self._lock = threading.Lock()
+
+    def search(self, q, type):
+        with self._lock:
+            self.searches.append(q)
+            if self.failures:
+                raise self.failures.pop(0)
+        for (title, author), track_id in self.tracks.items():
+            if q == f'track:{title} artist:{author}':
+                return {'tracks': {'items': [{
+                    'album': {'images': [{'url': f'https://img/{track_id}'}]},
+                    'preview_url': f'https://preview/{track_id}',
+                    'artists': [{'id': f'artist-{author}'}],
+                }]}}
+        return {'tracks': {'items': []}}
+
+    def artists(self, ids):
+        with self._lock:
+            self.artist_batches.append(list(ids))
+        return {'artists': [{'id': artist_id, 'images': [{'url': f'https://artist/{artist_id}'}]} for artist_id in ids]}
+
+
+class SpotifyMetadataResolverTest(unittest.TestCase):
+    def resolver(self, client, **kwargs):
+        resolver = SpotifyMetadataResolver(client, cache_path=':memory:', **kwargs)
+        self.addCleanup(resolver._connection.close)
+        return resolver
+
+    def test_cache_miss_then_hit(self):
+        client = FakeSpotify({('Song', 'Artist'): 't1'})
+        resolver = self.resolver(client)
+        expected = {
+            'album_cover_url': 'https://img/t1',
+            'preview_url': 'https://preview/t1',
+            'artist_image_url': 'https://artist/artist-Artist',
+        }
+        self.assertEqual(resolver.resolve('Song', 'Artist'), expected)
+        self.assertEqual(resolver.resolve('Song', 'Artist'), expected)
+        self.assertEqual(len(client.searches), 1)
+
+    def test_not_found_is_cached(self):
+        client = FakeSpotify()
+        resolver = self.resolver(client)
+        self.assertIsNone(resolver.resolve('Missing', 'Artist'))
+        self.assertIsNone(resolver.resolve('Missing', 'Artist'))
+        self.assertEqual(len(client.searches), 1)
+
+    def test_ttl_expiry(self):
+        client = FakeSpotify({('Song', 'Artist'): 't1'})
+        resolver = self.resolver(client, ttl=60)
+        with mock.patch('td_spotify.time.time', return_value=1000.0):
+            resolver.resolve('Song', 'Artist')
+        with mock.patch('td_spotify.time.time', return_value=1059.0):
+            resolver.resolve('Song', 'Artist')
+        self.assertEqual(len(client.searches), 1)
+        with mock.patch('td_spotify.time.time', return_value=1061.0):
+            resolver.resolve('Song', 'Artist')
+        self.assertEqual(len(client.searches), 2)
+
+    def test_rate_limit_waits_for_retry_after(self):
+        client = FakeSpotify({('Song', 'Artist'): 't1'}, failures=[SpotifyError(429, {'Retry-After': '3'})])
+        resolver = self.resolver(client, backoff=0.01)
+        with mock.patch('td_spotify.time.sleep') as sleep:
+            metadata = resolver.resolve('Song', 'Artist')
+        self.assertEqual(metadata['preview_url'], 'https://preview/t1')
+        self.assertEqual(len(client.searches), 2)
+        (wait,), _ = sleep.call_args
+        self.assertAlmostEqual(wait, 3, delta=0.5)
+
+    def test_failed_lookup_is_not_cached(self):
+        client = FakeSpotify({('Song', 'Artist'): 't1'}, failures=[SpotifyError(404)])
+        resolver = self.resolver(client)
+        self.assertIsNone(resolver.resolve('Song', 'Artist'))
+        self.assertEqual(resolver.resolve('Song', 'Artist')['album_cover_url'], 'https://img/t1')
+        self.assertEqual(len(client.searches), 2)
+
+    def test_retries_are_bounded(self):
+        client = FakeSpotify(failures=[SpotifyError(503)] * 3)
+        resolver = self.resolver(client, max_retries=2, backoff=0.01)
+        with mock.patch('td_spotify.time.sleep'):
+            self.assertIsNone(resolver.resolve('Song', 'Artist'))
+        self.assertEqual(len(client.searches), 3)
+
+    def test_resolve_many_deduplicates(self):
+        client = FakeSpotify({('A', 'X'): 'a', ('B', 'X'): 'b', ('C', 'Y'): 'c'})
+        resolver = self.resolver(client)
+        songs = [('A', 'X'), ('B', 'X'), ('A', 'X'), ('C', 'Y'), ('B', 'X')]
+        results = resolver.resolve_many(songs)
+        self.assertEqual(set(results), {('A', 'X'), ('B', 'X'), ('C', 'Y')})
+        self.assertEqual(sorted(client.searches), sorted(f'track:{title} artist:{author}' for title, author in set(songs)))
+        # One artist lookup per distinct artist, in a single batch
+        self.assertEqual(len(client.artist_batches), 1)
+        self.assertEqual(sorted(client.artist_batches[0]), ['artist-X', 'artist-Y'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,151 @@
+import math
+import os
+import unittest
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+from bson import ObjectId
+
+from td_bench import benchmarks, generate_snapshots, load_dataset
+from td_dp_lib import DataLib, Song, SongSummary
+from td_storage import MemoryStorage, MongoStorage
+
+# A scratch MongoDB, e.g. mongodb://localhost:27017; the parity tests are skipped without one
+MONGODB_URI = os.getenv('DATALIB_TEST_MONGODB_URI')
+DATASET_SIZE = 1000
+
+# Benchmarks that write, report on the backend itself or time a build rather than read data
+NOT_COMPARED = {
+    'ensure_indexes', 'explain_report', 'cache_stats', 'metrics_stats', 'memory_replica', 'sync_cache',
+    'build_search_index', 'build_similarity_index', 'forecast_day', 'add_note_to_song', 'add_notes',
+    'upsert_data[replay]', 'rebuild_timeseries', 'rebuild_rank_movements', 'backfill_distributors', 'backfill_forecasts',
+}
+# Fields whose values differ between two loads of the same data
+VOLATILE_FIELDS = {'_id', 'id', 'song_id', 'unique_ids', 'computed_at'}
+
+
+def normalize(value):
+    """
+    Convert a DataLib result to plain, order-independent Python values without generated IDs.
+    """
+    if isinstance(value, pd.DataFrame):
+        frame = value.drop(columns=[column for column in value.columns if column in VOLATILE_FIELDS])
+        return normalize(frame.to_dict('records'))
+    if isinstance(value, pd.Series):
+        return normalize(value.tolist())
+    if isinstance(value, (Song, SongSummary)):
+        return normalize({slot: getattr(value, slot) for slot in type(value).__slots__ if not slot.startswith('_')})
+    if isinstance(value, dict):
+        return {str(key): normalize(item) for key, item in value.items() if key not in VOLATILE_FIELDS}
+    if isinstance(value, (list, tuple, set, np.ndarray)):
+        return sorted((normalize(item) for item in value), key=repr)
+    if isinstance(value, ObjectId):
+        return 'ObjectId'
+    if isinstance(value, pd.Timestamp):
+        value = value.to_pydatetime()
+    if isinstance(value, datetime):
+        # MongoDB keeps milliseconds
+        return value.replace(microsecond=value.microsecond // 1000 * 1000, tzinfo=None).isoformat()
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, float):
+        return None if math.isnan(value) else round(value, 6)
+    return value
+
+
+def load(storage):
+    """
+    Load the test dataset into a storage and return a DataLib on it with the benchmark calls.
+    """
+    db = DataLib(None, cache=None, storage=storage)
+    _, context = load_dataset(db, DATASET_SIZE)
+    return db, benchmarks(context)
+
+
+class MemoryStorageTest(unittest.TestCase):
+    def test_every_method_runs(self):
+        # The in-memory storage lacks aggregation pipelines and some operators; no DataLib method may rely on them
+        db, calls = load(MemoryStorage())
+        for name, call in calls.items():
+            with self.subTest(name):
+                call(db)
+
+    def test_songs_load_occurrences_lazily(self):
+        db = DataLib(None, cache=None, storage=MemoryStorage())
+        db.upsert_data(list(generate_snapshots(n_artists=5, n_songs=20, n_days=6, chart_size=20)))
+        author = db.get_unique_artists()[0]
+        songs = db.get_songs_by_author(author)
+        self.assertTrue(songs)
+        for song in songs:
+            self.assertIsNone(song._all_occurrences)
+            self.assertEqual(len(song.all_occurrences), len(db.get_song_occurrences(song.title, song.author)))
+        eager = db.get_songs_by_author(author, include_occurrences=True)
+        self.assertEqual([len(song._all_occurrences) for song in eager], [len(song.all_occurrences) for song in songs])
+
+
+@unittest.skipUnless(MONGODB_URI, 'set DATALIB_TEST_MONGODB_URI to compare against MongoDB')
+class StorageParityTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        from pymongo import MongoClient
+
+        cls.client = MongoClient(MONGODB_URI)
+        cls.mongo, cls.mongo_calls = load(MongoStorage(cls.client, 'music_trends_parity'))
+        cls.memory, cls.memory_calls = load(MemoryStorage())
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.mongo.storage.drop()
+        cls.client.close()
+
+    def test_reads_match(self):
+        for name in self.mongo_calls:
+            if name in NOT_COMPARED:
+                continue
+            with self.subTest(name):
+                expected = normalize(self.mongo_calls[name](self.mongo))
+                self.assertEqual(normalize(self.memory_calls[name](self.memory)), expected)
+
+
+class MemoryReplicaTest(unittest.TestCase):
+    def setUp(self):
+        documents = list(generate_snapshots(n_artists=10, n_songs=60, n_days=4, chart_size=30))
+        days = sorted({document['timestamp'] for document in documents})
+        self.first = [document for document in documents if document['timestamp'] < days[-1]]
+        self.last = [document for document in documents if document['timestamp'] == days[-1]]
+        self.source = DataLib(None, cache=None, storage=MemoryStorage())
+        self.source.upsert_data(self.first)
+        self.replica = self.source.memory_replica(cache=True)
+
+    def assertReplicated(self):
+        for name in self.source._collection_names():
+            source = self.source.storage.collection(name).find({})
+            replica = self.replica.storage.collection(name).find({})
+            self.assertEqual(normalize(list(replica)), normalize(list(source)), name)
+
+    def test_sync_copies_ingests(self):
+        before = len(self.replica.get_song_data())
+        self.source.upsert_data(self.last)
+        self.assertEqual(self.replica.sync_cache(), len(self.last))
+        self.assertReplicated()
+        self.assertEqual(len(self.replica.get_song_data()), before + len(self.last))
+
+    def test_sync_copies_deletions(self):
+        self.replica.get_song_data()
+        trends = self.source.storage.collection(self.source.collection_name)
+        song = trends.find_one({})
+        deleted = [document['_id'] for document in trends.find({'title': song['title'], 'author': song['author']})]
+        self.source.delete_songs(deleted)
+        self.replica.sync_cache()
+        self.assertReplicated()
+        self.assertEqual(len(self.replica.get_song_data()), len(self.first) - len(deleted))
+
+        self.source.delete_all_songs()
+        self.replica.sync_cache()
+        self.assertReplicated()
+        self.assertTrue(self.replica.get_song_data().empty)
+
+
+if __name__ == '__main__':
+    unittest.main()
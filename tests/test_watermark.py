@@ -0,0 +1,59 @@
+import unittest
+from datetime import datetime, timezone
+
+from td_bench import generate_snapshots
+from td_dp_lib import DELETION_RETENTION, PENDING_TIMEOUT, WATERMARK_ID, DataLib
+from td_storage import MemoryStorage
+
+
+class WatermarkTest(unittest.TestCase):
+    def setUp(self):
+        self.db = DataLib(None, cache=True, storage=MemoryStorage())
+        self.db.upsert_data(list(generate_snapshots(n_artists=5, n_songs=20, n_days=3, chart_size=20)))
+        self.meta = self.db.storage.collection(self.db.meta_collection_name)
+
+    def age(self, token, by):
+        """
+        Move the start time of an ingest in progress back in time.
+        """
+        started = self.meta.find_one({'_id': WATERMARK_ID})['pending'][token]
+        self.meta.find_one_and_update({'_id': WATERMARK_ID}, {'$set': {f'pending.{token}': started - by}})
+
+    def test_heartbeat_keeps_a_long_ingest_pending(self):
+        token, seq = self.db._begin_ingest()
+        self.age(token, PENDING_TIMEOUT * 2)
+        self.db._heartbeat_ingest(token)
+        self.db.upsert_data(list(generate_snapshots(n_artists=5, n_songs=20, n_days=1, chart_size=20, start=datetime(2024, 2, 1))))
+        # The long ingest still holds the watermark back
+        self.assertLess(self.db.get_watermark(), seq)
+        self.db._end_ingest(token)
+        self.assertGreater(self.db.get_watermark(), seq)
+
+    def test_silent_ingest_expires(self):
+        token, seq = self.db._begin_ingest()
+        self.age(token, PENDING_TIMEOUT * 2)
+        self.assertGreaterEqual(self.db.get_watermark(), seq)
+
+    def test_old_deletions_are_pruned(self):
+        reader = DataLib(None, cache=True, storage=self.db.storage)
+        reader.sync_cache()
+        reader.build_search_index()
+
+        trends = self.db.storage.collection(self.db.collection_name)
+        first, second = trends.find({}, limit=2)
+        self.db.delete_songs([first['_id']])
+        deletion = self.meta.find_one({'deletion_seq': {'$exists': True}})
+        self.meta.find_one_and_update(
+            {'_id': deletion['_id']}, {'$set': {'deleted_at': datetime.now(timezone.utc) - DELETION_RETENTION * 2}}
+        )
+        self.db.delete_songs([second['_id']])
+
+        self.assertIsNone(self.meta.find_one({'_id': deletion['_id']}))
+        self.assertEqual(self.meta.find_one({'_id': WATERMARK_ID})['deletions_pruned'], deletion['deletion_seq'])
+        # A reader that missed the pruned record rebuilds its indexes rather than patching them
+        reader.sync_cache()
+        self.assertIsNone(reader._search_index)
+
+
+if __name__ == '__main__':
+    unittest.main()